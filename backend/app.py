@@ -1,21 +1,46 @@
 from gevent import monkey
 monkey.patch_all()
 
+import atexit
 import os
 import uuid
 import json
-import bcrypt
 import random
 import string
 import firebase_admin
 
 
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response
 from dotenv import load_dotenv
 from flask_cors import CORS
 from flask_socketio import SocketIO, join_room, emit
 from firebase_admin import credentials, firestore
-from services.gemini_service import generate_from_prompt, calculate_casualties
+from services.gemini_service import (
+    generate_from_prompt, generate_random_meteor, calculate_casualties, casualty_cache, meteor_pool, gateway
+)
+from services.impact_physics import estimate_impact, InvalidMeteor
+from services.room_state import RoomRegistry, RoomReaper
+from services.socket_index import SocketIndex
+from services.scenario_dataset import load_dataset
+from services.metrics import REGISTRY as metrics_registry, instrument_firestore, timed
+from services.tracing import TRACER
+from services.message_queue import create_client_manager
+from services.wire_format import pack, SCHEMA as WIRE_SCHEMA
+from services.user_names import UsernameResolver, UsernameIndex, UsernameTaken
+from services.storage import STORAGE_BACKEND, create_stores
+from services.session_tokens import SessionTokens, SESSION_COOKIE, load_secret
+from services.password_hashing import PasswordHasher, HasherBusy
+from services.scenarios import (
+    get_scenario_params,
+    validate_card_choice,
+    generate_scenarios,
+    seeded_scenarios,
+    scenario_columns,
+    scenario_rows,
+    meteor_for_round,
+    SCENARIO_COUNT,
+    UINT64_MAX,
+)
 
 load_dotenv()
 
@@ -50,7 +75,9 @@ CORS(
     ],
     max_age=86400
 )
-socketio = SocketIO(app, cors_allowed_origins=ALLOWED_ORIGINS, async_mode="gevent")
+# SOCKETIO_MESSAGE_QUEUE lets several gunicorn workers share Socket.IO rooms
+client_manager = create_client_manager()
+socketio = SocketIO(app, cors_allowed_origins=ALLOWED_ORIGINS, async_mode="gevent", client_manager=client_manager)
 
 
 @app.before_request
@@ -64,48 +91,116 @@ def add_cors_vary_header(response):
     response.headers.add('Vary', 'Origin')
     return response
 
-# Initialize Firebase
+# Initialize storage: STORAGE_BACKEND=firestore (default), memory or sqlite
+# (services/storage.py). Firebase is only needed for firestore; when it
+# cannot be initialized the app keeps running on the memory backend.
 db = None
-try:
-    print("Initializing Firebase Admin SDK...")
+storage_backend = STORAGE_BACKEND
+if storage_backend == "firestore":
+    try:
+        print("Initializing Firebase Admin SDK...")
     
-    # Try to load from environment variable first (for Railway)
-    firebase_creds_json = os.getenv("FIREBASE_CREDENTIALS")
-    if firebase_creds_json:
-        # Parse JSON directly from env variable
-        cred_dict = json.loads(firebase_creds_json)
-        cred = credentials.Certificate(cred_dict)
-        print("Using Firebase credentials from environment variable")
-    else:
-        # Fallback to file (for local development)
-        cred = credentials.Certificate("firebase-adminsdk.json")
-        print("Using Firebase credentials from file")
+        # Try to load from environment variable first (for Railway)
+        firebase_creds_json = os.getenv("FIREBASE_CREDENTIALS")
+        if firebase_creds_json:
+            # Parse JSON directly from env variable
+            cred_dict = json.loads(firebase_creds_json)
+            cred = credentials.Certificate(cred_dict)
+            print("Using Firebase credentials from environment variable")
+        else:
+            # Fallback to file (for local development)
+            cred = credentials.Certificate("firebase-adminsdk.json")
+            print("Using Firebase credentials from file")
     
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    print("✅ Firebase initialized successfully")
-except FileNotFoundError:
-    print("⚠️  firebase-adminsdk.json not found and FIREBASE_CREDENTIALS env var not set")
-    print("⚠️  Running without Firebase - auth/database features disabled")
-except json.JSONDecodeError as e:
-    print(f"⚠️  Invalid JSON in FIREBASE_CREDENTIALS: {e}")
-    print("⚠️  Running without Firebase - auth/database features disabled")
-except Exception as e:
-    print(f"⚠️  Firebase initialization error: {e}")
-    print("⚠️  Running without Firebase - auth/database features disabled")
+        firebase_admin.initialize_app(cred)
+        db = instrument_firestore(firestore.client())
+        print("✅ Firebase initialized successfully")
+    except FileNotFoundError:
+        print("⚠️  firebase-adminsdk.json not found and FIREBASE_CREDENTIALS env var not set")
+        storage_backend = "memory"
+    except json.JSONDecodeError as e:
+        print(f"⚠️  Invalid JSON in FIREBASE_CREDENTIALS: {e}")
+        storage_backend = "memory"
+    except Exception as e:
+        print(f"⚠️  Firebase initialization error: {e}")
+        storage_backend = "memory"
+
+if storage_backend != STORAGE_BACKEND:
+    print("⚠️  Running without Firebase - rooms and users are kept in memory and lost on restart")
+if storage_backend == "memory" and client_manager is not None:
+    print("⚠️  The memory storage backend is not shared between workers, use sqlite or firestore")
+room_store, user_store = create_stores(storage_backend, db=db)
+print(f"Using {storage_backend} storage")
+
+if client_manager is not None:
+    rooms = RoomRegistry(room_store, publish=client_manager.publish_room_changed)
+    client_manager.on_room_changed = rooms.invalidate
+else:
+    rooms = RoomRegistry(room_store)
+# write what is still queued when the worker stops (gunicorn.conf.py calls
+# rooms.close() from worker_exit as well)
+atexit.register(rooms.close)
+user_names = UsernameResolver(user_store)
+usernames = UsernameIndex(user_store)
+sessions = SessionTokens(load_secret())
+passwords = PasswordHasher()
+msgpack_clients = set()
+sockets = SocketIndex()
+scenario_dataset = load_dataset()
+reaper = RoomReaper(rooms, on_reaped=lambda room_id: socketio.emit("room_closed", {
+    "message": "Room expired",
+    "roomId": room_id
+}, room=room_id))
+reaper.start()
+# pre-generates AI meteors for /api/random-meteor; a no-op without a Gemini model
+meteor_pool.start()
+metrics_registry.worker = os.getpid()
+metrics_registry.collect_stats("casualty_cache", casualty_cache.stats)
+metrics_registry.collect_stats("meteor_pool", meteor_pool.stats)
+metrics_registry.collect_stats("llm_gateway", gateway.stats)
+metrics_registry.collect_stats("password_hasher", passwords.stats)
+metrics_registry.collect_stats("sockets", sockets.stats)
+metrics_registry.collect_stats("room_reaper", reaper.stats)
+metrics_registry.collect_stats("rooms", rooms.stats)
+metrics_registry.collect_stats("tracing", TRACER.stats)
+
+MAX_GENERATED_METEORS = 1000
+# "physics" answers from the local estimator, "ai" asks Gemini first
+CASUALTY_ESTIMATOR = os.getenv("CASUALTY_ESTIMATOR", "physics")
 
 data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'meteors.json')
 
 # auth endpoints
 
+# The session cookie is a signed token with the user id and username
+# (services/session_tokens.py), so checking it needs no Firestore read.
+
+def current_session():
+    return sessions.verify(request.cookies.get(SESSION_COOKIE))
+
+def current_user_id():
+    claims = current_session()
+    return claims["uid"] if claims else None
+
+def set_session_cookie(resp, user_id, username):
+    user_names.put(user_id, username)
+    resp.set_cookie(SESSION_COOKIE, sessions.issue(user_id, username), httponly=True, max_age=sessions.ttl)
+    return resp
+
+def server_busy(e):
+    resp = make_response(jsonify({"error": str(e)}), 503)
+    resp.headers["Retry-After"] = "1"
+    return resp
+
 @app.route('/api/test/login', methods=['POST'])
+@timed("http", "test_login")
 def test_login():
     test_user_id = "test-user-123"
     resp = make_response(jsonify({"status": "success", "userId": test_user_id}))
-    resp.set_cookie("userId", test_user_id, httponly=True)
-    return resp
+    return set_session_cookie(resp, test_user_id, "test-user")
 
 @app.route('/api/meteors', methods=['GET'])
+@timed("http", "get_meteors")
 def get_meteors():
     try:
         with open(data_path, 'r') as f:
@@ -114,6 +209,7 @@ def get_meteors():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/prompt', methods=['GET'])
+@timed("http", "prompt_handler")
 def prompt_handler():
     prompt = request.args.get('prompt')
     if not prompt:
@@ -129,7 +225,19 @@ def prompt_handler():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/random-meteor', methods=['GET'])
+@timed("http", "random_meteor")
+def random_meteor():
+    # an AI meteor from meteor_pool, a synthetic one while the pool is empty;
+    # with the labels /api/prompt uses (STONY_IRON -> Stony-Iron)
+    meteor = generate_random_meteor()
+    return jsonify({
+        **meteor,
+        **{key: str(meteor[key]).replace("_", "-").title() for key in ("type", "weather", "material")}
+    })
+
 @app.route('/api/calculate-impact', methods=['POST'])
+@timed("http", "calculate_meteor_impact")
 def calculate_meteor_impact():
     try:
         meteor_data = request.json
@@ -145,11 +253,24 @@ def calculate_meteor_impact():
             return jsonify({
                 "error": f"Missing required fields: {', '.join(missing_fields)}"
             }), 400
-        casualties = calculate_casualties(meteor_data)
+
+        impact = estimate_impact(meteor_data)
+        casualties = impact["casualties"]
+        estimator = "physics"
+
+        # Gemini is an optional refinement on top of the local estimate
+        if meteor_data.get("refine") or CASUALTY_ESTIMATOR == "ai":
+            try:
+                casualties = calculate_casualties(meteor_data)
+                estimator = "ai"
+            except Exception as e:
+                print(f"AI casualty refinement failed, using physics estimate: {str(e)}")
 
         return jsonify({
             "success": True,
             "casualties": casualties,
+            "estimator": estimator,
+            "impact": impact,
             "meteor": meteor_data,
             "impact_location": {
                 "latitude": meteor_data['latitude'],
@@ -157,18 +278,75 @@ def calculate_meteor_impact():
             }
         })
 
+    except InvalidMeteor as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({
             "success": False,
-            "error": f"AI calculation failed: {str(e)}"
+            "error": f"Impact calculation failed: {str(e)}"
         }), 500
 
+@app.route('/api/calculate-impact/cache', methods=['GET'])
+@timed("http", "casualty_cache_stats")
+def casualty_cache_stats():
+    return jsonify(casualty_cache.stats())
+
+@app.route('/api/meteor-pool', methods=['GET'])
+@timed("http", "meteor_pool_stats")
+def meteor_pool_stats():
+    return jsonify(meteor_pool.stats())
+
+def query_int(name, default, low, high):
+    # int() rather than str.isdigit(), which also passes digits like "²"
+    # that int() refuses
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or not low <= number <= high:
+        raise ValueError(f"{name} must be an integer between {low} and {high}")
+    return number
+
 @app.route('/api/generate-meteor', methods=['GET'])
+@timed("http", "generate_meteor")
 def generate_meteor():
-    return jsonify(get_scenario_params())
+    count = request.args.get('count')
+    seed = request.args.get('seed')
+    if count is None and seed is None:
+        return jsonify(get_scenario_params())
 
+    try:
+        count = query_int('count', 1, 1, MAX_GENERATED_METEORS)
+        if seed is not None:
+            seed = query_int('seed', 0, 0, UINT64_MAX)
+            start = query_int('start', 0, 0, UINT64_MAX - count + 1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if seed is None:
+        # canonical rows of data/scenarios.csv instead of random values in the bands
+        if request.args.get('canonical') == '1' and scenario_dataset is not None:
+            return jsonify(scenario_columns(scenario_dataset.sample(count)))
+        return jsonify(scenario_columns(generate_scenarios(count)))
+
+    # replay part of a seeded game: rounds start .. start + count - 1
+    return jsonify(scenario_columns(seeded_scenarios(seed, start, count)))
+
+
+@app.route('/api/scenarios/<int:scenario_id>', methods=['GET'])
+@timed("http", "get_canonical_scenarios")
+def get_canonical_scenarios(scenario_id):
+    if scenario_dataset is None:
+        return jsonify({"error": "Scenario dataset not available"}), 503
+    if not 1 <= scenario_id <= SCENARIO_COUNT:
+        return jsonify({"error": f"scenario must be between 1 and {SCENARIO_COUNT}"}), 404
+    return jsonify(scenario_rows(scenario_dataset.scenario(scenario_id)))
 
 @app.route('/api/validate-card', methods=['POST'])
+@timed("http", "validate_card")
 def validate_card():
     try:
         data = request.json
@@ -211,9 +389,10 @@ def validate_card():
         }), 500
 
 @app.route('/api/room-admin/<room_code>', methods=['GET'])
+@timed("http", "check_room_admin")
 def check_room_admin(room_code):
     try:
-        user_id = request.cookies.get("userId")
+        user_id = current_user_id()
         if not user_id:
             return jsonify({"error": "Not authenticated"}), 401
 
@@ -221,18 +400,12 @@ def check_room_admin(room_code):
             return jsonify({"error": "room_code is required"}), 400
 
         #sistema poiska komnaty po kodu
-        rooms_ref = db.collection("rooms")
-        query = rooms_ref.where("code", "==", room_code).stream()
+        room = rooms.find_by_code(room_code)
 
-        room_doc = None
-        for doc in query:
-            room_doc = doc
-            break
-
-        if not room_doc:
+        if not room:
             return jsonify({"error": "Room not found"}), 404
 
-        room_data = room_doc.to_dict()
+        room_data = room.data
         creator_id = room_data.get("creator")
         users = room_data.get("users", [])
         game_state = room_data.get("game_state", {})
@@ -247,8 +420,9 @@ def check_room_admin(room_code):
 
         # sobiraem info o userah
         users_info = []
+        usernames = user_names.get_many(list(user_cards))
         for uid, card in user_cards.items():
-            username = get_user_name(uid)
+            username = usernames.get(uid)
             users_info.append({
                 "username": username or "Unknown",
                 "id": uid,
@@ -268,7 +442,7 @@ def check_room_admin(room_code):
             "status": room_data.get("status", "unknown"),
             "game_started": game_state.get("game_started", False),
             "users_info": users_info,
-            "current_meteor": game_state.get("current_meteor") if game_state.get("game_started") else None
+            "current_meteor": current_meteor(game_state) if game_state.get("game_started") else None
         })
 
     except Exception as e:
@@ -278,22 +452,24 @@ def check_room_admin(room_code):
         }), 500
 
 @app.route('/api/auth', methods=['GET'])
+@timed("http", "is_user_logged_in")
 def is_user_logged_in():
-    user_id = request.cookies.get("userId")
-    if not user_id:
+    claims = current_session()
+    if not claims:
         return jsonify({"error": "Not logged in"}), 401
 
-    user_ref = db.collection("users").document(user_id)
-    doc = user_ref.get()
-    if not doc.exists:
-        return jsonify({"error": "User not found"}), 401
-
-    user_data = doc.to_dict()
-    username = user_data.get("username")
+    return jsonify({"id": claims["uid"], "username": claims["name"]}), 200
 
-    return jsonify({"id": user_id, "username": username}), 200
+@app.route('/api/logout', methods=['POST'])
+@timed("http", "logout_user")
+def logout_user():
+    sessions.revoke(request.cookies.get(SESSION_COOKIE))
+    resp = make_response(jsonify({"status": "success"}))
+    resp.delete_cookie(SESSION_COOKIE)
+    return resp
 
 @app.route('/api/signup', methods=['POST'])
+@timed("http", "register_user")
 def register_user():
     print(request.json)
     try:
@@ -304,28 +480,30 @@ def register_user():
         if not username or not password:
             return jsonify({"error": "bad request"}), 400
 
-        users_ref = db.collection("users")
-        query = users_ref.where("username", "==", username).stream()
-        if any(query):
+        # checked before hashing so taken names do not cost a bcrypt round;
+        # register() is what actually guarantees uniqueness
+        if usernames.lookup(username) is not None:
             return jsonify({"error": "Username already exists"}), 400
 
-        hashed_pw = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        hashed_pw = passwords.hash(password)
 
         user_id = str(uuid.uuid4())
 
-        users_ref.document(user_id).set({
+        usernames.register(username, user_id, {
             "username": username,
-            "password": hashed_pw.decode(),
-            "createdAt": firestore.SERVER_TIMESTAMP
+            "password": hashed_pw
         })
-
         resp = make_response(jsonify({"status": "success", "userId": user_id}))
-        resp.set_cookie("userId", user_id, httponly=True)
-        return resp
+        return set_session_cookie(resp, user_id, username)
+    except UsernameTaken:
+        return jsonify({"error": "Username already exists"}), 400
+    except HasherBusy as e:
+        return server_busy(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/login', methods=['POST'])
+@timed("http", "login_user")
 def login_user():
     try:
         data = request.json
@@ -335,266 +513,243 @@ def login_user():
         if not username or not password:
             return jsonify({"error": "Username and password are required"}), 400
 
-        users_ref = db.collection("users")
-        query = users_ref.where("username", "==", username).stream()
-
-        user_doc = None
-        for doc in query:
-            user_doc = doc
-            break
+        user_id = usernames.lookup(username)
+        user_data = user_store.get_user(user_id) if user_id else None
 
-        if not user_doc:
+        if not user_data:
             return jsonify({"error": "User not found"}), 404
 
-        user_data = user_doc.to_dict()
-        hashed_pw = user_data.get("password").encode("utf-8")
-
-        if bcrypt.checkpw(password.encode("utf-8"), hashed_pw):
-            resp = make_response(jsonify({"status": "success", "userId": user_doc.id}))
-            resp.set_cookie("userId", user_doc.id, httponly=True)
-            return resp
+        if passwords.check(password, user_data.get("password")):
+            resp = make_response(jsonify({"status": "success", "userId": user_id}))
+            return set_session_cookie(resp, user_id, user_data.get("username"))
         else:
             return jsonify({"error": "Invalid password"}), 401
 
+    except HasherBusy as e:
+        return server_busy(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/rooms/stats', methods=['GET'])
+@timed("http", "room_stats")
+def room_stats():
+    return jsonify({**rooms.stats(), "sockets": sockets.stats(), "reaper": reaper.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # not timed itself, scrapes would show up in every histogram
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/auth/stats', methods=['GET'])
+@timed("http", "password_hasher_stats")
+def password_hasher_stats():
+    return jsonify(passwords.stats())
+
 def generate_room_code(length=4):
     return ''.join(random.choices(string.digits, k=length))
 
-def generate_random_meteor():
-    return get_scenario_params()
+def start_meteor_sequence(game_state):
+    # only the seed and round index are stored, meteors are derived from them
+    game_state["seed"] = random.getrandbits(63)
+    game_state["round"] = 0
+    game_state.pop("current_meteor", None)
 
-def get_scenario_params():
-    speed_1 = 10
-    speed_2 = 30
-    speed_3 = 50
-    speed_4 = 70
-    
-    distance_1 = 20
-    distance_2 = 1000
-    distance_3 = 4000
-    distance_4 = 100000000
-    distance_5 = 300000000
-    
-    weight_1 = 1
-    weight_2 = 20000
-    weight_3 = 40000
-    weight_4 = 60000
-    
-    angle_1 = 1
-    angle_2 = 30
-    angle_3 = 60
-    angle_4 = 90
-    
-    generated_scenario = random.randint(1, 360)
-    
-    block = ((generated_scenario - 1) // 120) + 1
-    if block == 1:
-        speed = random.randint(speed_1, speed_2)
-    elif block == 2:
-        speed = random.randint(speed_2 + 1, speed_3)
-    else:
-        speed = random.randint(speed_3 + 1, speed_4)
-    
-    local120 = ((generated_scenario - 1) % 120) + 1
-    if 1 <= local120 <= 24:
-        composition = "ICE"
-    elif 25 <= local120 <= 48:
-        composition = "ICE_STONE"
-    elif 49 <= local120 <= 72:
-        composition = "STONE"
-    elif 73 <= local120 <= 96:
-        composition = "STONE_IRON"
-    else:
-        composition = "IRON"
-    
-    local24 = ((generated_scenario - 1) % 24) + 1
-    if 1 <= local24 <= 9:
-        distance = random.randint(distance_1, distance_2)
-    elif 10 <= local24 <= 18:
-        distance = random.randint(distance_2 + 1, distance_3)
-    else:
-        distance = random.randint(distance_4, distance_5)
-    
-    group1_ranges = [
-        (1,3), (10,12), (25,27), (34,36), (49,51), (58,60),
-        (73,75), (82,84), (97,99), (106,108), (121,123), (130,132),
-        (145,147), (154,156), (169,171), (178,180), (193,195), (202,204),
-        (217,219), (226,228), (241,243), (250,252), (265,267), (274,276),
-        (289,291), (298,300), (313,315), (322,324), (337,339), (346,348)
-    ]
-    group2_ranges = [
-        (4,6), (13,15), (19,21), (28,30), (37,39), (43,45),
-        (52,54), (61,63), (67,69), (76,78), (85,87), (91,93),
-        (100,102), (109,111), (115,117), (124,126), (133,135), (139,141),
-        (148,150), (157,159), (163,165), (172,174), (181,183), (187,189),
-        (196,198), (205,207), (211,213), (220,222), (229,231), (235,237),
-        (244,246), (253,255), (259,261), (268,270), (277,279), (283,285),
-        (292,294), (301,303), (307,309), (316,318), (325,327), (331,333),
-        (340,342), (349,351), (355,357)
-    ]
-    group3_ranges = [
-        (7,9), (16,18), (22,24), (31,33), (40,42), (46,48),
-        (55,57), (64,66), (70,72), (79,81), (88,90), (94,96),
-        (103,105), (112,114), (118,120), (127,129), (136,138), (142,144),
-        (151,153), (160,162), (166,168), (175,177), (184,186), (190,192),
-        (199,201), (208,210), (214,216), (223,225), (232,234), (238,240),
-        (247,249), (256,258), (262,264), (271,273), (280,282), (286,288),
-        (295,297), (304,306), (310,312), (319,321), (328,330), (334,336),
-        (343,345), (352,354), (358,360)
-    ]
-    
-    def in_ranges(val, ranges_list):
-        for start, end in ranges_list:
-            if start <= val <= end:
-                return True
-        return False
-    
-    if in_ranges(generated_scenario, group1_ranges):
-        weight = random.randint(weight_1, weight_2)
-    elif in_ranges(generated_scenario, group2_ranges):
-        weight = random.randint(weight_2 + 1, weight_3)
-    else:
-        weight = random.randint(weight_3 + 1, weight_4)
-    
-    local3 = generated_scenario % 3
-    if local3 == 1:
-        angle = random.randint(angle_1, angle_2)
-    elif local3 == 2:
-        angle = random.randint(angle_2 + 1, angle_3)
+def current_meteor(game_state):
+    if game_state.get("seed") is None:
+        return game_state.get("current_meteor")
+    return meteor_for_round(game_state["seed"], game_state.get("round", 0))
+
+def get_user_name(user_id):
+    return user_names.get(user_id)
+
+def get_users_list(user_cards):
+    usernames = user_names.get_many(list(user_cards))
+    return [{
+        "username": usernames.get(uid) or "Unknown",
+        "id": uid,
+        "card": card
+    } for uid, card in user_cards.items()]
+
+# Room state protocol: a client gets a full room_snapshot when it joins (or
+# asks for one with room_resync) and small room_delta events afterwards.
+# Every change bumps the room version by one, so a client that sees a version
+# jump knows it missed a delta and resyncs.
+
+# Changes to users and user_cards go through rooms.mutate(), which only
+# writes while the room still has the version it read, so joins and leaves
+# handled by different workers at the same time cannot undo each other.
+
+def next_version(room):
+    rooms.mutate(room, lambda current: {})
+    return room.get("version", 0)
+
+def remove_room_user(room, user_id):
+    # True if this call took user_id out of the room
+    def remove(current):
+        users = current.get("users", [])
+        if user_id not in users:
+            return None
+        return {"users": [uid for uid in users if uid != user_id]}
+    return rooms.mutate(room, remove) is not None
+
+def game_start_updates(room):
+    # starts the game once four players hold cards
+    game_state = room.get("game_state", {})
+    if len(game_state.get("user_cards", {})) != 4 or game_state.get("game_started", False):
+        return None
+    game_state = dict(game_state)
+    start_meteor_sequence(game_state)
+    game_state["game_started"] = True
+    return {"status": "playing", "game_state": game_state}
+
+def room_snapshot(room):
+    game_state = room.get("game_state", {})
+    user_cards = game_state.get("user_cards", {})
+    if user_cards:
+        users = get_users_list(user_cards)
     else:
-        angle = random.randint(angle_3 + 1, angle_4)
-    
+        usernames = user_names.get_many(room.get("users", []))
+        users = [{"username": usernames.get(uid) or "Unknown", "id": uid} for uid in room.get("users", [])]
+
     return {
-        "speed": speed,
-        "composition": composition,
-        "distance": distance,
-        "weight": weight,
-        "angle": angle,
-        "generated_scenario": generated_scenario
+        "roomId": room.id,
+        "code": room.get("code"),
+        "version": room.get("version", 0),
+        "status": room.get("status"),
+        "creator": room.get("creator"),
+        "users": users,
+        "hp": game_state.get("hp"),
+        "round": game_state.get("round"),
+        "meteor": current_meteor(game_state) if game_state.get("game_started") else None
     }
 
-def validate_card_choice(generated_scenario, chosen_card):
-    ignore_scenarios = {
-        1, 2, 3, 4, 5, 6, 10, 11, 12, 13, 14, 15, 19, 20, 21, 25, 26, 27, 28, 29, 30, 34, 35, 36, 37, 38, 39, 43, 44, 45, 49, 50, 51, 52, 58, 59, 60, 61, 73, 74, 75, 76, 82, 83, 84, 85, 97, 98, 99, 100, 106, 107, 108, 109, 121, 122, 123, 124, 130, 131, 132, 133, 145, 146, 147, 148, 154, 155, 156, 157, 169, 170, 171, 172, 178, 179, 180, 181, 193, 194, 195, 196, 202, 203, 204, 205
-    }
-    evacuation_scenarios = {
-        22, 23, 24, 46, 47, 48, 67, 68, 69, 70, 71, 72, 91, 92, 93, 94, 95, 96, 115, 116, 117, 118, 119, 120, 139, 140, 141, 142, 143, 144, 163, 164, 165, 166, 167, 168, 187, 188, 189, 190, 191, 192, 211, 212, 213, 214, 215, 216, 235, 236, 237, 238, 239, 240, 259, 260, 261, 262, 263, 264, 283, 284, 285, 286, 287, 288, 307, 308, 309, 310, 311, 312, 331, 332, 333, 334, 335, 336, 355, 356, 357, 358, 359, 360
-    }
-    bunker_scenarios = {
-        7, 8, 9, 16, 17, 18, 31, 32, 33, 40, 41, 42, 53, 54, 55, 56, 57, 62, 63, 64, 65, 66, 77, 78, 86, 87, 88, 89, 90, 101, 102, 110, 111, 112, 113, 114, 136, 137, 138, 160, 161, 162, 184, 185, 186, 208, 209, 210, 220, 221, 229, 230, 232, 233, 234, 244, 245, 253, 254, 256, 257, 258, 268, 269, 277, 278, 280, 281, 282, 292, 293, 301, 302, 304, 305, 306, 316, 317, 325, 326, 328, 329, 330, 340, 341, 349, 350, 352, 353, 354
-    }
-    rocket_scenarios = {
-        79, 80, 81, 103, 104, 105, 125, 126, 127, 128, 129, 134, 135, 149, 150, 151, 152, 153, 158, 159, 173, 174, 175, 176, 177, 182, 183, 197, 198, 199, 200, 201, 206, 207, 217, 218, 219, 222, 223, 224, 225, 226, 227, 228, 231, 241, 242, 243, 246, 247, 248, 249, 250, 251, 252, 255, 265, 266, 267, 270, 271, 272, 273, 274, 275, 276, 279, 289, 290, 291, 294, 295, 296, 297, 298, 299, 300, 303, 313, 314, 315, 318, 319, 320, 321, 322, 323, 324, 327, 337, 338, 339, 342, 343, 344, 345, 346, 347, 348, 351
-    }
-    
-    if chosen_card == "IGNORE":
-        return generated_scenario in ignore_scenarios
-    elif chosen_card == "EVACUATION":
-        return generated_scenario in evacuation_scenarios
-    elif chosen_card == "BUNKER":
-        return generated_scenario in bunker_scenarios
-    elif chosen_card == "ROCKET":
-        return generated_scenario in rocket_scenarios
-    else:
-        return False
+def emit_room_delta(room, change_type, **changes):
+    send_state("room_delta", {
+        "version": room.get("version", 0),
+        "type": change_type,
+        **changes
+    }, room.id)
+
+# Clients that connect with ?encoding=msgpack (or auth {"encoding": "msgpack"})
+# get room state events as MessagePack bytes, see services/wire_format.py.
+# Every client joins the game room itself plus "<room>:json" or
+# "<room>:msgpack"; state events go to the two encoding rooms, other notices
+# to the plain room.
+
+def client_encoding():
+    return "msgpack" if request.sid in msgpack_clients else "json"
+
+def join_socket_room(room_id, user_id):
+    join_room(room_id)
+    join_room(f"{room_id}:{client_encoding()}")
+    sockets.join(request.sid, user_id, room_id)
+
+def has_local_members(room):
+    return bool(socketio.server.manager.rooms.get("/", {}).get(room))
+
+def send_state(event, payload, room_id=None):
+    if room_id is None:
+        emit(event, pack(payload) if client_encoding() == "msgpack" else payload, to=request.sid)
+        return
 
-def get_user_name(user_id):
-    doc = db.collection("users").document(user_id).get()
-    if doc.exists:
-        username = doc.to_dict().get("username")
-        return username
-    else:
-        return None
+    socketio.emit(event, payload, room=f"{room_id}:json")
+    # other workers may hold msgpack clients even if this one does not
+    if client_manager is not None or has_local_members(f"{room_id}:msgpack"):
+        socketio.emit(event, pack(payload), room=f"{room_id}:msgpack")
 
 # socket handlers
 
 @socketio.on('connect')
-def handle_connect():
-    emit("socket_connected", {"message": "Connected to socket"})
+@timed("socket", "connect")
+def handle_connect(auth=None):
+    encoding = (auth or {}).get("encoding") if isinstance(auth, dict) else None
+    if (encoding or request.args.get("encoding")) == "msgpack":
+        msgpack_clients.add(request.sid)
+        emit("socket_connected", {"message": "Connected to socket", **WIRE_SCHEMA})
+    else:
+        emit("socket_connected", {"message": "Connected to socket"})
 
 @socketio.on('disconnect')
+@timed("socket", "disconnect")
 def handle_disconnect():
-    user_id = request.cookies.get('userId')
+    msgpack_clients.discard(request.sid)
+    user_id, room_ids = sockets.disconnect(request.sid)
     if not user_id:
         return
 
     try:
-        rooms_ref = db.collection("rooms")
-        query = rooms_ref.where("users", "array_contains", user_id).where("status", "==", "waiting").stream()
-
-        for room_doc in query:
-            room_data = room_doc.to_dict()
-            room_id = room_doc.id
-            current_users = room_data.get("users", [])
-
-            if user_id in current_users:
-                current_users.remove(user_id)
+        for room_id in room_ids:
+            room = rooms.get(room_id)
+            if room is None or room.get("status") != "waiting" or sockets.user_in_room(user_id, room_id):
+                continue
+            if remove_room_user(room, user_id):
+                current_users = room.get("users", [])
                 username = get_user_name(user_id)
                 if current_users:
-                    db.collection("rooms").document(room_id).update({"users": current_users})
-                    socketio.emit("room_changed", {
+                    send_state("room_changed", {
                         "userId": user_id,
                         "username": username or "Unknown",
                         "type": "USER_REMOVED",
-                        "total_users": len(current_users)
-                    }, room=room_id)
+                        "total_users": len(current_users),
+                        "version": room.get("version", 0)
+                    }, room_id)
                 else:
-                    db.collection("rooms").document(room_id).delete()
+                    rooms.delete(room_id)
     except Exception as e:
         print(f"Error handling disconnect for user {user_id}: {str(e)}")
 
 @socketio.on('join_room')
+@timed("socket", "join_room")
 def handle_join_lobby(data=None):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
 
     if not user_id:
         emit("error", {"message": "Not authenticated"}, to=request.sid)
         return
 
-    room_code = generate_room_code()
     room_id = str(uuid.uuid4())
 
     try:
-        db.collection("rooms").document(room_id).set({
-            "code": room_code,
+        room = rooms.create(room_id, {
             "users": [user_id],
             "creator": user_id, #dobavil admina
             "status": "waiting",
-            "createdAt": firestore.SERVER_TIMESTAMP,
+            "version": 0,
             "game_state": {
                 "hp": 3,
-                "current_meteor": None,
                 "user_cards": {},
                 "game_started": False
             }
-        })
+        }, new_code=generate_room_code)
+        room_code = room.get("code")
 
-        join_room(room_id)
+        join_socket_room(room_id, user_id)
         username = get_user_name(user_id)
 
         if not username:
             emit("error", {"message": "Not user name"}, to=request.sid)
             return
 
-        emit("room_created", {
+        send_state("room_created", {
             "roomId": room_id,
-            "code": room_code
-        }, to=request.sid)
+            "code": room_code,
+            "version": room.get("version")
+        })
 
-        emit("room_changed", {
+        send_state("room_changed", {
             "userId": user_id,
             "username": username,
-            "type": "USER_ADDED"
-        }, room=room_id)
+            "type": "USER_ADDED",
+            "version": next_version(room)
+        }, room_id)
 
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('join_existing_room')
+@timed("socket", "join_existing_room")
 def handle_join_existing_room(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_code = data.get('code')
 
     if not user_id:
@@ -606,61 +761,64 @@ def handle_join_existing_room(data):
         return
 
     try:
-        rooms_ref = db.collection("rooms")
-        query = rooms_ref.where("code", "==", room_code).where("status", "==", "waiting").stream()
+        room = rooms.find_by_code(room_code, statuses=("waiting",))
 
-        room_doc = None
-        for doc in query:
-            room_data = doc.to_dict()
-            if len(room_data["users"]) < 4:
-                room_doc = doc
-                break
-
-        if not room_doc:
+        if not room or len(room.get("users", [])) >= 4:
             emit("error", {"message": "Room not found or full"}, to=request.sid)
             return
 
-        room_data = room_doc.to_dict()
-        room_id = room_doc.id
+        room_id = room.id
 
-        if user_id not in room_data["users"]:
-            room_data["users"].append(user_id)
-            db.collection("rooms").document(room_id).update({"users": room_data["users"]})
+        def add_user(current):
+            users = current.get("users", [])
+            if user_id in users or current.get("status") != "waiting" or len(users) >= 4:
+                return None
+            return {"users": users + [user_id]}
 
-        join_room(room_id)
-        username = get_user_name(user_id)
+        rooms.mutate(room, add_user)
+        room_data = room.data
+        if user_id not in room_data.get("users", []):
+            # filled up or started on another worker meanwhile
+            emit("error", {"message": "Room not found or full"}, to=request.sid)
+            return
+
+        join_socket_room(room_id, user_id)
+        usernames = user_names.get_many(room_data["users"])
+        username = usernames.get(user_id)
 
         if not username:
             emit("error", {"message": "Not user name"}, to=request.sid)
             return
 
         users = []
-        for user_id in room_data["users"]:
-            db.collection("users").document(user_id)
+        for uid in room_data["users"]:
             users.append({
-                "id": user_id,
-                "username": get_user_name(user_id) or "Unknown"
+                "id": uid,
+                "username": usernames.get(uid) or "Unknown"
             })
 
-        emit("room_joined", {
+        send_state("room_joined", {
             "roomId": room_id,
             "code": room_code,
-            "users": users
-        }, to=request.sid)
+            "users": users,
+            "version": room.get("version", 0)
+        })
 
-        emit("room_changed", {
+        send_state("room_changed", {
             "userId": user_id,
             "username": username,
             "type": "USER_ADDED",
-            "total_users": len(room_data["users"])
-        }, room=room_id)
+            "total_users": len(room_data["users"]),
+            "version": room.get("version", 0)
+        }, room_id)
 
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('start_game')
+@timed("socket", "start_game")
 def handle_start_game(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_id = data.get('roomId')
 
     if not user_id:
@@ -672,26 +830,28 @@ def handle_start_game(data):
         return
 
     try:
-        room_doc = db.collection("rooms").document(room_id).get()
-        if not room_doc.exists:
+        room = rooms.get(room_id)
+        if not room:
             emit("error", {"message": "Room not found"}, to=request.sid)
             return
 
-        room_data = room_doc.to_dict()
+        room_data = room.data
 
         if len(room_data["users"]) != 4:
             emit("error", {"message": f"Need 4 players to start game. Current: {len(room_data['users'])}"}, to=request.sid)
             return
 
-        db.collection("rooms").document(room_id).update({"status": "game_waiting"})
+        room_data["status"] = "game_waiting"
+        rooms.save(room, "status")
         emit("game_redirect", True, room=room_id)
 
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('admin_start_game')
+@timed("socket", "admin_start_game")
 def handle_admin_start_game(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_code = data.get('room_code')
 
     if not user_id:
@@ -704,20 +864,14 @@ def handle_admin_start_game(data):
 
     try:
         #sistema poiska komnaty po kodu
-        rooms_ref = db.collection("rooms")
-        query = rooms_ref.where("code", "==", room_code).stream()
-
-        room_doc = None
-        for doc in query:
-            room_doc = doc
-            break
+        room = rooms.find_by_code(room_code)
 
-        if not room_doc:
+        if not room:
             emit("error", {"message": "Room not found"}, to=request.sid)
             return
 
-        room_data = room_doc.to_dict()
-        room_id = room_doc.id
+        room_data = room.data
+        room_id = room.id
 
         #user admin?????
         if user_id != room_data.get("creator"):
@@ -738,38 +892,24 @@ def handle_admin_start_game(data):
             return
 
         # generiruem meteor i nachinaem igru
-        meteor = generate_random_meteor()
-        game_state["current_meteor"] = meteor
-        game_state["game_started"] = True
-
-        db.collection("rooms").document(room_id).update({
-            "status": "playing",
-            "game_state": game_state
-        })
-
-        # sobiraem list o userah
-        users = []
-        for uid, card in user_cards.items():
-            username = get_user_name(uid)
-            users.append({
-                "username": username or "Unknown",
-                "id": uid,
-                "card": card
-            })
+        if rooms.mutate(room, game_start_updates) is None:
+            emit("error", {"message": "Game already started"}, to=request.sid)
+            return
+        game_state = room.get("game_state", {})
+        meteor = current_meteor(game_state)
 
         #sendim vsem igrokam v komnate
-        emit("game_ready", {
-            "message": "Admin started the game! Let's play!",
-            "users": users,
-            "meteor": meteor
-        }, room=room_id)
+        # (they already have the user list from their room_snapshot)
+        emit_room_delta(room, "GAME_STARTED",
+                        status="playing", hp=game_state.get("hp"), round=game_state["round"], meteor=meteor)
 
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('join_game')
+@timed("socket", "join_game")
 def handle_join_game(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_code = data.get('roomCode')
 
     if not user_id:
@@ -781,22 +921,16 @@ def handle_join_game(data):
         return
 
     try:
-        rooms = (
-            db.collection("rooms")
-            .where("code", "==", room_code)
-            .where("status", "in", ["playing", "game_waiting"])#find room with status playing or waiting
-            .get()
-        )
-
-        if not rooms:
+        room = rooms.find_by_code(room_code, statuses=("playing", "game_waiting")) #find room with status playing or waiting
+
+        if not room:
             emit("error", {"message": "Room not found"}, to=request.sid)
             return
 
-        room_doc = rooms[0]
-        room_id = room_doc.id
-        room_data = room_doc.to_dict()
+        room_id = room.id
+        room_data = room.data
 
-        join_room(room_id)
+        join_socket_room(room_id, user_id)
 
         game_state = room_data.get("game_state", {})
         user_cards = game_state.get("user_cards", {})
@@ -807,76 +941,50 @@ def handle_join_game(data):
 
         available_cards = ["ROCKET", "IGNORE", "EVACUATION", "BUNKER"]
 
-        if user_id not in user_cards: #add user card
-            card_index = len(user_cards)
-            if card_index < len(available_cards):
-                user_cards[user_id] = available_cards[card_index]
-            else:
-                emit("error", {"message": "Game is full"}, to=request.sid)
-                return
-
-        user_cards[user_id] = available_cards[card_index]
-        game_state["user_cards"] = user_cards
-
-        if room_data.get("status") != "game_waiting": #update status
-            db.collection("rooms").document(room_id).update({
+        def take_card(current):
+            # the next free card, from the room as it is in storage
+            cards = current.get("game_state", {}).get("user_cards", {})
+            if current.get("status") == "playing" or user_id in cards or len(cards) >= len(available_cards):
+                return None
+            return {
                 "status": "game_waiting",
-                "game_state": game_state
-            })
-        else:
-            db.collection("rooms").document(room_id).update({"game_state": game_state})
-
-        users = []
-        for uid, card in user_cards.items():
-            username = get_user_name(uid)
-            users.append({
-                "username": username or "Unknown",
-                "id": uid,
-                "card": card
-            })
-
-        if len(user_cards) == 4 and not game_state.get("game_started", False):
-            meteor = generate_random_meteor()
-            game_state["current_meteor"] = meteor
-            game_state["game_started"] = True
-
-            db.collection("rooms").document(room_id).update({
-                "status": "playing",
-                "game_state": game_state
-            })
+                "game_state.user_cards": {**cards, user_id: available_cards[len(cards)]}
+            }
 
-            emit("game_ready", {
-                "message": "All players ready! Game starting...",
-                "users": users,
-                "meteor": meteor
-            }, room=room_id)
+        joined = rooms.mutate(room, take_card) is not None #add user card
+        room_data = room.data
+        game_state = room_data.get("game_state", {})
+        user_cards = game_state.get("user_cards", {})
+        if not joined and user_id not in user_cards:
+            if room_data.get("status") == "playing":
+                emit("error", {"message": "Game already in progress"}, to=request.sid)
+            else:
+                emit("error", {"message": "Game is full"}, to=request.sid)
+            return
 
-        elif len(user_cards) == 4 and game_state.get("game_started", False):
-            emit("game_ready", {
-                "message": "Game in progress! Welcome!",
-                "users": users,
-                "meteor": game_state.get("current_meteor")
-            }, to=request.sid)
+        # the joining player gets the whole room, everybody else one user
+        send_state("room_snapshot", room_snapshot(room))
+        if joined:
+            emit_room_delta(room, "USER_JOINED", user={
+                "id": user_id,
+                "username": get_user_name(user_id) or "Unknown",
+                "card": user_cards[user_id]
+            }, totalUsers=len(user_cards))
 
-        else:
-            emit("game_wait_room", {
-                "message": f"Waiting for players... ({len(user_cards)}/4)",
-                "users": users,
-                "totalUsers": len(user_cards)
-            }, room=room_id)
+        if rooms.mutate(room, game_start_updates) is not None:
+            game_state = room.get("game_state", {})
+            meteor = current_meteor(game_state)
 
-            emit("game_joined_waiting", {
-                "userId": user_id,
-                "users": users,
-                "totalUsers": len(user_cards)
-            }, to=request.sid)
+            emit_room_delta(room, "GAME_STARTED",
+                            status="playing", hp=game_state.get("hp"), round=game_state["round"], meteor=meteor)
 
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('close_room')
+@timed("socket", "close_room")
 def handle_close_room(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_id = data.get('roomId')
   
     if not user_id:
@@ -886,11 +994,11 @@ def handle_close_room(data):
         emit("error", {"message": "Room ID required"}, to=request.sid)
         return # tut proverka id and return
     try:
-        room_doc = db.collection("rooms").document(room_id).get()
-        if not room_doc.exists:
+        room = rooms.get(room_id)
+        if not room:
             emit("error", {"message": "Room not found"}, to=request.sid)
             return
-        room_data = room_doc.to_dict()
+        room_data = room.data
         creator_id = room_data.get("creator")
         if user_id != creator_id:
             emit("error", {"message": "Only room creator can close the room"}, to=request.sid)
@@ -900,14 +1008,15 @@ def handle_close_room(data):
             "roomId": room_id
         }, room=room_id)
 
-        db.collection("rooms").document(room_id).delete() #tut udelenie komnati
+        rooms.delete(room_id) #tut udelenie komnati
         
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('leave_room')
+@timed("socket", "leave_room")
 def handle_leave_room(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_id = data.get('roomId')
 
     if not user_id:
@@ -919,12 +1028,12 @@ def handle_leave_room(data):
         return
 
     try:
-        room_doc = db.collection("rooms").document(room_id).get()
-        if not room_doc.exists:
+        room = rooms.get(room_id)
+        if not room:
             emit("error", {"message": "Room not found"}, to=request.sid)
             return
 
-        room_data = room_doc.to_dict()
+        room_data = room.data
         current_users = room_data.get("users", [])
         creator_id = room_data.get("creator") #dobavil admina
 
@@ -939,20 +1048,21 @@ def handle_leave_room(data):
                 "message": f"Room closed - creator {username or 'Unknown'} left",
                 "roomId": room_id
             }, room=room_id)
-            db.collection("rooms").document(room_id).delete()
-        else:
-            current_users.remove(user_id)
+            rooms.delete(room_id)
+        elif remove_room_user(room, user_id):
+            current_users = room.get("users", [])
             if current_users: # esle users ostalis, update room
-                db.collection("rooms").document(room_id).update({"users": current_users})
-                emit("room_changed", {
+                send_state("room_changed", {
                     "userId": user_id,
                     "username": username or "Unknown",
                     "type": "USER_REMOVED",
-                    "total_users": len(current_users)
-                }, room=room_id)
+                    "total_users": len(current_users),
+                    "version": room.get("version", 0)
+                }, room_id)
             else:
-                db.collection("rooms").document(room_id).delete()
+                rooms.delete(room_id)
 
+        sockets.leave(request.sid, room_id)
         emit("room_left", {
             "message": "You have left the room",
             "roomId": room_id
@@ -961,8 +1071,9 @@ def handle_leave_room(data):
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('remove_user')
+@timed("socket", "remove_user")
 def handle_remove_user(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_id = data.get('roomId')
     target_user_id = data.get('targetUserId')
 
@@ -975,12 +1086,12 @@ def handle_remove_user(data):
         return
 
     try:
-        room_doc = db.collection("rooms").document(room_id).get()
-        if not room_doc.exists:
+        room = rooms.get(room_id)
+        if not room:
             emit("error", {"message": "Room not found"}, to=request.sid)
             return
 
-        room_data = room_doc.to_dict()
+        room_data = room.data
         current_users = room_data.get("users", [])
 
         if user_id not in current_users:
@@ -995,24 +1106,60 @@ def handle_remove_user(data):
             emit("error", {"message": "Cannot remove yourself"}, to=request.sid)
             return
 
-        current_users.remove(target_user_id)
+        if not remove_room_user(room, target_user_id):
+            emit("error", {"message": "Target user not in room"}, to=request.sid)
+            return
         target_username = get_user_name(target_user_id)
-        db.collection("rooms").document(room_id).update({"users": current_users})
-        emit("room_changed", {
+        send_state("room_changed", {
             "userId": target_user_id,
             "username": target_username or "Unknown",
             "type": "USER_REMOVED",
-            "total_users": len(current_users)
-        }, room=room_id)
+            "total_users": len(room.get("users", [])),
+            "version": room.get("version", 0)
+        }, room_id)
+
+    except Exception as e:
+        emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
+
+@socketio.on('room_resync')
+@timed("socket", "room_resync")
+def handle_room_resync(data):
+    user_id = current_user_id()
+    room_id = data.get('roomId')
+
+    if not user_id:
+        emit("error", {"message": "Not authenticated"}, to=request.sid)
+        return
+
+    if not room_id:
+        emit("error", {"message": "Room ID required"}, to=request.sid)
+        return
+
+    try:
+        room = rooms.get(room_id)
+        if not room:
+            emit("error", {"message": "Room not found"}, to=request.sid)
+            return
+
+        user_cards = room.get("game_state", {}).get("user_cards", {})
+        if user_id not in room.get("users", []) and user_id not in user_cards:
+            emit("error", {"message": "You are not in this room"}, to=request.sid)
+            return
+
+        send_state("room_snapshot", room_snapshot(room))
 
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
 
 @socketio.on('card_chosen')
+@timed("socket", "card_chosen")
 def handle_card_chosen(data):
-    user_id = request.cookies.get('userId')
+    user_id = current_user_id()
     room_id = data.get('roomId')
     chosen_card = data.get('card')
+    # the round the player answered; without it an answer meant for an
+    # earlier meteor could resolve the current one
+    answered_round = data.get('round')
 
     if not user_id:
         emit("error", {"message": "Not authenticated"}, to=request.sid)
@@ -1022,49 +1169,73 @@ def handle_card_chosen(data):
         emit("error", {"message": "Room ID and card choice required"}, to=request.sid)
         return
 
+    if not isinstance(answered_round, int) or isinstance(answered_round, bool):
+        emit("error", {"message": "Round required"}, to=request.sid)
+        return
+
     try:
-        room_doc = db.collection("rooms").document(room_id).get()
-        if not room_doc.exists:
+        room = rooms.get(room_id)
+        if not room:
             emit("error", {"message": "Room not found"}, to=request.sid)
             return
 
-        room_data = room_doc.to_dict()
+        room_data = room.data
+        if answered_round != room.field("game_state.round"):
+            # another worker may have resolved a round we have not heard of
+            if not rooms.refresh(room):
+                emit("error", {"message": "Room not found"}, to=request.sid)
+                return
+            room_data = room.data
+        if room_data.get("status") in ("waiting", "game_waiting"):
+            emit("error", {"message": "Game has not started"}, to=request.sid)
+            return
+
         game_state = room_data.get("game_state", {})
-        current_hp = game_state.get("hp", 3)
-        current_meteor = game_state.get("current_meteor", {})
-        generated_scenario = current_meteor.get("generated_scenario", 1)
+        meteor = current_meteor(game_state) or {}
 
+        # the first answer for a round resolves it; answers naming a round
+        # that is already resolved are turned away before any write
+        round_index = game_state.get("round", 0)
+        if room_data.get("status") != "playing" or answered_round != round_index:
+            send_state("round_rejected", {"round": round_index, "message": "Round already resolved"})
+            return
+
+        generated_scenario = meteor.get("generated_scenario", 1)
         is_correct_choice = validate_card_choice(generated_scenario, chosen_card)
 
+        current_hp = game_state.get("hp", 3)
         if not is_correct_choice:
             current_hp -= 1
 
-        game_state["hp"] = current_hp
-
+        updates = {
+            "game_state.hp": current_hp,
+            "game_state.round": round_index + 1,
+            "version": room.get("version", 0) + 1
+        }
         if current_hp <= 0:
-            game_state["status"] = "ended"
-            db.collection("rooms").document(room_id).update({
-                "status": "ended",
-                "game_state": game_state
+            updates.update({"status": "ended", "game_state.status": "ended"})
+
+        # a game started before meteors were seeded gets its seed with the
+        # first answer, in the same write; the answer still resolves the
+        # stored meteor
+        guard = ("game_state.round", round_index)
+        if game_state.get("seed") is None:
+            updates["game_state.seed"] = random.getrandbits(63)
+            guard = ("game_state.seed", None)
+
+        if not rooms.compare_and_set(room, *guard, updates):
+            send_state("round_rejected", {
+                "round": room.field("game_state.round"),
+                "message": "Round already resolved"
             })
+            return
 
-            emit("game_ended", {
-                "message": "Game Over! No lives remaining.",
-                "final_hp": current_hp
-            }, room=room_id)
+        if current_hp <= 0:
+            emit_room_delta(room, "GAME_ENDED", status="ended", hp=current_hp)
         else:
-            new_meteor = generate_random_meteor()
-            game_state["current_meteor"] = new_meteor
-
-            db.collection("rooms").document(room_id).update({"game_state": game_state})
-
-            emit("round_result", {
-                "chosen_card": chosen_card,
-                "was_correct": is_correct_choice,
-                "current_hp": current_hp,
-                "new_meteor": new_meteor,
-                "message": "Correct choice!" if is_correct_choice else "Wrong choice! -1 HP"
-            }, room=room_id)
+            emit_room_delta(room, "ROUND_RESOLVED",
+                            card=chosen_card, correct=is_correct_choice, hp=current_hp,
+                            round=round_index + 1, meteor=current_meteor(room.data["game_state"]))
 
     except Exception as e:
         emit("error", {"message": f"Server error: {str(e)}"}, to=request.sid)
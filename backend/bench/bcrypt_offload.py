@@ -0,0 +1,79 @@
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import bcrypt
+import gevent
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.password_hashing import PasswordHasher, HasherBusy
+
+# Login throughput against socket event latency under mixed load.
+#
+# A ticker greenlet stands in for live games: it wakes every --tick ms and
+# records how late it was woken. Meanwhile --logins concurrent clients keep
+# checking passwords, either inline on the gevent loop (what the login route
+# used to do) or through PasswordHasher.
+#
+#   python bench/bcrypt_offload.py --seconds 5 --logins 8
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def run(mode, seconds, logins, tick, hasher):
+    hashed = bcrypt.hashpw(b"correct horse", bcrypt.gensalt()).decode()
+    deadline = time.monotonic() + seconds
+    lags = []
+    done = [0, 0]  # completed, rejected
+
+    def ticker():
+        while time.monotonic() < deadline:
+            expected = time.monotonic() + tick
+            gevent.sleep(tick)
+            lags.append(max(time.monotonic() - expected, 0) * 1000)
+
+    def login():
+        while time.monotonic() < deadline:
+            if mode == "inline":
+                bcrypt.checkpw(b"correct horse", hashed.encode())
+            else:
+                try:
+                    hasher.check("correct horse", hashed)
+                except HasherBusy:
+                    done[1] += 1
+                    gevent.sleep(0.05)
+                    continue
+            done[0] += 1
+
+    began = time.monotonic()
+    gevent.joinall([gevent.spawn(ticker)] + [gevent.spawn(login) for _ in range(logins)])
+    elapsed = time.monotonic() - began
+    return done[0] / elapsed, done[1], percentile(lags, 0.5), percentile(lags, 0.99), max(lags, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login clients")
+    parser.add_argument("--tick", type=float, default=10, help="socket event interval in ms")
+    args = parser.parse_args()
+
+    hasher = PasswordHasher()
+    print(f"{args.logins} login clients, socket tick every {args.tick:g} ms, "
+          f"{hasher.stats()['workers']} hash workers, max {hasher.max_pending} pending")
+    print("mode      logins/s  rejected  tick lag p50  p99      max (ms)")
+    for mode in ("inline", "pool"):
+        rate, rejected, p50, p99, worst = run(mode, args.seconds, args.logins, args.tick / 1000, hasher)
+        print(f"{mode:8}  {rate:8.2f}  {rejected:8d}  {p50:12.1f}  {p99:7.1f}  {worst:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import gevent
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Load test of the real Socket.IO app with simulated players.
+#
+# N clients log in through /api/test/login, form rooms of four (join_room,
+# join_existing_room, start_game), call join_game, and play card_chosen
+# rounds until the room_delta GAME_ENDED. Rooms run on the memory storage
+# backend (or sqlite) and Gemini is replaced by a stub, so nothing leaves
+# the machine. Games advance in lockstep, one step for every room at a time,
+# so all rooms are alive together.
+#
+# The test clients call handlers synchronously on this thread: per-event
+# latency is the handler's time in the server, events/s is one worker's
+# throughput. Results are written as JSON; --compare prints the change
+# against an earlier run.
+#
+#   python bench/game_load.py --clients 400 --output game_load.json
+#   python bench/game_load.py --compare game_load.json
+
+CARDS = ["ROCKET", "IGNORE", "EVACUATION", "BUNKER"]
+GAME_METEOR = {
+    "mass": 1200.0, "speed": 19000.0, "angle": 45.0, "latitude": 48.86, "longitude": 2.35,
+    "type": "STONY", "weather": "CLEAR", "material": "STONE",
+}
+
+
+class StubModel:
+    # stands in for the Gemini model behind services.llm_gateway
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt, request_options=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return SimpleNamespace(text=json.dumps(GAME_METEOR))
+
+
+def load_app(storage, storage_path, gemini_latency):
+    os.environ["STORAGE_BACKEND"] = storage
+    os.environ["STORAGE_PATH"] = storage_path
+    # a real key would start the AI meteor pool, and a queue would need a broker
+    os.environ.pop("GEMINI_API_KEY", None)
+    os.environ.pop("SOCKETIO_MESSAGE_QUEUE", None)
+    import app
+    app.gateway.model = StubModel(gemini_latency)
+    return app
+
+
+class Player:
+    def __init__(self, app, index, stats):
+        self.app = app
+        self.stats = stats
+        self.user_id = f"load-{index:06d}"
+        self.username = f"player{index}"
+        self.http = app.app.test_client()
+
+        began = time.perf_counter()
+        resp = self.http.post("/api/test/login")
+        stats.record("http test_login", time.perf_counter() - began)
+        if resp.status_code != 200:
+            raise RuntimeError(f"/api/test/login answered {resp.status_code}")
+        # /api/test/login always signs in the same test user, games need four
+        # different ones
+        app.user_store.create_user(self.user_id, self.username, {})
+        self.http.set_cookie(app.SESSION_COOKIE, app.sessions.issue(self.user_id, self.username))
+        self.socket = app.socketio.test_client(app.app, flask_test_client=self.http)
+        self.socket.get_received()
+
+    def emit(self, event, data=None):
+        began = time.perf_counter()
+        if data is None:
+            self.socket.emit(event)
+        else:
+            self.socket.emit(event, data)
+        self.stats.record(event, time.perf_counter() - began)
+        received = self.socket.get_received()
+        for message in received:
+            if message["name"] == "error":
+                self.stats.errors[message["args"][0].get("message", "")] += 1
+        return received
+
+    def drain(self):
+        self.socket.get_received()
+
+
+class Game:
+    def __init__(self, players, accuracy):
+        self.players = players
+        self.accuracy = accuracy
+        self.room_id = None
+        self.code = None
+        self.round = 0
+        self.meteor = None
+        self.ended = False
+
+    def _deltas(self, received):
+        return [m["args"][0] for m in received if m["name"] == "room_delta"]
+
+    def create(self):
+        received = self.players[0].emit("join_room")
+        created = next(m["args"][0] for m in received if m["name"] == "room_created")
+        self.room_id, self.code = created["roomId"], created["code"]
+
+    def join(self):
+        for player in self.players[1:]:
+            player.emit("join_existing_room", {"code": self.code})
+        # the lobby sends everybody to the game page
+        self.players[0].emit("start_game", {"roomId": self.room_id})
+        for player in self.players:
+            player.drain()
+
+    def join_game(self):
+        for player in self.players:
+            received = player.emit("join_game", {"roomCode": self.code})
+            for delta in self._deltas(received):
+                if delta["type"] == "GAME_STARTED":
+                    self.round, self.meteor = delta["round"], delta["meteor"]
+        for player in self.players:
+            player.drain()
+        if self.meteor is None:
+            raise RuntimeError(f"room {self.code} did not start")
+
+    def play_round(self, validate):
+        # players take turns answering; the right card with probability accuracy
+        player = self.players[self.round % len(self.players)]
+        scenario = self.meteor.get("generated_scenario", 1)
+        right = [card for card in CARDS if validate(scenario, card)]
+        wrong = [card for card in CARDS if card not in right]
+        card = random.choice(right if right and (random.random() < self.accuracy or not wrong) else wrong)
+
+        received = player.emit("card_chosen", {"roomId": self.room_id, "card": card, "round": self.round})
+        for delta in self._deltas(received):
+            if delta["type"] == "GAME_ENDED":
+                self.ended = True
+            elif delta["type"] == "ROUND_RESOLVED":
+                self.round, self.meteor = delta["round"], delta["meteor"]
+        for other in self.players:
+            if other is not player:
+                other.drain()
+        if not self.ended and not any(m["name"] == "room_delta" for m in received):
+            raise RuntimeError(f"round {self.round} of room {self.code} was not resolved")
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, event, seconds):
+        self.latencies[event].append(seconds)
+
+    def summary(self):
+        events = {}
+        for event, values in sorted(self.latencies.items()):
+            ms = np.array(values) * 1000
+            events[event] = {
+                "count": len(values),
+                "mean_ms": round(float(ms.mean()), 4),
+                "p50_ms": round(float(np.percentile(ms, 50)), 4),
+                "p95_ms": round(float(np.percentile(ms, 95)), 4),
+                "p99_ms": round(float(np.percentile(ms, 99)), 4),
+                "max_ms": round(float(ms.max()), 4),
+            }
+        return events
+
+
+def pump():
+    # lets RoomRegistry's write-behind flushes run between steps
+    gevent.sleep(0)
+
+
+def play(app, clients, accuracy, max_rounds, stats):
+    players = [Player(app, i, stats) for i in range(clients)]
+    games = [Game(players[i:i + 4], accuracy) for i in range(0, clients - clients % 4, 4)]
+
+    for step in (Game.create, Game.join, Game.join_game):
+        for game in games:
+            step(game)
+        pump()
+
+    rounds = 0
+    active = list(games)
+    while active:
+        for game in active:
+            game.play_round(app.validate_card_choice)
+            rounds += 1
+        pump()
+        active = [game for game in active if not game.ended and game.round < max_rounds]
+    return players, games, rounds
+
+
+def measure_memory(app, rooms):
+    # traced allocations while rooms of four are created, joined and started:
+    # the registry, socket index and Socket.IO sessions, plus the test clients
+    stats = Stats()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    players, games, _ = play(app, rooms * 4, accuracy=1.0, max_rounds=0, stats=stats)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del players, games
+    return (after - before) / rooms
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path, result):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nagainst {previous_path} ({previous['meta'].get('commit')}, {previous['meta'].get('date')}):")
+    old, new = previous["events_per_sec"], result["events_per_sec"]
+    print(f"  events/s          {old:10.0f} -> {new:10.0f}  {(new - old) / old:+7.1%}")
+    for event, stats in result["events"].items():
+        before = previous["events"].get(event)
+        if before:
+            change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+            print(f"  {event:18} p95 {before['p95_ms']:8.3f} -> {stats['p95_ms']:8.3f} ms  {change:+7.1%}")
+    old, new = previous["memory_per_room_bytes"], result["memory_per_room_bytes"]
+    print(f"  bytes per room    {old:10.0f} -> {new:10.0f}  {(new - old) / old:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate full multiplayer games against the Socket.IO app")
+    parser.add_argument("--clients", type=int, default=200, help="simulated players, four per room")
+    parser.add_argument("--accuracy", type=float, default=0.8, help="chance a player picks the right card")
+    parser.add_argument("--max-rounds", type=int, default=50, help="rounds after which a game is left")
+    parser.add_argument("--memory-rooms", type=int, default=25, help="rooms created for the memory measurement")
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--storage-path", default="game_load.sqlite3")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="seconds the Gemini stub takes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="game_load.json")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+    if args.clients < 4:
+        parser.error("--clients must be at least 4")
+
+    random.seed(args.seed)
+    app = load_app(args.storage, args.storage_path, args.gemini_latency)
+
+    stats = Stats()
+    began = time.perf_counter()
+    _, games, rounds = play(app, args.clients, args.accuracy, args.max_rounds, stats)
+    wall = time.perf_counter() - began
+
+    events = stats.summary()
+    total = sum(event["count"] for event in events.values())
+    handler_seconds = sum(sum(values) for values in stats.latencies.values())
+    result = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "clients": len(games) * 4,
+        "rooms": len(games),
+        "rounds": rounds,
+        "events": events,
+        "events_total": total,
+        "events_per_sec": round(total / handler_seconds, 1),
+        "wall_seconds": round(wall, 3),
+        "wall_events_per_sec": round(total / wall, 1),
+        "memory_per_room_bytes": round(measure_memory(app, args.memory_rooms)),
+        "errors": dict(stats.errors),
+        "gemini_calls": app.gateway.model.calls,
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{result['clients']} clients, {result['rooms']} rooms, {rounds} rounds, {args.storage} storage")
+    print(f"{total} events, {result['events_per_sec']:.0f} events/s in handlers, "
+          f"{result['wall_events_per_sec']:.0f} events/s wall ({wall:.1f}s)")
+    print(f"{'event':18} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for event, summary in events.items():
+        print(f"{event:18} {summary['count']:7d} {summary['p50_ms']:9.3f} {summary['p95_ms']:9.3f} {summary['p99_ms']:9.3f}")
+    print(f"memory per room: {result['memory_per_room_bytes'] / 1024:.1f} KiB")
+    if stats.errors:
+        print(f"errors: {dict(stats.errors)}")
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        compare(args.compare, result)
+
+
+if __name__ == "__main__":
+    main()
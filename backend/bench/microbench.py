@@ -0,0 +1,187 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from socketio import packet
+
+from services.gemini_service import create_fallback_meteor, is_valid_meteor, parse_meteor_response
+from services.scenarios import get_scenario_params, meteor_for_round, validate_card_choice
+from services.wire_format import pack
+
+# Microbenchmarks of the pure-Python hot paths: scenario draws, card
+# validation, encoding of the game start and round payloads, and the meteor
+# checks and parsing in gemini_service.
+#
+# Every benchmark is calibrated to run at least --min-time per sample, warmed
+# up, then sampled --repeat times with the garbage collector off. Baselines
+# are compared on the median sample: on shared or virtual machines the
+# fastest one is an outlier as often as the slowest. --compare fails (exit 1)
+# when a benchmark got slower than --threshold percent.
+#
+#   python bench/microbench.py --save baseline.json
+#   python bench/microbench.py --compare baseline.json --threshold 10
+
+USERS = [
+    {"username": f"player{i}", "id": f"3f1c2a4e-8b7d-4c1e-9a2b-{i:012d}", "card": card}
+    for i, card in enumerate(["ROCKET", "IGNORE", "EVACUATION", "BUNKER"])
+]
+# what a client receives when the game starts (room_snapshot) and per round
+GAME_READY = {
+    "roomId": "b7aea275-c94d-44b9-8388-4639dc5f5648", "code": "4821", "version": 9,
+    "status": "playing", "creator": USERS[0]["id"], "users": USERS,
+    "hp": 3, "round": 0, "meteor": meteor_for_round(7, 0),
+}
+ROUND_RESULT = {
+    "version": 12, "type": "ROUND_RESOLVED", "card": "EVACUATION", "correct": False,
+    "hp": 2, "round": 3, "meteor": meteor_for_round(7, 3),
+}
+
+METEOR = {
+    "mass": 1520.75, "speed": 23000, "angle": 42, "latitude": 48.856613, "longitude": 2.352222,
+    "type": "IRON", "weather": "CLEAR", "material": "IRON",
+}
+GEMINI_REPLY = "```json\n" + json.dumps(METEOR, indent=4) + "\n```\n"
+
+
+def _socketio_json(event, payload):
+    return lambda: packet.Packet(packet.EVENT, data=[event, payload]).encode()
+
+
+def _validate_cards():
+    # every scenario with the right card and a wrong one
+    choices = [(scenario, card) for scenario in range(1, 361) for card in ("ROCKET", "BUNKER")]
+    return lambda: [validate_card_choice(scenario, card) for scenario, card in choices]
+
+
+def _is_valid_meteors():
+    invalid = [dict(METEOR, mass=0), dict(METEOR, material="STONE"), {"mass": 1}]
+    meteors = [METEOR] * 7 + invalid
+    return lambda: [is_valid_meteor(meteor) for meteor in meteors]
+
+
+# name -> (setup, calls per run); setup returns the function to time
+BENCHMARKS = {
+    "get_scenario_params": (lambda: get_scenario_params, 1),
+    "validate_card_choice": (_validate_cards, 720),
+    "encode game_ready json": (lambda: _socketio_json("room_snapshot", GAME_READY), 1),
+    "encode game_ready msgpack": (lambda: lambda: pack(GAME_READY), 1),
+    "encode round_result json": (lambda: _socketio_json("room_delta", ROUND_RESULT), 1),
+    "encode round_result msgpack": (lambda: lambda: pack(ROUND_RESULT), 1),
+    "is_valid_meteor": (_is_valid_meteors, 10),
+    "create_fallback_meteor": (lambda: create_fallback_meteor, 1),
+    "parse_meteor_response": (lambda: lambda: parse_meteor_response(GEMINI_REPLY), 1),
+}
+
+
+def _time(fn, loops):
+    began = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - began
+
+
+def measure(fn, min_time, warmup, repeat):
+    # loops per sample so one sample takes at least min_time
+    loops = 1
+    while _time(fn, loops) < min_time:
+        loops *= 2
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(warmup):
+            _time(fn, loops)
+        return [_time(fn, loops) / loops for _ in range(repeat)], loops
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def run(names, min_time, warmup, repeat):
+    results = {}
+    for name in names:
+        setup, calls = BENCHMARKS[name]
+        random.seed(1)
+        samples, loops = measure(setup(), min_time, warmup, repeat)
+        per_call = [sample / calls * 1e9 for sample in samples]
+        results[name] = {
+            "median_ns": round(statistics.median(per_call), 1),
+            "min_ns": round(min(per_call), 1),
+            "stdev_ns": round(statistics.stdev(per_call), 1) if len(per_call) > 1 else 0.0,
+            "loops": loops,
+        }
+        print(f"{name:30} {results[name]['median_ns']:12.1f} ns  "
+              f"(min {results[name]['min_ns']:.1f}, stdev {results[name]['stdev_ns']:.1f})")
+    return results
+
+
+def compare(baseline, results, threshold):
+    # names of benchmarks slower than the baseline by more than threshold percent
+    regressions = []
+    print(f"\n{'median call':30} {'baseline ns':>12} {'now ns':>12} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:30} {'-':>12} {result['median_ns']:12.1f}      new")
+            continue
+        change = (result["median_ns"] - before["median_ns"]) / before["median_ns"] * 100
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:30} {before['median_ns']:12.1f} {result['median_ns']:12.1f} {change:+7.1f}%"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the game's pure-Python hot paths")
+    parser.add_argument("--filter", default="", help="only benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per sample at least")
+    parser.add_argument("--warmup", type=int, default=3, help="samples thrown away first")
+    parser.add_argument("--repeat", type=int, default=15, help="samples per benchmark")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline results file")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    if not names:
+        parser.error(f"no benchmark matches {args.filter!r}")
+
+    print(f"python {platform.python_version()}, {args.repeat} samples of >= {args.min_time * 1000:.0f} ms each\n")
+    results = run(names, args.min_time, args.warmup, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "meta": {
+                    "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cpus": os.cpu_count(),
+                },
+                "benchmarks": results,
+            }, f, indent=2)
+        print(f"\nresults written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["benchmarks"]
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks slower than {args.threshold:g}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Load test for multi-worker Socket.IO through the local broker.
+#
+# Starts the broker and N worker processes, each with a socketio.Server on a
+# LocalManager. Every worker resolves --rounds card_chosen-like rounds (impact
+# estimate for a seeded meteor, then a round_result emit to the game room) and
+# counts the emits it receives from the other workers. Throughput should grow
+# close to linearly with the worker count as long as there are free cores.
+#
+#   python bench/mq_scaling.py --workers 1 2 4 --rounds 2000
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"broker did not start on port {port}")
+
+
+def worker(index, url, channel, rounds, work, start, results):
+    import socketio
+    from services.impact_physics import estimate_impact
+    from services.message_queue import LocalManager
+    from services.scenarios import meteor_for_round
+
+    class CountingManager(LocalManager):
+        received = 0
+
+        def _handle_emit(self, message):
+            if message.get("host_id") != self.host_id:
+                CountingManager.received += 1
+            super()._handle_emit(message)
+
+    manager = CountingManager(url, channel=channel)
+    server = socketio.Server(async_mode="threading", client_manager=manager)
+    manager.initialize()
+    time.sleep(0.2)  # let the listener subscribe before anyone publishes
+
+    start.wait()
+    began = time.perf_counter()
+    for round_index in range(rounds):
+        meteor = meteor_for_round(index, round_index)
+        for _ in range(work):
+            impact = estimate_impact({
+                "mass": meteor["weight"] * 1e6, "speed": meteor["speed"], "angle": meteor["angle"],
+                "latitude": 48.86, "longitude": 2.35, "type": meteor["composition"],
+            })
+        server.emit("round_result", {
+            "round": round_index, "casualties": impact["casualties"], "meteor": meteor,
+        }, room=f"game-{index}")
+    elapsed = time.perf_counter() - began
+
+    # wait for the other workers' rounds to arrive
+    expected = rounds * (results["workers"] - 1)
+    deadline = time.monotonic() + 30
+    while CountingManager.received < expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    results[index] = (elapsed, CountingManager.received, expected)
+
+
+def run(workers, url, channel, rounds, work):
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as sync:
+        results = sync.dict(workers=workers)
+        start = sync.Event()
+        procs = [
+            ctx.Process(target=worker, args=(i, url, channel, rounds, work, start, results))
+            for i in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        time.sleep(1 + 0.2 * workers)
+        began = time.perf_counter()
+        start.set()
+        for proc in procs:
+            proc.join()
+        wall = time.perf_counter() - began
+        return wall, [results[i] for i in range(workers)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--work", type=int, default=20, help="impact estimates per round")
+    args = parser.parse_args()
+
+    port = free_port()
+    url = f"local://127.0.0.1:{port}"
+    backend = Path(__file__).parent.parent
+    broker = subprocess.Popen([sys.executable, "-m", "services.message_queue", url], cwd=backend,
+                              stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        print(f"{os.cpu_count()} cpus, {args.rounds} rounds per worker, {args.work} estimates per round")
+        print("workers  rounds/s  speedup  delivered")
+        baseline = None
+        for workers in args.workers:
+            # the wall time includes waiting for the last fan-out to land
+            wall, results = run(workers, url, f"bench-{workers}", args.rounds, args.work)
+            busy = max(elapsed for elapsed, _, _ in results)
+            rate = workers * args.rounds / busy
+            baseline = baseline or rate / workers
+            received = sum(r for _, r, _ in results)
+            expected = sum(e for _, _, e in results)
+            delivered = received / expected if expected else 1.0
+            print(f"{workers:7d}  {rate:8.0f}  {rate / baseline:6.2f}x  {delivered:8.1%}  ({wall:.1f}s)")
+    finally:
+        broker.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from socketio import packet
+
+from services.scenarios import meteor_for_round
+from services.wire_format import pack, unpack
+
+# Bytes on the wire and encode/decode time of room state events as JSON
+# (the default Socket.IO packet) and as MessagePack with coded enums
+# (services/wire_format.py, sent as a binary attachment).
+#
+#   python bench/wire_encoding.py
+
+USERS = [
+    {"username": f"player{i}", "id": f"3f1c2a4e-8b7d-4c1e-9a2b-{i:012d}", "card": card}
+    for i, card in enumerate(["ROCKET", "IGNORE", "EVACUATION", "BUNKER"])
+]
+
+EVENTS = {
+    "room_snapshot": {
+        "roomId": "b7aea275-c94d-44b9-8388-4639dc5f5648", "code": "4821", "version": 9,
+        "status": "playing", "creator": USERS[0]["id"], "users": USERS,
+        "hp": 3, "round": 0, "meteor": meteor_for_round(7, 0),
+    },
+    "room_delta USER_JOINED": {"version": 7, "type": "USER_JOINED", "user": USERS[3], "totalUsers": 4},
+    "room_delta ROUND_RESOLVED": {
+        "version": 12, "type": "ROUND_RESOLVED", "card": "EVACUATION", "correct": False,
+        "hp": 2, "round": 3, "meteor": meteor_for_round(7, 3),
+    },
+    "room_changed": {"userId": USERS[1]["id"], "username": "player1", "type": "USER_ADDED",
+                     "total_users": 2, "version": 2},
+}
+
+
+def wire_size(encoded):
+    if isinstance(encoded, list):
+        return sum(len(part) for part in encoded)
+    return len(encoded)
+
+
+def json_packet(name, payload):
+    return packet.Packet(packet.EVENT, data=[name.split()[0], payload]).encode()
+
+
+def msgpack_packet(name, payload):
+    return packet.Packet(packet.EVENT, data=[name.split()[0], pack(payload)]).encode()
+
+
+def time_per_call(fn, number=20000):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    print(f"{'event':28} {'json B':>7} {'msgpack B':>10} {'json enc':>9} {'mp enc':>7} {'json dec':>9} {'mp dec':>7}  (us)")
+    for name, payload in EVENTS.items():
+        encoded_json = json.dumps(payload, separators=(",", ":"))
+        encoded_mp = pack(payload)
+        assert unpack(encoded_mp) == payload
+
+        print(f"{name:28} {wire_size(json_packet(name, payload)):7d} {wire_size(msgpack_packet(name, payload)):10d} "
+              f"{time_per_call(lambda: json.dumps(payload, separators=(',', ':'))):9.2f} "
+              f"{time_per_call(lambda: pack(payload)):7.2f} "
+              f"{time_per_call(lambda: json.loads(encoded_json)):9.2f} "
+              f"{time_per_call(lambda: unpack(encoded_mp)):7.2f}")
+
+
+if __name__ == "__main__":
+    main()
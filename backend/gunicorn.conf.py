@@ -0,0 +1,66 @@
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlparse
+
+# Loaded by gunicorn from the working directory. With more than one worker the
+# workers have to share Socket.IO rooms through a message queue; unless
+# SOCKETIO_MESSAGE_QUEUE points somewhere else (e.g. Redis), the master starts
+# the local broker (services/message_queue.py) in its own process and the
+# workers, forked afterwards, inherit its address. The same goes for the
+# session secret: without SESSION_SECRET each worker would make up its own
+# and reject the session cookies signed by the others.
+
+LOCAL_BROKER_URL = "local://127.0.0.1:6500"
+
+broker = None
+
+
+def _broker_up(url, timeout=5):
+    parsed = urlparse(url)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((parsed.hostname, parsed.port), timeout=1).close()
+            return True
+        except OSError:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.1)
+
+
+def on_starting(server):
+    global broker
+    if not os.getenv("SESSION_SECRET"):
+        # also for one worker, so sessions outlive a worker gunicorn replaces
+        os.environ["SESSION_SECRET"] = secrets.token_urlsafe(32)
+        server.log.warning("SESSION_SECRET not set, the workers share a random secret: sessions end on restart")
+
+    url = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+    if url is None and server.cfg.workers > 1:
+        url = LOCAL_BROKER_URL
+        os.environ["SOCKETIO_MESSAGE_QUEUE"] = url
+    if not url or not url.startswith("local://"):
+        return
+
+    if _broker_up(url, timeout=0):
+        server.log.info(f"Using running Socket.IO broker on {url}")
+        return
+    broker = subprocess.Popen([sys.executable, "-m", "services.message_queue", url])
+    if not _broker_up(url):
+        server.log.error(f"Socket.IO broker did not come up on {url}")
+
+
+def worker_exit(server, worker):
+    # RoomRegistry writes behind; don't lose what is still queued
+    app = sys.modules.get("app")
+    if app is not None and hasattr(app, "rooms"):
+        app.rooms.close()
+
+
+def on_exit(server):
+    if broker is not None:
+        broker.terminate()
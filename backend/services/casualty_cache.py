@@ -0,0 +1,126 @@
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+from services.impact_physics import speed_in_meters
+
+CASUALTY_CACHE_SIZE = int(os.getenv("CASUALTY_CACHE_SIZE", "5000"))
+CASUALTY_CACHE_TTL = float(os.getenv("CASUALTY_CACHE_TTL", str(7 * 24 * 3600)))
+CASUALTY_CACHE_PATH = os.getenv("CASUALTY_CACHE_PATH")
+
+# quantization of the cache key
+GRID_DEGREES = float(os.getenv("CASUALTY_CACHE_GRID", "0.25"))
+MASS_BUCKETS_PER_DECADE = 4
+SPEED_BUCKET = 1000  # m/s
+ANGLE_BUCKET = 5
+
+
+def _bucket(value, size):
+    return int(math.floor(float(value) / size))
+
+
+def casualty_key(meteor_data):
+    # Meteors that land in the same grid cell with similar mass, speed and
+    # angle get the same casualty estimate.
+    mass = max(float(meteor_data.get("mass", 0)), 1e-3)
+    return (
+        _bucket(meteor_data.get("latitude", 0), GRID_DEGREES),
+        _bucket(meteor_data.get("longitude", 0), GRID_DEGREES),
+        round(math.log10(mass) * MASS_BUCKETS_PER_DECADE),
+        # km/s and m/s inputs, bucketed as m/s like the estimate uses them
+        _bucket(speed_in_meters(meteor_data.get("speed", 0)), SPEED_BUCKET),
+        _bucket(meteor_data.get("angle", 0), ANGLE_BUCKET),
+        str(meteor_data.get("type", "")).upper(),
+        str(meteor_data.get("weather", "CLEAR")).upper(),
+    )
+
+
+class CasualtyCache:
+    # LRU + TTL cache in memory, optionally backed by a SQLite file so that
+    # entries survive restarts.
+
+    def __init__(self, max_size=CASUALTY_CACHE_SIZE, ttl=CASUALTY_CACHE_TTL, path=CASUALTY_CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS casualties "
+                "(key TEXT PRIMARY KEY, casualties INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM casualties WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def _remember(self, key, casualties, expires_at):
+        self._entries[key] = (casualties, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, meteor_data):
+        try:
+            key = casualty_key(meteor_data)
+        except (TypeError, ValueError):
+            return None
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            casualties, expires_at = entry
+            if expires_at >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return casualties
+            del self._entries[key]
+
+        if self._conn is not None:
+            row = self._conn.execute(
+                "SELECT casualties, expires_at FROM casualties WHERE key = ?",
+                (json.dumps(key),)
+            ).fetchone()
+            if row is not None and row[1] >= now:
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, meteor_data, casualties):
+        try:
+            key = casualty_key(meteor_data)
+        except (TypeError, ValueError):
+            return
+        expires_at = time.time() + self.ttl
+        self._remember(key, casualties, expires_at)
+
+        if self._conn is not None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO casualties (key, casualties, expires_at) VALUES (?, ?, ?)",
+                (json.dumps(key), casualties, expires_at)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "persistent": self._conn is not None,
+        }
@@ -0,0 +1,166 @@
+import math
+import os
+
+import numpy as np
+
+# Python port of frontend/src/services/meteorMathService.ts, extended with
+# blast radii and a casualty estimate over a local population density grid.
+
+GRID_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'population_grid.npz')
+KM_PER_DEGREE = 111.32
+JOULES_PER_KILOTON = 4.184e12
+MAX_CASUALTIES = 100000000
+
+RADIUS_TIMES_IN_SECONDS = (1800, 3600, 7200)
+
+WEATHER_COEFFICIENTS = {"CLEAR": 1.0, "SNOW": 0.99, "RAIN": 0.97, "STORM": 0.95}
+
+# share of the entry energy that reaches the ground: iron survives the
+# atmosphere, stony bodies mostly break up in an airburst
+GROUND_COUPLING = {"IRON": 1.0, "STONY_IRON": 0.8, "STONY": 0.6}
+
+# (radius for a 1 kt burst in km, fraction of people killed inside the zone)
+BLAST_ZONES = (
+    (0.28, 0.6),   # ~12 psi, most buildings destroyed
+    (0.60, 0.15),  # ~5 psi, residential buildings collapse
+    (1.70, 0.02),  # ~1 psi, broken windows and debris injuries
+)
+
+
+class InvalidMeteor(ValueError):
+    pass
+
+
+def _load_grid(path=GRID_PATH):
+    try:
+        with np.load(path) as data:
+            return data["density"], float(data["resolution"])
+    except FileNotFoundError:
+        print(f"⚠️  Population grid not found at {path}, casualty estimates will be 0")
+        return np.zeros((1, 1), dtype=np.uint16), 180.0
+
+
+POPULATION_DENSITY, GRID_RESOLUTION = _load_grid()
+
+
+def _normalize(value):
+    return str(value or "").upper().replace("-", "_")
+
+
+def speed_in_meters(speed):
+    # the map view sends km/s, the AI generated meteors use m/s
+    speed = float(speed)
+    return speed * 1000 if speed < 100 else speed
+
+
+def kinetic_energy(mass, speed):
+    return 0.5 * float(mass) * speed_in_meters(speed) ** 2
+
+
+def angle_coefficient(angle):
+    return max(0.3, math.sin(math.radians(float(angle))))
+
+
+def weather_coefficient(weather):
+    return WEATHER_COEFFICIENTS.get(_normalize(weather) or "CLEAR", 1.0)
+
+
+def radius_over_time(energy, angle_coef, weather_coef):
+    k = 0.1
+    return [
+        {"radius": k * energy ** (1 / 5) * t ** (2 / 5) * angle_coef * weather_coef, "time": t}
+        for t in RADIUS_TIMES_IN_SECONDS
+    ]
+
+
+def _grid_index(latitude, longitude):
+    rows, cols = POPULATION_DENSITY.shape
+    row = int((float(latitude) + 90) / GRID_RESOLUTION)
+    col = int(((float(longitude) + 180) % 360) / GRID_RESOLUTION)
+    return min(max(row, 0), rows - 1), min(col, cols - 1)
+
+
+def mean_density(latitude, longitude, radius_km):
+    # mean people/km^2 over grid cells whose centre lies within radius_km;
+    # falls back to the impact cell when the radius is smaller than a cell
+    row, col = _grid_index(latitude, longitude)
+    rows, cols = POPULATION_DENSITY.shape
+
+    cell_km = GRID_RESOLUTION * KM_PER_DEGREE
+    lat_cos = max(math.cos(math.radians(float(latitude))), 0.05)
+    reach_rows = int(radius_km / cell_km)
+    reach_cols = min(int(radius_km / (cell_km * lat_cos)), cols // 2)
+    if reach_rows == 0 and reach_cols == 0:
+        return float(POPULATION_DENSITY[row, col])
+
+    row_ids = np.arange(max(row - reach_rows, 0), min(row + reach_rows, rows - 1) + 1)
+    col_ids = np.arange(col - reach_cols, col + reach_cols + 1) % cols
+    dy = (row_ids - row)[:, None] * cell_km
+    dx = ((col_ids - col + cols // 2) % cols - cols // 2)[None, :] * cell_km * lat_cos
+    inside = dx ** 2 + dy ** 2 <= radius_km ** 2
+
+    window = POPULATION_DENSITY[np.ix_(row_ids, col_ids)]
+    return float(window[inside].mean())
+
+
+def _number(meteor_data, field, default):
+    try:
+        value = float(meteor_data.get(field, default))
+    except (TypeError, ValueError):
+        raise InvalidMeteor(f"{field} must be a number")
+    if not math.isfinite(value):
+        raise InvalidMeteor(f"{field} must be a finite number")
+    return value
+
+
+def validate_meteor(meteor_data):
+    # the formulas divide by and take roots of these, zero or negative values
+    # give division by zero or complex numbers
+    for field in ("mass", "speed", "diameter"):
+        if (field != "diameter" or field in meteor_data) and _number(meteor_data, field, 0) <= 0:
+            raise InvalidMeteor(f"{field} must be positive")
+    if not 0 <= _number(meteor_data, "angle", 90) <= 90:
+        raise InvalidMeteor("angle must be between 0 and 90 degrees")
+    if not -90 <= _number(meteor_data, "latitude", 0) <= 90:
+        raise InvalidMeteor("latitude must be between -90 and 90")
+    _number(meteor_data, "longitude", 0)
+
+
+def estimate_impact(meteor_data):
+    validate_meteor(meteor_data)
+    mass = float(meteor_data.get("mass", 0))
+    energy = kinetic_energy(mass, meteor_data.get("speed", 0))
+    angle_coef = angle_coefficient(meteor_data.get("angle", 90))
+    weather_coef = weather_coefficient(meteor_data.get("weather"))
+    coupling = GROUND_COUPLING.get(_normalize(meteor_data.get("type")), GROUND_COUPLING["STONY"])
+
+    base_crater_radius = 0.0015874 * energy ** (1 / 3) * angle_coef * weather_coef
+    yield_kt = energy * coupling * angle_coef / JOULES_PER_KILOTON
+    scale = yield_kt ** (1 / 3)
+
+    latitude = meteor_data.get("latitude", 0)
+    longitude = meteor_data.get("longitude", 0)
+    casualties = 0.0
+    inner_area = 0.0
+    blast_radii = []
+    for radius_per_kt, fatality in BLAST_ZONES:
+        radius_km = radius_per_kt * scale
+        area = math.pi * radius_km ** 2
+        casualties += fatality * mean_density(latitude, longitude, radius_km) * (area - inner_area)
+        inner_area = area
+        blast_radii.append(radius_km * 1000)
+
+    # bad weather slows evacuation of the outer zones
+    casualties = min(int(casualties / weather_coef), MAX_CASUALTIES)
+
+    return {
+        "casualties": casualties,
+        "kineticEnergy": energy,
+        "yieldKilotons": yield_kt,
+        "baseCraterRadius": base_crater_radius,
+        "craterDepth": 0.2 * base_crater_radius,
+        "angleCoefficient": angle_coef,
+        "weatherCoefficient": weather_coef,
+        "blastRadii": blast_radii,
+        "radiusOverTime": radius_over_time(energy, angle_coef, weather_coef),
+    }
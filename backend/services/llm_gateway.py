@@ -0,0 +1,169 @@
+import os
+import time
+
+from gevent import Timeout
+from gevent.event import AsyncResult
+from gevent.lock import BoundedSemaphore
+from gevent.threadpool import ThreadPool
+
+from services.metrics import record_gemini
+from services.tracing import span
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "5"))
+LLM_RESET_TIMEOUT = float(os.getenv("LLM_RESET_TIMEOUT", "30"))
+
+
+class LLMUnavailable(Exception):
+    pass
+
+
+class LLMTimeout(LLMUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive failures. Once
+    # `reset_timeout` has passed a single probe call is let through; its
+    # outcome closes the breaker again or keeps it open.
+
+    def __init__(self, failure_threshold=LLM_FAILURE_THRESHOLD, reset_timeout=LLM_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "half_open":
+            # re-arm so only this call probes the upstream
+            self.opened_at = time.monotonic()
+        return state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class LLMGateway:
+    # Runs the blocking model.generate_content call on a thread pool so the
+    # gevent loop keeps serving sockets, with a cap on calls in flight, a
+    # deadline per call, a circuit breaker and coalescing of identical prompts.
+
+    def __init__(self, model, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT, breaker=None):
+        self.model = model
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = BoundedSemaphore(max_concurrency)
+        self._pool = ThreadPool(max_concurrency)
+        self._in_flight = {}
+
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.coalesced = 0
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def generate(self, prompt, timeout=None):
+        if self.model is None:
+            raise LLMUnavailable("Gemini AI model not available")
+
+        pending = self._in_flight.get(prompt)
+        if pending is not None:
+            self.coalesced += 1
+            record_gemini("coalesced")
+            return pending.get()
+
+        if not self.breaker.allow():
+            self.rejected += 1
+            record_gemini("rejected")
+            raise LLMUnavailable("Gemini circuit breaker is open")
+
+        result = AsyncResult()
+        self._in_flight[prompt] = result
+        try:
+            text = self._call(prompt, timeout or self.timeout)
+        except Exception as e:
+            self.failures += 1
+            self.breaker.record_failure()
+            result.set_exception(e)
+            raise
+        else:
+            self.breaker.record_success()
+            result.set(text)
+            return text
+        finally:
+            del self._in_flight[prompt]
+
+    def _call(self, prompt, timeout):
+        with span("gemini.generate", prompt_chars=len(prompt)):
+            return self._call_with_slot(prompt, timeout)
+
+    def _call_with_slot(self, prompt, timeout):
+        deadline = time.monotonic() + timeout
+        if not self._semaphore.acquire(timeout=timeout):
+            self.timeouts += 1
+            record_gemini("no_slot")
+            raise LLMTimeout(f"No free Gemini slot within {timeout}s")
+        try:
+            self.calls += 1
+            started = time.monotonic()
+            remaining = max(deadline - started, 0.001)
+            job = self._pool.spawn(self._generate_blocking, prompt, remaining)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        # the slot is held until the thread is done, not until we stop
+        # waiting: a call that timed out still occupies the thread and the
+        # upstream request
+        job.rawlink(lambda _: self._semaphore.release())
+        try:
+            text, error = job.get(timeout=remaining)
+        except Timeout:
+            self.timeouts += 1
+            record_gemini("timeout", time.monotonic() - started)
+            raise LLMTimeout(f"Gemini call exceeded {timeout}s")
+
+        record_gemini("ok" if error is None else "error", time.monotonic() - started)
+        if error is not None:
+            raise error
+        return text
+
+    def _generate_blocking(self, prompt, timeout):
+        # errors are handed back to the greenlet instead of being raised in
+        # the worker thread, where gevent would only print them
+        try:
+            response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+            return response.text, None
+        except Exception as e:
+            return None, e
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "circuit": self.breaker.state,
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+        }
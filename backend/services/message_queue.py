@@ -0,0 +1,201 @@
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+# Socket.IO message queue shared by all gunicorn workers. Emits to a room are
+# published here and every worker delivers them to its own clients, so players
+# of one game may be connected to different workers.
+#
+#   redis://host:6379/0   Redis pub/sub (needs the redis package)
+#   local://127.0.0.1:6500  the small TCP broker below, for a single machine
+#
+# The same channel carries "room_changed" notices that make other workers
+# drop their cached copy of a room after this worker wrote it to Firestore.
+
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "flask-socketio")
+LOCAL_BROKER_PORT = 6500
+LOCAL_BROKER_BACKLOG = 10000
+MAX_BACKOFF = 60
+
+
+def parse_local_url(url):
+    parsed = urlparse(url)
+    return parsed.hostname or "127.0.0.1", parsed.port or LOCAL_BROKER_PORT
+
+
+class RoomSyncMixin:
+    # Adds room change notices on top of a PubSubManager. They never reach
+    # Socket.IO clients; on_room_changed(room_id) is called on every other
+    # worker instead.
+
+    on_room_changed = None
+
+    def publish_room_changed(self, room_id):
+        self._publish({"method": "room_changed", "room_id": room_id, "host_id": self.host_id})
+
+    def _listen(self):
+        for message in super()._listen():
+            data = message
+            if not isinstance(data, dict):
+                try:
+                    data = json.loads(message)
+                except (TypeError, ValueError):
+                    continue
+
+            if isinstance(data, dict) and data.get("method") == "room_changed":
+                if data.get("host_id") != self.host_id and self.on_room_changed is not None:
+                    self.on_room_changed(data.get("room_id"))
+                continue
+            yield data
+
+
+class LocalBrokerManager(socketio.PubSubManager):
+    # Client side of the local broker. Messages are JSON lines of
+    # {"channel": ..., "data": ...}; the broker hands every line to every
+    # connected worker, the sender included, like Redis does.
+
+    name = "local"
+
+    def __init__(self, url="local://127.0.0.1:6500", channel="socketio", write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.address = parse_local_url(url)
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _publish(self, data):
+        line = self.json.dumps({"channel": self.channel, "data": data}).encode() + b"\n"
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._sock = socket.create_connection(self.address)
+                    self._sock.sendall(line)
+                    return
+                except OSError as e:
+                    if self._sock is not None:
+                        self._sock.close()
+                    self._sock = None
+                    if attempt:
+                        self._get_logger().error(f"Cannot publish to local broker: {e}")
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            try:
+                with socket.create_connection(self.address) as sock:
+                    backoff = 1
+                    for line in sock.makefile("rb"):
+                        try:
+                            envelope = json.loads(line)
+                        except ValueError:
+                            continue
+                        if envelope.get("channel") == self.channel:
+                            yield envelope.get("data")
+            except OSError as e:
+                self._get_logger().error(f"Cannot receive from local broker, retrying in {backoff}s: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+class LocalManager(RoomSyncMixin, LocalBrokerManager):
+    pass
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        outbox = queue.Queue(maxsize=LOCAL_BROKER_BACKLOG)
+        self.server.subscribe(outbox)
+        writer = threading.Thread(target=self._write, args=(outbox,), daemon=True)
+        writer.start()
+        try:
+            for line in self.rfile:
+                self.server.publish(line)
+        except OSError:
+            pass
+        finally:
+            self.server.unsubscribe(outbox)
+            outbox.put(None)
+
+    def _write(self, outbox):
+        try:
+            while True:
+                line = outbox.get()
+                if line is None:
+                    break
+                self.wfile.write(line)
+            # dropped by the broker: closing makes the worker reconnect
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    # Fan-out broker for local:// queues: every line received from one
+    # connection is written to all of them. Each connection has its own
+    # outbox and writer thread, so one slow worker does not hold up the rest;
+    # a worker that falls LOCAL_BROKER_BACKLOG messages behind is dropped and
+    # reconnects.
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _BrokerHandler)
+        self._outboxes = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, outbox):
+        with self._lock:
+            self._outboxes.add(outbox)
+
+    def unsubscribe(self, outbox):
+        with self._lock:
+            self._outboxes.discard(outbox)
+
+    def publish(self, line):
+        with self._lock:
+            outboxes = list(self._outboxes)
+        for outbox in outboxes:
+            try:
+                outbox.put_nowait(line)
+            except queue.Full:
+                self.unsubscribe(outbox)
+                outbox.queue.clear()
+                outbox.put_nowait(None)
+
+
+class RedisManager(RoomSyncMixin, socketio.RedisManager):
+    pass
+
+
+class KombuManager(RoomSyncMixin, socketio.KombuManager):
+    pass
+
+
+def create_client_manager(url=None, channel=SOCKETIO_CHANNEL, write_only=False):
+    # read at call time: gunicorn.conf.py may set it in the master after
+    # this module was imported
+    url = url or os.getenv("SOCKETIO_MESSAGE_QUEUE")
+    if not url:
+        return None
+    if url.startswith("local://"):
+        return LocalManager(url, channel=channel, write_only=write_only)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisManager(url, channel=channel, write_only=write_only)
+    return KombuManager(url, channel=channel, write_only=write_only)
+
+
+if __name__ == "__main__":
+    # python -m services.message_queue [local://host:port]
+    url = sys.argv[1] if len(sys.argv) > 1 else os.getenv("SOCKETIO_MESSAGE_QUEUE", f"local://127.0.0.1:{LOCAL_BROKER_PORT}")
+    broker = LocalBroker(parse_local_url(url))
+    print(f"Local Socket.IO broker listening on {url}")
+    broker.serve_forever()
@@ -0,0 +1,133 @@
+import os
+import time
+from collections import deque
+
+import gevent
+from gevent.event import Event
+from gevent.queue import Queue, Empty, Full
+
+METEOR_POOL_SIZE = int(os.getenv("METEOR_POOL_SIZE", "20"))
+METEOR_POOL_LOW_WATER = int(os.getenv("METEOR_POOL_LOW_WATER", str(METEOR_POOL_SIZE // 2)))
+MAX_BACKOFF = 60
+# failed refills in a row (errors or rejected meteors) before pausing
+MAX_FAILURES = int(os.getenv("METEOR_POOL_MAX_FAILURES", "5"))
+FAILURE_PAUSE = float(os.getenv("METEOR_POOL_FAILURE_PAUSE", "300"))
+
+
+class MeteorPool:
+    # Bounded queue of pre-validated AI meteors. A background greenlet tops
+    # it up to `high_water` whenever it drops to `low_water`, so callers pop
+    # a ready meteor instead of waiting on Gemini. app.py starts the greenlet
+    # at startup, pop() would otherwise. Every failed refill, an error or a
+    # rejected meteor, doubles the wait before the next Gemini call, and
+    # after max_failures in a row the refill pauses, so bad model output
+    # cannot turn into a tight loop of paid calls.
+
+    def __init__(self, produce, validate, high_water=METEOR_POOL_SIZE, low_water=METEOR_POOL_LOW_WATER, enabled=True,
+                 backoff=1, max_failures=MAX_FAILURES, pause=FAILURE_PAUSE):
+        self.produce = produce
+        self.validate = validate
+        self.backoff = backoff
+        self.max_failures = max_failures
+        self.pause = pause
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self.enabled = enabled and high_water > 0
+        self._queue = Queue(maxsize=max(high_water, 1))
+        self._wake = Event()
+        self._refiller = None
+
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = 0
+        self.popped = 0
+        self.drained = 0
+        self.failures = 0
+        self.pauses = 0
+        self._produced_at = deque(maxlen=100)
+
+    def start(self):
+        if self.enabled and self._refiller is None:
+            self._refiller = gevent.spawn(self._refill_loop)
+
+    def pop(self):
+        self.start()
+        try:
+            meteor = self._queue.get_nowait()
+        except Empty:
+            self.drained += 1
+            return None
+
+        self.popped += 1
+        if self._queue.qsize() <= self.low_water:
+            self._wake.set()
+        return meteor
+
+    def _failed(self, reason):
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            print(f"⚠️  Meteor pool paused for {self.pause}s after {self.failures} failed refills: {reason}")
+            self.failures = 0
+            self.pauses += 1
+            gevent.sleep(self.pause)
+            return
+        delay = min(self.backoff * 2 ** (self.failures - 1), MAX_BACKOFF)
+        print(f"Meteor pool refill failed, retrying in {delay}s: {reason}")
+        gevent.sleep(delay)
+
+    def _refill_loop(self):
+        while True:
+            if self._queue.qsize() >= self.high_water:
+                self._wake.clear()
+                self._wake.wait()
+                continue
+
+            try:
+                meteor = self.produce()
+            except ValueError as e:
+                # malformed model output counts as a rejected meteor
+                self.rejected += 1
+                self._failed(f"malformed meteor: {e}")
+                continue
+            except Exception as e:
+                self.errors += 1
+                self._failed(e)
+                continue
+
+            if not self.validate(meteor):
+                self.rejected += 1
+                self._failed("meteor failed validation")
+                continue
+            self.failures = 0
+
+            try:
+                self._queue.put_nowait(meteor)
+            except Full:
+                continue
+            self.accepted += 1
+            self._produced_at.append(time.monotonic())
+
+    def refill_rate(self):
+        # meteors per second over the most recent refills
+        if len(self._produced_at) < 2:
+            return 0.0
+        elapsed = self._produced_at[-1] - self._produced_at[0]
+        return (len(self._produced_at) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        generated = self.accepted + self.rejected
+        return {
+            "enabled": self.enabled,
+            "depth": self._queue.qsize(),
+            "high_water": self.high_water,
+            "low_water": self.low_water,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "reject_rate": self.rejected / generated if generated else 0.0,
+            "errors": self.errors,
+            "failures": self.failures,
+            "pauses": self.pauses,
+            "popped": self.popped,
+            "drained": self.drained,
+            "refill_rate": self.refill_rate(),
+        }
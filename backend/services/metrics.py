@@ -0,0 +1,386 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import math
+import time
+
+from services.tracing import TRACER, span, tag_handler, tag_document
+
+# In-process metrics rendered in the Prometheus text format by /metrics.
+#
+# Recording is a dict lookup and a few integer additions, without locks:
+# every handler, Firestore call and Gemini wait runs in a greenlet on the
+# worker's one event loop thread (bcrypt and Gemini threads never record).
+# With several gunicorn workers each worker has its own numbers; every
+# sample carries a worker label so scrapes of different workers can be
+# summed.
+#
+# The handler that is running is kept in a context variable, so Firestore
+# and Gemini calls are counted per handler; writes flushed later by
+# RoomRegistry show up as "background".
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+current_handler = contextvars.ContextVar("metrics_handler", default="background")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(int(value))
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield "", values, (), child.value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                yield "_bucket", values, (("le", _number(float(bound))),), cumulative
+            yield "_sum", values, (), child.sum
+            yield "_count", values, (), child.count
+
+
+class Registry:
+    def __init__(self, prefix="meteorx"):
+        self.prefix = prefix
+        self.worker = None
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        metric.name = f"{self.prefix}_{metric.name}"
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collect_stats(self, component, stats):
+        # exposes a stats() dict as gauges at scrape time: numbers as they
+        # are, strings as {key="value"} 1, nested dicts flattened
+        self._collectors.append((component, stats))
+
+    def _stats_metrics(self):
+        for component, stats in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error collecting {component} metrics: {str(e)}")
+                continue
+            for key, value in _flatten(values):
+                name = f"{self.prefix}_{component}_{key}"
+                metric = Gauge(name, f"{component} stats: {key}", (key,) if isinstance(value, str) else ())
+                if isinstance(value, str):
+                    metric.labels(value).value = 1
+                elif isinstance(value, (int, float)):
+                    metric.labels().value = value
+                else:
+                    continue
+                yield metric
+
+    def render(self):
+        extra = (("worker", self.worker),) if self.worker is not None else ()
+        lines = []
+        for metric in list(self._metrics) + list(self._stats_metrics()):
+            if not metric._children:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, values, more, value in metric.samples():
+                labels = _labels(metric.labelnames, values, tuple(more) + extra)
+                lines.append(f"{metric.name}{suffix}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(values, prefix=""):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        elif value is not None:
+            yield f"{prefix}{key}", value
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram("handler_seconds", "Handler latency", ("kind", "handler"))
+HANDLER_ERRORS = REGISTRY.counter("handler_errors_total", "Handlers that raised or answered 5xx", ("kind", "handler"))
+HANDLER_IN_FLIGHT = REGISTRY.gauge("handler_in_flight", "Handlers running right now", ("kind", "handler"))
+
+FIRESTORE_SECONDS = REGISTRY.histogram("firestore_seconds", "Firestore call latency", ("op",))
+FIRESTORE_DOCUMENTS = REGISTRY.counter(
+    "firestore_documents_total", "Firestore documents read or written", ("handler", "kind")
+)
+
+GEMINI_SECONDS = REGISTRY.histogram("gemini_seconds", "Gemini call latency", ("outcome",))
+GEMINI_CALLS = REGISTRY.counter("gemini_calls_total", "Gemini calls", ("handler", "outcome"))
+
+
+def _status(result):
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        return result[1]
+    return getattr(result, "status_code", 200)
+
+
+def timed(kind, name):
+    # records latency, errors and in-flight count of a route or socket handler
+    def decorate(fn):
+        seconds = HANDLER_SECONDS.labels(kind, name)
+        errors = HANDLER_ERRORS.labels(kind, name)
+        in_flight = HANDLER_IN_FLIGHT.labels(kind, name)
+        # Socket.IO probes handlers with optional arguments (the disconnect
+        # reason, the connect auth) and retries on TypeError; those probes
+        # must fail the same way without being recorded
+        code = fn.__code__
+        max_args = float("inf") if code.co_flags & inspect.CO_VARARGS else code.co_argcount
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if len(args) > max_args:
+                return fn(*args, **kwargs)
+            token = current_handler.set(name)
+            in_flight.value += 1
+            start = time.perf_counter()
+            try:
+                with span(f"{kind} {name}") as current:
+                    tag_handler(current, name, args, kwargs)
+                    result = fn(*args, **kwargs)
+                if kind == "http" and _status(result) >= 500:
+                    errors.value += 1
+                return result
+            except Exception:
+                errors.value += 1
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - start)
+                in_flight.value -= 1
+                current_handler.reset(token)
+        return wrapper
+    return decorate
+
+
+def count_documents(kind, amount=1):
+    FIRESTORE_DOCUMENTS.labels(current_handler.get(), kind).value += amount
+
+
+def record_gemini(outcome, seconds=None):
+    GEMINI_CALLS.labels(current_handler.get(), outcome).value += 1
+    if seconds is not None:
+        GEMINI_SECONDS.labels(outcome).observe(seconds)
+
+
+# Firestore client wrapper. Reads are counted per document returned (a get
+# of a missing document is still one read), writes per document written.
+
+def _unwrap(ref):
+    return getattr(ref, "_target", ref)
+
+
+class _Proxy:
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def _timed(self, op, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with span(f"firestore.{op}") as current:
+                tag_document(current, getattr(self._target, "path", None))
+                return fn(*args, **kwargs)
+        finally:
+            FIRESTORE_SECONDS.labels(op).observe(time.perf_counter() - start)
+
+
+class _Query(_Proxy):
+    def where(self, *args, **kwargs):
+        return _Query(self._target.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return _Query(self._target.order_by(*args, **kwargs))
+
+    def limit(self, count):
+        return _Query(self._target.limit(count))
+
+    def start_after(self, document):
+        return _Query(self._target.start_after(document))
+
+    def stream(self, *args, **kwargs):
+        start_ns = time.time_ns()
+        start = time.perf_counter()
+        read = 0
+        try:
+            for doc in self._target.stream(*args, **kwargs):
+                read += 1
+                yield doc
+        finally:
+            elapsed = time.perf_counter() - start
+            FIRESTORE_SECONDS.labels("query").observe(elapsed)
+            count_documents("read", max(read, 1))
+            TRACER.record("firestore.query", start_ns, elapsed, documents=read)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+
+class _Collection(_Query):
+    def document(self, *args):
+        return _Document(self._target.document(*args))
+
+
+class _Document(_Proxy):
+    def get(self, *args, **kwargs):
+        count_documents("read")
+        return self._timed("get", self._target.get, *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        count_documents("write")
+        return self._timed("set", self._target.set, *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        count_documents("write")
+        return self._timed("update", self._target.update, *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        count_documents("write")
+        return self._timed("create", self._target.create, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        count_documents("write")
+        return self._timed("delete", self._target.delete, *args, **kwargs)
+
+    def collection(self, name):
+        return _Collection(self._target.collection(name))
+
+
+class _Batch(_Proxy):
+    def __init__(self, target):
+        super().__init__(target)
+        self._writes = 0
+
+    def _add(self, method, ref, *args, **kwargs):
+        self._writes += 1
+        return getattr(self._target, method)(_unwrap(ref), *args, **kwargs)
+
+    def create(self, ref, *args, **kwargs):
+        return self._add("create", ref, *args, **kwargs)
+
+    def set(self, ref, *args, **kwargs):
+        return self._add("set", ref, *args, **kwargs)
+
+    def update(self, ref, *args, **kwargs):
+        return self._add("update", ref, *args, **kwargs)
+
+    def delete(self, ref, *args, **kwargs):
+        return self._add("delete", ref, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        result = self._timed("commit", self._target.commit, *args, **kwargs)
+        count_documents("write", self._writes)
+        return result
+
+
+class InstrumentedFirestore(_Proxy):
+    def collection(self, name):
+        return _Collection(self._target.collection(name))
+
+    def batch(self):
+        return _Batch(self._target.batch())
+
+    def get_all(self, references, *args, **kwargs):
+        docs = self._timed("get_all", lambda: list(self._target.get_all([_unwrap(ref) for ref in references], *args, **kwargs)))
+        count_documents("read", len(docs))
+        return docs
+
+
+def instrument_firestore(db):
+    return InstrumentedFirestore(db) if db is not None else None
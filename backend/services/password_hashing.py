@@ -0,0 +1,73 @@
+import os
+
+import bcrypt
+from gevent.threadpool import ThreadPool
+
+from services.tracing import span
+
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "16"))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # bcrypt takes a few hundred ms of CPU per call. It releases the GIL, so
+    # running it on a small thread pool keeps the gevent loop (and every
+    # socket on it) responsive. Calls beyond `max_pending` waiting or running
+    # fail fast with HasherBusy instead of queueing up behind each other.
+
+    def __init__(self, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING):
+        self.max_pending = max_pending
+        self._pool = ThreadPool(workers)
+        self.pending = 0
+
+        self.hashed = 0
+        self.checked = 0
+        self.rejected = 0
+
+    def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy("Too many logins in progress")
+
+        self.pending += 1
+        try:
+            result, error = self._pool.spawn(self._call, fn, *args).get()
+        finally:
+            self.pending -= 1
+        if error is not None:
+            raise error
+        return result
+
+    @staticmethod
+    def _call(fn, *args):
+        # errors go back to the greenlet, gevent would only print them here
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, e
+
+    def hash(self, password):
+        with span("bcrypt.hash"):
+            hashed = self._run(lambda: bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()))
+        self.hashed += 1
+        return hashed.decode()
+
+    def check(self, password, hashed):
+        with span("bcrypt.check"):
+            ok = self._run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+        self.checked += 1
+        return ok
+
+    def stats(self):
+        return {
+            "workers": self._pool.maxsize,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "hashed": self.hashed,
+            "checked": self.checked,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,397 @@
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import gevent
+
+from services.storage import field_value, set_field
+
+# how long dirty rooms may sit in memory before they are written to the store
+FLUSH_DELAY = float(os.getenv("ROOM_FLUSH_DELAY", "0.5"))
+# failed writes are retried after FLUSH_RETRY_DELAY, doubling per failed flush
+# up to FLUSH_RETRY_MAX seconds
+FLUSH_RETRY_DELAY = float(os.getenv("ROOM_FLUSH_RETRY_DELAY", "0.5"))
+FLUSH_RETRY_MAX = float(os.getenv("ROOM_FLUSH_RETRY_MAX", "30"))
+CODE_ATTEMPTS = 20
+# tries of mutate() before giving up on a room other workers keep changing
+MUTATE_ATTEMPTS = 5
+
+# seconds after createdAt a room is reaped, by status
+ROOM_TTLS = {
+    "waiting": float(os.getenv("ROOM_TTL_WAITING", "7200")),
+    "game_waiting": float(os.getenv("ROOM_TTL_GAME_WAITING", "7200")),
+    "playing": float(os.getenv("ROOM_TTL_PLAYING", "21600")),
+    "ended": float(os.getenv("ROOM_TTL_ENDED", "1800")),
+}
+ROOM_REAP_INTERVAL = float(os.getenv("ROOM_REAP_INTERVAL", "300"))
+# copy reaped rooms to rooms_archive/{id} before deleting them
+ROOM_ARCHIVE = os.getenv("ROOM_ARCHIVE", "0") == "1"
+# rooms per page and batched delete; each takes up to 3 of Firestore's 500 writes
+REAP_BATCH = 150
+
+
+class Room:
+    def __init__(self, room_id, data):
+        self.id = room_id
+        self.data = data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def field(self, path):
+        # value for a field path such as "game_state.hp"
+        return field_value(self.data, path)
+
+    def set(self, path, value):
+        set_field(self.data, path, value)
+
+
+class RoomRegistry:
+    # Process-local, authoritative copy of every room touched by this worker.
+    # Handlers read and mutate Room.data in memory and call save() with the
+    # changed field paths; those are written to the store (services/storage.py)
+    # in the background. Room codes are indexed both here and in the store.
+    #
+    # With several workers, `publish(room_id)` is called after each write so
+    # the other workers invalidate() their copy and reload it from the store.
+    # Writes then go out on the next loop iteration instead of after
+    # flush_delay, so the window in which another worker reads a stale room
+    # stays small.
+
+    def __init__(self, store, flush_delay=FLUSH_DELAY, publish=None):
+        self.store = store
+        self.publish = publish
+        self.flush_delay = 0 if publish else flush_delay
+        self.rooms = {}
+        self.codes = {}
+        self._dirty = {}
+        self._deleted = {}
+        self._stale = set()
+        self._flush_scheduled = None
+        self._failures = 0
+
+    def _add(self, room):
+        self.rooms[room.id] = room
+        code = room.get("code")
+        if code:
+            self.codes[code] = room.id
+        return room
+
+    def _forget(self, room_id):
+        room = self.rooms.pop(room_id, None)
+        code = room.get("code") if room else None
+        if code and self.codes.get(code) == room_id:
+            del self.codes[code]
+        return code
+
+    def get(self, room_id):
+        room = self.rooms.get(room_id)
+        if room is not None or room_id in self._deleted or self.store is None:
+            return room
+
+        data = self.store.load(room_id)
+        if data is None:
+            return None
+        # another greenlet may have loaded the room while we were waiting
+        if room_id in self.rooms:
+            return self.rooms[room_id]
+        return self._add(Room(room_id, data))
+
+    def create(self, room_id, data, new_code):
+        # the store writes the room and reserves its code together, and
+        # refuses codes another worker already took
+        for _ in range(CODE_ATTEMPTS):
+            code = new_code()
+            if code in self.codes:
+                continue
+            data["code"] = code
+
+            if self.store is not None and not self.store.create(room_id, data, code):
+                continue
+
+            return self._add(Room(room_id, data))
+
+        raise Exception("No free room code available")
+
+    def save(self, room, *fields):
+        if room.id not in self.rooms:
+            return
+        self._dirty.setdefault(room.id, set()).update(fields)
+        self._schedule_flush()
+
+    def delete(self, room_id):
+        self._dirty.pop(room_id, None)
+        self._stale.discard(room_id)
+        code = self._forget(room_id)
+        if self.store is not None:
+            self._deleted[room_id] = code
+            self._schedule_flush()
+
+    def compare_and_set(self, room, path, expected, updates):
+        # Applies `updates` (field path -> value) only while `path` still
+        # holds `expected`. With one worker the in-memory room decides. With
+        # several, our copy may not have seen another worker's change yet, so
+        # only the store's check counts (a Firestore or SQLite transaction),
+        # and a room that lost the race is reloaded.
+        if room.id not in self.rooms:
+            return False
+
+        if self.publish is not None and self.store is not None:
+            applied, current = self.store.compare_and_set(room.id, path, expected, updates)
+            if not applied:
+                if current is not None:
+                    room.data = current
+                else:
+                    self._forget(room.id)
+                return False
+        elif room.field(path) != expected:
+            return False
+
+        for field, value in updates.items():
+            room.set(field, value)
+        if self.publish is not None and self.store is not None:
+            self._notify(room.id)
+        else:
+            self.save(room, *updates)
+        return True
+
+    def mutate(self, room, change):
+        # Read-modify-write that holds up across workers. change(room) reads
+        # room.data without modifying it and returns the field updates to
+        # make, or None for none. They are written together with version + 1,
+        # only while the room still has the version change() saw; when
+        # another worker got there first, compare_and_set reloads the room
+        # and change() runs again. Returns the updates written, or None.
+        for _ in range(MUTATE_ATTEMPTS):
+            if room.id not in self.rooms:
+                return None
+            updates = change(room)
+            if updates is None:
+                return None
+            # rooms written before versions existed have none, the store
+            # compares against the missing field as None
+            version = room.get("version")
+            updates = {**updates, "version": (version or 0) + 1}
+            if self.compare_and_set(room, "version", version, updates):
+                return updates
+        raise Exception("Room is changing too fast, try again")
+
+    def refresh(self, room):
+        # Rereads a room shared with other workers from the store, for when
+        # a request suggests our copy is behind the invalidate notices. Rooms
+        # with writes still pending here are kept as they are. False if the
+        # room is gone.
+        if self.publish is None or self.store is None or room.id in self._dirty:
+            return room.id in self.rooms
+        data = self.store.load(room.id)
+        if data is None:
+            self._forget(room.id)
+            return False
+        room.data = data
+        return True
+
+    def invalidate(self, room_id):
+        # another worker changed the room; keep our copy only until our own
+        # pending writes are flushed
+        if room_id in self._dirty:
+            self._stale.add(room_id)
+        elif room_id not in self._deleted:
+            self._forget(room_id)
+
+    def find_by_code(self, code, statuses=None):
+        room_id = self.codes.get(code)
+        if room_id is None and self.store is not None:
+            room_id = self.store.room_for_code(code)
+
+        room = self.get(room_id) if room_id else None
+        if room is None or room.get("code") != code:
+            return None
+        if statuses is not None and room.get("status") not in statuses:
+            return None
+        return room
+
+    def evict(self, room_id):
+        # drops the room from memory, pending writes included, after it was
+        # removed from the store by someone else than delete()
+        self._dirty.pop(room_id, None)
+        self._deleted.pop(room_id, None)
+        self._stale.discard(room_id)
+        self._forget(room_id)
+
+    def _schedule_flush(self, delay=None):
+        if self._flush_scheduled is None and self.store is not None:
+            delay = self.flush_delay if delay is None else delay
+            self._flush_scheduled = gevent.spawn_later(delay, self.flush)
+
+    def flush(self):
+        self._flush_scheduled = None
+
+        failed = self._write_pending()
+        if failed:
+            # back off while the store keeps failing, new saves wait as well
+            self._failures += 1
+            delay = min(max(self.flush_delay, FLUSH_RETRY_DELAY) * 2 ** (self._failures - 1), FLUSH_RETRY_MAX)
+            print(f"⚠️  {failed} room writes failed, retrying in {delay:.1f}s")
+            self._schedule_flush(delay)
+        else:
+            self._failures = 0
+            if self._dirty or self._deleted:
+                self._schedule_flush()
+
+    def close(self):
+        # last write of pending changes when the worker exits; what fails now
+        # is only logged
+        if self._flush_scheduled is not None:
+            self._flush_scheduled.kill(block=False)
+            self._flush_scheduled = None
+        if self.store is not None and (self._dirty or self._deleted):
+            self._write_pending()
+
+    def _write_pending(self):
+        # writes dirty fields and deletions, failed ones are queued again;
+        # returns how many failed
+        failed = 0
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, {}
+
+        for room_id, fields in dirty.items():
+            room = self.rooms.get(room_id)
+            if room is None:
+                continue
+            # "game_state" already covers "game_state.hp"
+            fields = {
+                field for field in fields
+                if not any(field.startswith(parent + ".") for parent in fields)
+            }
+            try:
+                self.store.update(room_id, {field: room.field(field) for field in fields})
+            except KeyError:
+                # deleted by another worker or the reaper, retrying cannot help
+                print(f"⚠️  Room {room_id} no longer exists, dropping its changes")
+                self._dirty.pop(room_id, None)
+                self._stale.discard(room_id)
+                self._forget(room_id)
+                continue
+            except Exception as e:
+                print(f"Error saving room {room_id}: {str(e)}")
+                self._dirty.setdefault(room_id, set()).update(fields)
+                failed += 1
+                continue
+
+            if room_id in self._stale and room_id not in self._dirty:
+                self._stale.discard(room_id)
+                self._forget(room_id)
+            self._notify(room_id)
+
+        for room_id, code in deleted.items():
+            try:
+                self.store.delete(room_id, code)
+            except Exception as e:
+                print(f"Error deleting room {room_id}: {str(e)}")
+                self._deleted[room_id] = code
+                failed += 1
+                continue
+            self._notify(room_id)
+
+        return failed
+
+    def stats(self):
+        return {
+            "cached": len(self.rooms),
+            "dirty": len(self._dirty),
+            "deleting": len(self._deleted),
+            "stale": len(self._stale),
+        }
+
+    def _notify(self, room_id):
+        if self.publish is None:
+            return
+        try:
+            self.publish(room_id)
+        except Exception as e:
+            print(f"Error publishing change of room {room_id}: {str(e)}")
+
+
+class RoomReaper:
+    # Deletes rooms older than their status' TTL in batches, together with
+    # their code reservation, and optionally archives them first. The store
+    # only filters on createdAt (a single-field index in Firestore), the
+    # status check is done here so no composite index is needed. Every worker
+    # may run one; deleting an already deleted room is a no-op.
+
+    def __init__(self, registry, ttls=ROOM_TTLS, interval=ROOM_REAP_INTERVAL,
+                 archive=ROOM_ARCHIVE, batch_size=REAP_BATCH, on_reaped=None):
+        self.registry = registry
+        self.ttls = ttls
+        self.interval = interval
+        self.archive = archive
+        self.batch_size = batch_size
+        self.on_reaped = on_reaped
+        self._loop = None
+
+        self.runs = 0
+        self.reaped = 0
+        self.errors = 0
+        self.last_run = None
+
+    def start(self):
+        if self._loop is None and self.registry.store is not None and self.interval > 0:
+            self._loop = gevent.spawn(self._reap_loop)
+
+    def _reap_loop(self):
+        while True:
+            # spread the workers out
+            gevent.sleep(self.interval * random.uniform(0.8, 1.2))
+            try:
+                self.reap()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error reaping rooms: {str(e)}")
+
+    def _expired(self, status, created_at, now):
+        ttl = self.ttls.get(status, max(self.ttls.values()))
+        return isinstance(created_at, datetime) and created_at < now - timedelta(seconds=ttl)
+
+    def reap(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=min(self.ttls.values()))
+
+        reaped = 0
+        for page in self.registry.store.created_before(cutoff, self.batch_size):
+            expired = []
+            for room_id, data in page:
+                # our copy may be ahead of the store
+                room = self.registry.rooms.get(room_id)
+                status = room.get("status") if room is not None else data.get("status")
+                if self._expired(status, data.get("createdAt"), now):
+                    expired.append((room_id, data))
+
+            if expired:
+                self._delete(expired)
+                reaped += len(expired)
+
+        self.runs += 1
+        self.reaped += reaped
+        self.last_run = time.time()
+        return reaped
+
+    def _delete(self, expired):
+        self.registry.store.delete_rooms(expired, self.archive)
+
+        for room_id, _ in expired:
+            self.registry.evict(room_id)
+            self.registry._notify(room_id)
+            if self.on_reaped is not None:
+                self.on_reaped(room_id)
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "ttls": self.ttls,
+            "archive": self.archive,
+            "runs": self.runs,
+            "reaped": self.reaped,
+            "errors": self.errors,
+            "last_run": self.last_run,
+        }
@@ -0,0 +1,188 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+from services.scenarios import (
+    SCENARIO_COUNT,
+    SCENARIO_TABLE,
+    COMPOSITIONS,
+    SPEED_BANDS,
+    DISTANCE_BANDS,
+    WEIGHT_BANDS,
+    ANGLE_BANDS,
+)
+
+# The canonical scenario rows of data/scenarios.csv (written by
+# data/generate_scenarios.py), converted once into a columnar binary file
+# that is memory-mapped instead of parsed. All workers map the same file, so
+# the pages are shared.
+#
+# Layout: MAGIC, uint32 header length, JSON header, then one 64-byte aligned
+# array per column. Rows are sorted by scenario id and the "offsets" column
+# is the block index: scenario s owns rows offsets[s]:offsets[s + 1].
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
+CSV_PATH = os.path.join(DATA_DIR, 'scenarios.csv')
+DATASET_PATH = os.getenv("SCENARIO_DATASET_PATH", os.path.join(DATA_DIR, 'scenarios.bin'))
+
+MAGIC = b"MXSCEN01"
+ALIGN = 64
+COLUMNS = (
+    ("speed", np.uint8),
+    ("composition", np.uint8),
+    ("distance", np.uint32),
+    ("weight", np.uint16),
+    ("angle", np.uint8),
+)
+
+
+def _band(value, bands):
+    for index, (low, high) in enumerate(bands):
+        if low <= value <= high:
+            return index
+    raise ValueError(f"{value} is outside every band")
+
+
+# (speed, composition, distance, weight, angle band) -> scenario id; the
+# band combination of every scenario is unique
+_SCENARIO_BY_BANDS = {
+    (row.speed, row.composition, row.distance, row.weight, row.angle): scenario_id
+    for scenario_id, row in enumerate(SCENARIO_TABLE) if row is not None
+}
+
+
+def read_csv(csv_path=CSV_PATH):
+    # column arrays sorted by scenario id, plus the block index
+    scenario_ids, values = [], {name: [] for name, _ in COLUMNS}
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f, delimiter=";")
+        next(reader)
+        for line, (_, speed, composition, distance, weight, angle) in enumerate(reader, start=2):
+            speed, distance, weight, angle = int(speed), int(distance), int(weight), int(angle)
+            key = (
+                SPEED_BANDS[_band(speed, SPEED_BANDS)], composition,
+                DISTANCE_BANDS[_band(distance, DISTANCE_BANDS)],
+                WEIGHT_BANDS[_band(weight, WEIGHT_BANDS)],
+                ANGLE_BANDS[_band(angle, ANGLE_BANDS)],
+            )
+            if key not in _SCENARIO_BY_BANDS:
+                raise ValueError(f"{csv_path}:{line} does not match any scenario")
+            scenario_ids.append(_SCENARIO_BY_BANDS[key])
+            values["speed"].append(speed)
+            values["composition"].append(COMPOSITIONS.index(composition))
+            values["distance"].append(distance)
+            values["weight"].append(weight)
+            values["angle"].append(angle)
+
+    scenario_ids = np.array(scenario_ids, dtype=np.int64)
+    order = np.argsort(scenario_ids, kind="stable")
+    columns = {name: np.array(values[name], dtype=dtype)[order] for name, dtype in COLUMNS}
+    counts = np.bincount(scenario_ids, minlength=SCENARIO_COUNT + 1)
+    columns["offsets"] = np.concatenate(([0], np.cumsum(counts))).astype(np.uint32)
+    return columns
+
+
+def layout(rows):
+    # file header and {column: [dtype, offset, length]} for a dataset of `rows` rows
+    dtypes = dict(COLUMNS, offsets=np.uint32)
+    lengths = {name: rows for name in dtypes}
+    lengths["offsets"] = SCENARIO_COUNT + 2
+    header = {"rows": rows, "scenarios": SCENARIO_COUNT, "columns": {}}
+
+    # offsets depend on the header length, which depends on the offsets
+    header_size = 0
+    while True:
+        offset = len(MAGIC) + 4 + header_size
+        for name, dtype in dtypes.items():
+            offset += -offset % ALIGN
+            header["columns"][name] = [np.dtype(dtype).str, offset, lengths[name]]
+            offset += lengths[name] * np.dtype(dtype).itemsize
+        encoded = json.dumps(header).encode()
+        if len(encoded) == header_size:
+            break
+        header_size = len(encoded)
+    return MAGIC + np.uint32(len(encoded)).tobytes() + encoded, header["columns"]
+
+
+def convert(csv_path=CSV_PATH, out_path=DATASET_PATH):
+    columns = read_csv(csv_path)
+    rows = len(columns["speed"])
+    header, placement = layout(rows)
+
+    # written next to the target and renamed, workers may race to build it
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for name, values in columns.items():
+            f.write(b"\0" * (placement[name][1] - f.tell()))
+            f.write(values.tobytes())
+    os.replace(tmp_path, out_path)
+    return rows
+
+
+class ScenarioDataset:
+    def __init__(self, columns):
+        self.columns = columns
+        self.offsets = columns["offsets"]
+        self.rows = len(columns["speed"])
+        self.scenario_ids = np.flatnonzero(np.diff(self.offsets.astype(np.int64)))
+
+    @classmethod
+    def open(cls, path=DATASET_PATH):
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a scenario dataset")
+        header_size = int(buffer[len(MAGIC):len(MAGIC) + 4].view(np.uint32)[0])
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(buffer[start:start + header_size]))
+
+        columns = {}
+        for name, (dtype, offset, length) in header["columns"].items():
+            dtype = np.dtype(dtype)
+            columns[name] = buffer[offset:offset + length * dtype.itemsize].view(dtype)
+        return cls(columns)
+
+    def block(self, scenario_id):
+        # column views of the rows of one scenario, no copies
+        start, end = self.offsets[scenario_id], self.offsets[scenario_id + 1]
+        return {name: self.columns[name][start:end] for name, _ in COLUMNS}
+
+    def _columns(self, rows, scenario_ids):
+        # same layout as scenarios.generate_scenarios()
+        columns = {"generated_scenario": scenario_ids.astype(np.int64)}
+        for name, _ in COLUMNS:
+            columns[name] = self.columns[name][rows].astype(np.int64)
+        return columns
+
+    def scenario(self, scenario_id):
+        if not 1 <= scenario_id <= SCENARIO_COUNT:
+            raise IndexError(scenario_id)
+        start, end = int(self.offsets[scenario_id]), int(self.offsets[scenario_id + 1])
+        return self._columns(np.arange(start, end), np.full(end - start, scenario_id))
+
+    def sample(self, count, rng=None):
+        # a uniform scenario, then a uniform canonical row of it
+        if rng is None:
+            rng = np.random.default_rng()
+        ids = self.scenario_ids[rng.integers(0, len(self.scenario_ids), size=count)]
+        starts = self.offsets[ids].astype(np.int64)
+        sizes = self.offsets[ids + 1].astype(np.int64) - starts
+        return self._columns(starts + rng.integers(0, sizes), ids)
+
+
+def load_dataset(path=DATASET_PATH, csv_path=CSV_PATH):
+    try:
+        # rebuilt when the CSV changes; a shipped .bin works without the CSV
+        if not os.path.exists(path) or (os.path.exists(csv_path) and os.path.getmtime(path) < os.path.getmtime(csv_path)):
+            print(f"Converting {csv_path} to {path}")
+            convert(csv_path, path)
+        return ScenarioDataset.open(path)
+    except FileNotFoundError:
+        print(f"⚠️  Scenario dataset not found at {csv_path}, canonical scenarios disabled")
+        return None
+    except (OSError, ValueError) as e:
+        # read-only checkout or a broken file: parse the CSV into memory
+        print(f"⚠️  Could not map scenario dataset {path} ({e}), reading the CSV instead")
+        return ScenarioDataset(read_csv(csv_path))
@@ -0,0 +1,207 @@
+import random
+from collections import namedtuple
+
+import numpy as np
+
+SCENARIO_COUNT = 360
+
+CARDS = ("IGNORE", "EVACUATION", "BUNKER", "ROCKET")
+COMPOSITIONS = ("ICE", "ICE_STONE", "STONE", "STONE_IRON", "IRON")
+
+# inclusive (low, high) bounds for every band of every axis
+SPEED_BANDS = ((10, 30), (31, 50), (51, 70))
+DISTANCE_BANDS = ((20, 1000), (1001, 4000), (100000000, 300000000))
+WEIGHT_BANDS = ((1, 20000), (20001, 40000), (40001, 60000))
+ANGLE_BANDS = ((1, 30), (31, 60), (61, 90))
+
+# Scenarios come in blocks of 24 that share speed band and composition.
+# Inside a block the distance band, weight band and correct card depend only
+# on the position in the block, the angle band on scenario % 3.
+DISTANCE_IN_BLOCK = "000000000111111111222222"
+WEIGHT_IN_BLOCK = "000111222000111222111222"
+
+# correct card per scenario, one row per block: I=IGNORE E=EVACUATION B=BUNKER R=ROCKET
+CORRECT_CARDS = (
+    "IIIIIIBBBIIIIIIBBBIIIEEE"  # speed 10-30
+    "IIIIIIBBBIIIIIIBBBIIIEEE"
+    "IIIIBBBBBIIIIBBBBBEEEEEE"
+    "IIIIBBRRRIIIIBBBBBEEEEEE"
+    "IIIIBBRRRIIIIBBBBBEEEEEE"
+    "IIIIRRRRRIIIIRRBBBEEEEEE"  # speed 31-50
+    "IIIIRRRRRIIIIRRBBBEEEEEE"
+    "IIIIRRRRRIIIIRRBBBEEEEEE"
+    "IIIIRRRRRIIIIRRBBBEEEEEE"
+    "RRRBBRRRRRRRBBRBBBEEEEEE"
+    "RRRBBRRRRRRRBBRBBBEEEEEE"  # speed 51-70
+    "RRRBBRRRRRRRBBRBBBEEEEEE"
+    "RRRBBRRRRRRRBBRBBBEEEEEE"
+    "RRRBBRRRRRRRBBRBBBEEEEEE"
+    "RRRBBRRRRRRRBBRBBBEEEEEE"
+)
+_CARD_LETTERS = {card[0]: card for card in CARDS}
+
+Scenario = namedtuple("Scenario", "card composition speed distance weight angle")
+
+
+def _build_scenario_table():
+    table = [None]
+    for scenario_id in range(1, SCENARIO_COUNT + 1):
+        index = scenario_id - 1
+        in_block = index % 24
+        table.append(Scenario(
+            card=_CARD_LETTERS[CORRECT_CARDS[index]],
+            composition=COMPOSITIONS[(index % 120) // 24],
+            speed=SPEED_BANDS[index // 120],
+            distance=DISTANCE_BANDS[int(DISTANCE_IN_BLOCK[in_block])],
+            weight=WEIGHT_BANDS[int(WEIGHT_IN_BLOCK[in_block])],
+            angle=ANGLE_BANDS[index % 3],
+        ))
+    return tuple(table)
+
+
+# SCENARIO_TABLE[scenario_id] for scenario_id in 1..360, index 0 is unused
+SCENARIO_TABLE = _build_scenario_table()
+
+RANDOM_AXES = ("speed", "distance", "weight", "angle")
+
+
+def _build_band_arrays():
+    rows = SCENARIO_TABLE[1:]
+    arrays = {}
+    for axis in RANDOM_AXES:
+        bounds = np.array([(0, 0)] + [getattr(row, axis) for row in rows], dtype=np.int64)
+        arrays[axis] = (bounds[:, 0], bounds[:, 1])
+    arrays["composition"] = np.array(
+        [0] + [COMPOSITIONS.index(row.composition) for row in rows], dtype=np.uint8
+    )
+    return arrays
+
+
+# the same table as NumPy columns indexed by scenario id, for batch generation
+_BAND_ARRAYS = _build_band_arrays()
+_COMPOSITION_NAMES = np.array(COMPOSITIONS)
+
+
+def get_scenario_params():
+    generated_scenario = random.randint(1, SCENARIO_COUNT)
+    scenario = SCENARIO_TABLE[generated_scenario]
+
+    return {
+        "speed": random.randint(*scenario.speed),
+        "composition": scenario.composition,
+        "distance": random.randint(*scenario.distance),
+        "weight": random.randint(*scenario.weight),
+        "angle": random.randint(*scenario.angle),
+        "generated_scenario": generated_scenario
+    }
+
+
+def generate_scenarios(count, rng=None):
+    # Draws `count` scenarios at once. Returns int64 columns keyed like the
+    # get_scenario_params() dict; "composition" holds indexes into COMPOSITIONS.
+    if rng is None:
+        rng = np.random.default_rng()
+
+    ids = rng.integers(1, SCENARIO_COUNT, size=count, endpoint=True)
+    columns = {"generated_scenario": ids, "composition": _BAND_ARRAYS["composition"][ids]}
+    for axis in RANDOM_AXES:
+        low, high = _BAND_ARRAYS[axis]
+        columns[axis] = rng.integers(low[ids], high[ids], endpoint=True)
+    return columns
+
+
+# seeds and round numbers are uint64
+UINT64_MAX = 2**64 - 1
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix64(x):
+    # splitmix64 finalizer, applied element-wise with wrapping uint64 math
+    x = (x ^ (x >> np.uint64(30))) * _MIX_1
+    x = (x ^ (x >> np.uint64(27))) * _MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+def seeded_scenarios(seed, start, count):
+    # Counter-based: the meteor for round k depends only on (seed, k), so any
+    # slice of a room's sequence can be rebuilt without replaying earlier rounds.
+    if start < 0 or start + count - 1 > UINT64_MAX:
+        raise ValueError(f"rounds must be between 0 and {UINT64_MAX}")
+    rounds = np.arange(start, start + count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        key = _mix64(np.uint64(seed % 2**64) + _GOLDEN_GAMMA)
+        base = _mix64(key ^ (rounds * _GOLDEN_GAMMA))
+        streams = [_mix64(base + np.uint64(i) * _GOLDEN_GAMMA) for i in range(1 + len(RANDOM_AXES))]
+
+    ids = (streams[0] % np.uint64(SCENARIO_COUNT)).astype(np.int64) + 1
+    columns = {"generated_scenario": ids, "composition": _BAND_ARRAYS["composition"][ids]}
+    for axis, stream in zip(RANDOM_AXES, streams[1:]):
+        low, high = _BAND_ARRAYS[axis]
+        low, high = low[ids], high[ids]
+        columns[axis] = low + (stream % (high - low + 1).astype(np.uint64)).astype(np.int64)
+    return columns
+
+
+_GAMMA_INT, _MIX_1_INT, _MIX_2_INT = int(_GOLDEN_GAMMA), int(_MIX_1), int(_MIX_2)
+
+
+def _mix64_int(x):
+    # _mix64 on a single Python int
+    x = ((x ^ (x >> 30)) * _MIX_1_INT) & UINT64_MAX
+    x = ((x ^ (x >> 27)) * _MIX_2_INT) & UINT64_MAX
+    return x ^ (x >> 31)
+
+
+def meteor_for_round(seed, round_index):
+    # the row seeded_scenarios(seed, round_index, 1) would give, computed with
+    # plain ints: one round costs a few multiplications, so nothing is cached
+    key = _mix64_int((seed % 2**64 + _GAMMA_INT) & UINT64_MAX)
+    base = _mix64_int(key ^ ((round_index * _GAMMA_INT) & UINT64_MAX))
+    streams = [_mix64_int((base + i * _GAMMA_INT) & UINT64_MAX) for i in range(1 + len(RANDOM_AXES))]
+
+    generated_scenario = streams[0] % SCENARIO_COUNT + 1
+    scenario = SCENARIO_TABLE[generated_scenario]
+    values = {}
+    for axis, stream in zip(RANDOM_AXES, streams[1:]):
+        low, high = getattr(scenario, axis)
+        values[axis] = low + stream % (high - low + 1)
+    return {
+        "speed": values["speed"],
+        "composition": scenario.composition,
+        "distance": values["distance"],
+        "weight": values["weight"],
+        "angle": values["angle"],
+        "generated_scenario": generated_scenario
+    }
+
+
+def scenario_columns(columns):
+    result = {key: values.tolist() for key, values in columns.items()}
+    result["composition"] = _COMPOSITION_NAMES[columns["composition"]].tolist()
+    return result
+
+
+def scenario_rows(columns):
+    result = scenario_columns(columns)
+    return [
+        {
+            "speed": speed,
+            "composition": composition,
+            "distance": distance,
+            "weight": weight,
+            "angle": angle,
+            "generated_scenario": generated_scenario
+        }
+        for speed, composition, distance, weight, angle, generated_scenario in zip(
+            result["speed"], result["composition"], result["distance"],
+            result["weight"], result["angle"], result["generated_scenario"]
+        )
+    ]
+
+
+def validate_card_choice(generated_scenario, chosen_card):
+    if not isinstance(generated_scenario, int) or not 1 <= generated_scenario <= SCENARIO_COUNT:
+        return False
+    return SCENARIO_TABLE[generated_scenario].card == chosen_card
@@ -0,0 +1,76 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+SESSION_COOKIE = "session"
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionTokens:
+    # Self-contained session tokens: base64(json claims).base64(hmac-sha256).
+    # The claims carry the user id and username, so checking a session is a
+    # local HMAC check with no Firestore read. Revoked tokens are remembered
+    # in memory until they would have expired anyway.
+
+    def __init__(self, secret, ttl=SESSION_TTL):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self._revoked = {}
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user_id, username):
+        now = int(time.time())
+        claims = {"uid": user_id, "name": username, "iat": now, "exp": now + self.ttl, "jti": secrets.token_urlsafe(8)}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        # claims of a valid token, None for anything else
+        if not token or token.count(".") != 1:
+            return None
+        payload, signature = token.split(".")
+        # as bytes: compare_digest refuses str with non-ASCII characters
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if claims.get("exp", 0) < time.time() or claims.get("jti") in self._revoked:
+            return None
+        return claims
+
+    def revoke(self, token):
+        claims = self.verify(token)
+        if claims is None:
+            return False
+        self._revoked[claims["jti"]] = claims["exp"]
+        self._prune()
+        return True
+
+    def _prune(self):
+        now = time.time()
+        for jti in [jti for jti, expires_at in self._revoked.items() if expires_at < now]:
+            del self._revoked[jti]
+
+
+def load_secret():
+    secret = os.getenv("SESSION_SECRET")
+    if secret:
+        return secret
+    print("⚠️  SESSION_SECRET not set, using a random secret: sessions end on restart and are not shared between workers")
+    return secrets.token_urlsafe(32)
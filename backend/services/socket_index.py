@@ -0,0 +1,47 @@
+class SocketIndex:
+    # sid -> (user_id, room ids) for the sockets connected to this worker,
+    # filled in by the join handlers. A disconnect looks its rooms up here
+    # instead of querying every room the user is in. Each worker only sees
+    # its own sockets, which is all it needs: a socket disconnects from the
+    # worker it connected to.
+
+    def __init__(self):
+        self._sockets = {}
+        self._by_user = {}
+
+    def join(self, sid, user_id, room_id):
+        entry = self._sockets.get(sid)
+        if entry is None or entry[0] != user_id:
+            self.disconnect(sid)
+            entry = self._sockets[sid] = (user_id, set())
+            self._by_user.setdefault(user_id, set()).add(sid)
+        entry[1].add(room_id)
+
+    def leave(self, sid, room_id):
+        entry = self._sockets.get(sid)
+        if entry is not None:
+            entry[1].discard(room_id)
+
+    def disconnect(self, sid):
+        # (user_id, room ids) the socket was in, (None, set()) if unknown
+        entry = self._sockets.pop(sid, None)
+        if entry is None:
+            return None, set()
+        user_id, room_ids = entry
+        sids = self._by_user.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._by_user[user_id]
+        return user_id, room_ids
+
+    def user_in_room(self, user_id, room_id):
+        # another tab of the same user is still in the room
+        return any(room_id in self._sockets[sid][1] for sid in self._by_user.get(user_id, ()))
+
+    def stats(self):
+        return {
+            "sockets": len(self._sockets),
+            "users": len(self._by_user),
+            "memberships": sum(len(room_ids) for _, room_ids in self._sockets.values()),
+        }
@@ -0,0 +1,454 @@
+import copy
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud import firestore
+
+# Storage behind RoomRegistry and the username caches. STORAGE_BACKEND picks
+# one of three implementations with the same methods:
+#  - "firestore": the Firestore collections rooms, room_codes, users and
+#    usernames (the default),
+#  - "memory": dicts in this process, gone on restart and not shared
+#    between workers,
+#  - "sqlite": one SQLite file in WAL mode at STORAGE_PATH, shared by the
+#    workers of one machine.
+#
+# Room stores: load, create (False when the code is taken), room_for_code,
+# update (field paths such as "game_state.hp", KeyError when the room is
+# gone), delete, compare_and_set, created_before (pages of old rooms) and
+# delete_rooms.
+# User stores: get_user, usernames, user_id_for_name and create_user (False
+# when the username is taken).
+#
+# Stores set createdAt themselves and return it as a datetime.
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+STORAGE_PATH = os.getenv("STORAGE_PATH", "meteorx.sqlite3")
+
+
+def field_value(data, path):
+    # value for a field path such as "game_state.hp"
+    value = data
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def set_field(data, path, value):
+    *parents, key = path.split(".")
+    target = data
+    for parent in parents:
+        target = target.setdefault(parent, {})
+    target[key] = value
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def username_key(username):
+    # document id for usernames/{key}: no "/", and no "." or "_" so that
+    # ".", ".." and "__reserved__" ids cannot come up
+    return quote(username, safe="").replace(".", "%2E").replace("_", "%5F")
+
+
+# Firestore
+
+class FirestoreRoomStore:
+    # rooms/{id} plus a room_codes/{code} reservation per room; create()
+    # writes both in one batch and the reservation's create() fails the batch
+    # when the code is taken
+
+    def __init__(self, db):
+        self.db = db
+
+    def _doc(self, room_id):
+        return self.db.collection("rooms").document(room_id)
+
+    def _code_doc(self, code):
+        return self.db.collection("room_codes").document(code)
+
+    def load(self, room_id):
+        doc = self._doc(room_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def create(self, room_id, data, code):
+        batch = self.db.batch()
+        batch.create(self._code_doc(code), {"roomId": room_id})
+        batch.set(self._doc(room_id), {**data, "createdAt": firestore.SERVER_TIMESTAMP})
+        try:
+            batch.commit()
+        except AlreadyExists:
+            return False
+        return True
+
+    def room_for_code(self, code):
+        doc = self._code_doc(code).get()
+        return doc.to_dict().get("roomId") if doc.exists else None
+
+    def update(self, room_id, fields):
+        try:
+            self._doc(room_id).update(fields)
+        except NotFound:
+            raise KeyError(f"Room {room_id} not found")
+
+    def delete(self, room_id, code):
+        batch = self.db.batch()
+        batch.delete(self._doc(room_id))
+        if code:
+            batch.delete(self._code_doc(code))
+        batch.commit()
+
+    def compare_and_set(self, room_id, path, expected, updates):
+        # (True, None) once updates are written, else (False, current data
+        # or None if the room is gone)
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = self._doc(room_id).get(transaction=transaction)
+            if not snapshot.exists:
+                return False, None
+            data = snapshot.to_dict()
+            if field_value(data, path) != expected:
+                return False, data
+            transaction.update(self._doc(room_id), updates)
+            return True, None
+
+        return apply(self.db.transaction())
+
+    def created_before(self, cutoff, page_size):
+        # pages of (room_id, data), oldest first; only createdAt is filtered
+        # on, so the single-field index is enough
+        query = (self.db.collection("rooms")
+                 .where("createdAt", "<", cutoff)
+                 .order_by("createdAt")
+                 .limit(page_size))
+        last = None
+        while True:
+            page = list((query.start_after(last) if last is not None else query).stream())
+            if not page:
+                return
+            last = page[-1]
+            yield [(doc.id, doc.to_dict()) for doc in page]
+            if len(page) < page_size:
+                return
+
+    def delete_rooms(self, rooms, archive=False):
+        batch = self.db.batch()
+        for room_id, data in rooms:
+            if archive:
+                batch.set(self.db.collection("rooms_archive").document(room_id),
+                          {**data, "archivedAt": firestore.SERVER_TIMESTAMP})
+            batch.delete(self._doc(room_id))
+            if data.get("code"):
+                batch.delete(self._code_doc(data["code"]))
+        batch.commit()
+
+
+class FirestoreUserStore:
+    # users/{id} plus a usernames/{key} reservation, written in one batch
+
+    def __init__(self, db):
+        self.db = db
+
+    def _name_doc(self, username):
+        return self.db.collection("usernames").document(username_key(username))
+
+    def get_user(self, user_id):
+        doc = self.db.collection("users").document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def usernames(self, user_ids):
+        users_ref = self.db.collection("users")
+        refs = [users_ref.document(user_id) for user_id in user_ids]
+        return {
+            doc.id: (doc.to_dict() or {}).get("username") if doc.exists else None
+            for doc in self.db.get_all(refs, field_paths=["username"])
+        }
+
+    def user_id_for_name(self, username):
+        doc = self._name_doc(username).get()
+        if doc.exists:
+            return doc.to_dict().get("userId")
+
+        # users created before the usernames index have no reservation yet:
+        # find them the old way and reserve their name now
+        for user in self.db.collection("users").where("username", "==", username).limit(1).stream():
+            try:
+                self._name_doc(username).create({"userId": user.id})
+            except AlreadyExists:
+                # reserved meanwhile, by this user's login on another worker
+                # or a signup; the reservation wins
+                return self.user_id_for_name(username)
+            return user.id
+        return None
+
+    def create_user(self, user_id, username, data):
+        batch = self.db.batch()
+        batch.create(self._name_doc(username), {"userId": user_id})
+        batch.set(self.db.collection("users").document(user_id),
+                  {**data, "username": username, "createdAt": firestore.SERVER_TIMESTAMP})
+        try:
+            batch.commit()
+        except AlreadyExists:
+            return False
+        return True
+
+    def backfill_usernames(self):
+        # reserves the names of users created before the usernames index existed
+        created = taken = 0
+        for doc in self.db.collection("users").stream():
+            username = doc.to_dict().get("username")
+            if not username:
+                continue
+            try:
+                self._name_doc(username).create({"userId": doc.id})
+                created += 1
+            except AlreadyExists:
+                taken += 1
+        return created, taken
+
+
+# memory
+
+class MemoryRoomStore:
+    # Copies go in and out, so callers cannot change stored rooms by accident
+    # and behave the same as with a real database.
+
+    def __init__(self):
+        self.rooms = {}
+        self.codes = {}
+        self.archive = {}
+
+    def load(self, room_id):
+        data = self.rooms.get(room_id)
+        return copy.deepcopy(data) if data is not None else None
+
+    def create(self, room_id, data, code):
+        if code in self.codes:
+            return False
+        self.codes[code] = room_id
+        self.rooms[room_id] = {**copy.deepcopy(data), "createdAt": _now()}
+        return True
+
+    def room_for_code(self, code):
+        return self.codes.get(code)
+
+    def update(self, room_id, fields):
+        data = self.rooms.get(room_id)
+        if data is None:
+            raise KeyError(f"Room {room_id} not found")
+        for path, value in fields.items():
+            set_field(data, path, copy.deepcopy(value))
+
+    def delete(self, room_id, code):
+        self.rooms.pop(room_id, None)
+        if code and self.codes.get(code) == room_id:
+            del self.codes[code]
+
+    def compare_and_set(self, room_id, path, expected, updates):
+        data = self.rooms.get(room_id)
+        if data is None:
+            return False, None
+        if field_value(data, path) != expected:
+            return False, copy.deepcopy(data)
+        self.update(room_id, updates)
+        return True, None
+
+    def created_before(self, cutoff, page_size):
+        old = sorted(
+            (data["createdAt"], room_id) for room_id, data in self.rooms.items() if data["createdAt"] < cutoff
+        )
+        for start in range(0, len(old), page_size):
+            yield [(room_id, self.load(room_id)) for _, room_id in old[start:start + page_size]]
+
+    def delete_rooms(self, rooms, archive=False):
+        for room_id, data in rooms:
+            if archive:
+                self.archive[room_id] = {**data, "archivedAt": _now()}
+            self.delete(room_id, data.get("code"))
+
+
+class MemoryUserStore:
+    def __init__(self):
+        self.users = {}
+        self.names = {}
+
+    def get_user(self, user_id):
+        data = self.users.get(user_id)
+        return dict(data) if data is not None else None
+
+    def usernames(self, user_ids):
+        return {user_id: self.users.get(user_id, {}).get("username") for user_id in user_ids}
+
+    def user_id_for_name(self, username):
+        return self.names.get(username)
+
+    def create_user(self, user_id, username, data):
+        if username in self.names:
+            return False
+        self.names[username] = user_id
+        self.users[user_id] = {**data, "username": username, "createdAt": _now()}
+        return True
+
+
+# SQLite
+
+def open_sqlite(path=STORAGE_PATH):
+    # WAL lets readers in other workers go on while one of them writes
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS rooms "
+        "(id TEXT PRIMARY KEY, code TEXT UNIQUE, created_at REAL NOT NULL, data TEXT NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS rooms_created_at ON rooms (created_at, id);"
+        "CREATE TABLE IF NOT EXISTS rooms_archive (id TEXT PRIMARY KEY, archived_at REAL NOT NULL, data TEXT NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS users "
+        "(id TEXT PRIMARY KEY, username TEXT UNIQUE NOT NULL, created_at REAL NOT NULL, data TEXT NOT NULL);"
+    )
+    return conn
+
+
+def _dumps(data):
+    return json.dumps({key: value for key, value in data.items() if key != "createdAt"}, default=str)
+
+
+def _loads(text, created_at):
+    data = json.loads(text)
+    data["createdAt"] = datetime.fromtimestamp(created_at, timezone.utc)
+    return data
+
+
+class _SQLiteStore:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so read-modify-write
+        # cycles of different workers cannot interleave
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+
+class SQLiteRoomStore(_SQLiteStore):
+    def load(self, room_id):
+        row = self.conn.execute("SELECT data, created_at FROM rooms WHERE id = ?", (room_id,)).fetchone()
+        return _loads(*row) if row else None
+
+    def create(self, room_id, data, code):
+        try:
+            self.conn.execute(
+                "INSERT INTO rooms (id, code, created_at, data) VALUES (?, ?, ?, ?)",
+                (room_id, code, _now().timestamp(), _dumps(data)),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def room_for_code(self, code):
+        row = self.conn.execute("SELECT id FROM rooms WHERE code = ?", (code,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, room_id, fields):
+        row = self.conn.execute("SELECT data, created_at FROM rooms WHERE id = ?", (room_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Room {room_id} not found")
+        data = _loads(*row)
+        for path, value in fields.items():
+            set_field(data, path, value)
+        self.conn.execute("UPDATE rooms SET data = ? WHERE id = ?", (_dumps(data), room_id))
+
+    def update(self, room_id, fields):
+        with self._transaction():
+            self._write(room_id, fields)
+
+    def delete(self, room_id, code):
+        self.conn.execute("DELETE FROM rooms WHERE id = ?", (room_id,))
+
+    def compare_and_set(self, room_id, path, expected, updates):
+        with self._transaction():
+            data = self.load(room_id)
+            if data is None:
+                return False, None
+            if field_value(data, path) != expected:
+                return False, data
+            self._write(room_id, updates)
+        return True, None
+
+    def created_before(self, cutoff, page_size):
+        last = (float("-inf"), "")
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, data, created_at FROM rooms WHERE created_at < ? AND (created_at, id) > (?, ?) "
+                "ORDER BY created_at, id LIMIT ?",
+                (cutoff.timestamp(), last[0], last[1], page_size),
+            ).fetchall()
+            if not rows:
+                return
+            last = (rows[-1][2], rows[-1][0])
+            yield [(room_id, _loads(data, created_at)) for room_id, data, created_at in rows]
+            if len(rows) < page_size:
+                return
+
+    def delete_rooms(self, rooms, archive=False):
+        with self._transaction():
+            for room_id, data in rooms:
+                if archive:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO rooms_archive (id, archived_at, data) VALUES (?, ?, ?)",
+                        (room_id, _now().timestamp(), _dumps(data)),
+                    )
+                self.conn.execute("DELETE FROM rooms WHERE id = ?", (room_id,))
+
+
+class SQLiteUserStore(_SQLiteStore):
+    def get_user(self, user_id):
+        row = self.conn.execute("SELECT data, created_at FROM users WHERE id = ?", (user_id,)).fetchone()
+        return _loads(*row) if row else None
+
+    def usernames(self, user_ids):
+        user_ids = list(user_ids)
+        names = dict.fromkeys(user_ids)
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            names.update(self.conn.execute(
+                f"SELECT id, username FROM users WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return names
+
+    def user_id_for_name(self, username):
+        row = self.conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def create_user(self, user_id, username, data):
+        try:
+            self.conn.execute(
+                "INSERT INTO users (id, username, created_at, data) VALUES (?, ?, ?, ?)",
+                (user_id, username, _now().timestamp(), _dumps({**data, "username": username})),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+
+def create_stores(backend=STORAGE_BACKEND, db=None, path=STORAGE_PATH):
+    # (room store, user store)
+    if backend == "firestore":
+        return FirestoreRoomStore(db), FirestoreUserStore(db)
+    if backend == "memory":
+        return MemoryRoomStore(), MemoryUserStore()
+    if backend == "sqlite":
+        conn = open_sqlite(path)
+        return SQLiteRoomStore(conn), SQLiteUserStore(conn)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend}, expected firestore, memory or sqlite")
@@ -0,0 +1,352 @@
+import argparse
+import contextvars
+import json
+import os
+import random
+import time
+import urllib.request
+from collections import defaultdict
+
+import gevent
+from gevent.queue import Queue, Full, Empty
+
+# Nested timing spans for handlers, Firestore calls and Gemini calls.
+#
+# A trace starts at the outermost span (usually a handler, see
+# metrics.timed) and is kept with probability TRACE_SAMPLE_RATE; spans
+# inside an unsampled trace cost one context variable lookup. Finished
+# traces are queued and written by a background greenlet to TRACE_EXPORT:
+# a JSON lines file, one span per line, or an OTLP/HTTP collector URL such
+# as http://localhost:4318/v1/traces. A full queue drops traces instead of
+# slowing down handlers.
+#
+#   python -m services.tracing traces.jsonl --top 10
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "traces.jsonl")
+TRACE_QUEUE_SIZE = 1000
+SERVICE_NAME = "meteorx-backend"
+
+current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+class _NoopSpan:
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP = _NoopSpan()
+
+
+class _Unsampled(_NoopSpan):
+    # marks the context so spans further down do not start traces of their own
+    def __enter__(self):
+        self._token = current_span.set(UNSAMPLED)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self._token)
+        return False
+
+
+UNSAMPLED = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "trace", "trace_id", "span_id", "parent_id", "name", "attrs",
+                 "start_ns", "duration", "error", "_started", "_token")
+
+    def __init__(self, tracer, name, attrs, parent):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.span_id = os.urandom(8).hex()
+        if parent is None:
+            self.trace = []
+            self.trace_id = os.urandom(16).hex()
+            self.parent_id = None
+        else:
+            self.trace = parent.trace
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.error = None
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._started
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        current_span.reset(self._token)
+        self.trace.append(self)
+        if self.parent_id is None:
+            self.tracer.finish(self.trace)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace": self.trace_id,
+            "span": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class JsonLinesExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpExporter:
+    # OTLP/HTTP with the JSON encoding, which every OpenTelemetry collector accepts
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def export(self, spans):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "meteorx"}, "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.start_ns + int(span.duration * 1e9)),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attrs.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            } for span in spans]}],
+        }]}
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+
+def create_exporter(target=TRACE_EXPORT):
+    if target.startswith(("http://", "https://")):
+        return OtlpExporter(target)
+    return JsonLinesExporter(target)
+
+
+class Tracer:
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, exporter=None, queue_size=TRACE_QUEUE_SIZE):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self._queue = Queue(maxsize=queue_size)
+        self._writer = None
+
+        self.exported = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def span(self, name, **attrs):
+        parent = current_span.get()
+        if parent is UNSAMPLED or (parent is None and self.sample_rate <= 0):
+            return NOOP
+        if parent is None and random.random() >= self.sample_rate:
+            return _Unsampled()
+        return Span(self, name, attrs, parent)
+
+    def record(self, name, start_ns, duration, **attrs):
+        # adds an already finished span under the current one, for work that
+        # cannot hold the context open (a generator consumed by the caller)
+        parent = current_span.get()
+        if not isinstance(parent, Span):
+            return
+        child = Span(self, name, attrs, parent)
+        child.start_ns = start_ns
+        child.duration = duration
+        parent.trace.append(child)
+
+    def finish(self, spans):
+        if self.exporter is None:
+            self.exporter = create_exporter()
+        try:
+            self._queue.put_nowait(spans)
+        except Full:
+            self.dropped += 1
+            return
+        if self._writer is None:
+            self._writer = gevent.spawn(self._export_loop)
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # whatever else is waiting goes out in the same write
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            spans = [span for trace in batch for span in trace]
+            try:
+                self.exporter.export(spans)
+                self.exported += len(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error exporting {len(batch)} traces: {str(e)}")
+
+    def flush(self):
+        # exports queued traces right away, for tests and shutdown
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        if batch:
+            self.exporter.export([span for trace in batch for span in trace])
+            self.exported += len(batch)
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+TRACER = Tracer()
+
+
+def span(name, **attrs):
+    return TRACER.span(name, **attrs)
+
+
+def tag_handler(current, event, args, kwargs):
+    # event name and the room a socket/route handler works on
+    if not isinstance(current, Span):
+        return
+    current.attrs["event"] = event
+    data = args[0] if args and isinstance(args[0], dict) else {}
+    for key, tag in (("roomId", "room_id"), ("roomCode", "room_code"), ("code", "room_code"), ("room_code", "room_code")):
+        value = data.get(key) or kwargs.get(key)
+        if value:
+            current.attrs[tag] = value
+
+
+def tag_document(current, path):
+    if isinstance(current, Span) and path:
+        current.attrs["path"] = path
+        if path.startswith("rooms/"):
+            current.attrs["room_id"] = path.split("/", 2)[1]
+
+
+# trace report
+
+def load_traces(path):
+    traces = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                traces[record["trace"]].append(record)
+    return traces
+
+
+def _root(spans):
+    return next((span for span in spans if span["parent"] is None), max(spans, key=lambda span: span["duration_ms"]))
+
+
+def flame_summary(traces):
+    # (span names from the root down) -> [count, total ms, self ms]
+    summary = defaultdict(lambda: [0, 0.0, 0.0])
+    for spans in traces.values():
+        by_id = {span["span"]: span for span in spans}
+        children_ms = defaultdict(float)
+        for span in spans:
+            if span["parent"]:
+                children_ms[span["parent"]] += span["duration_ms"]
+        for span in spans:
+            path, parent = [span["name"]], by_id.get(span["parent"])
+            while parent is not None:
+                path.append(parent["name"])
+                parent = by_id.get(parent["parent"])
+            entry = summary[tuple(reversed(path))]
+            entry[0] += 1
+            entry[1] += span["duration_ms"]
+            entry[2] += max(span["duration_ms"] - children_ms[span["span"]], 0.0)
+    return summary
+
+
+def report(path, top=10, folded=False):
+    traces = load_traces(path)
+    summary = flame_summary(traces)
+    if folded:
+        # collapsed stacks for flamegraph.pl / speedscope, self time in us
+        for stack, (_, _, self_ms) in sorted(summary.items()):
+            print(f"{';'.join(stack)} {int(self_ms * 1000)}")
+        return
+
+    print(f"{len(traces)} traces in {path}\n")
+    print(f"slowest {top}:")
+    slowest = sorted(traces.values(), key=lambda spans: _root(spans)["duration_ms"], reverse=True)[:top]
+    for spans in slowest:
+        root = _root(spans)
+        room = root["attrs"].get("room_id") or root["attrs"].get("room_code") or "-"
+        error = f"  {root['error']}" if root["error"] else ""
+        print(f"  {root['duration_ms']:10.2f} ms  {root['name']:32} room {room:38} {len(spans):3d} spans  {root['trace']}{error}")
+
+    print("\nspans (count, total ms, self ms, mean ms):")
+    children = defaultdict(list)
+    for stack in summary:
+        children[stack[:-1]].append(stack)
+
+    def show(stack, depth):
+        count, total, self_ms = summary[stack]
+        label = "  " * depth + stack[-1]
+        print(f"  {label:48} {count:7d} {total:12.2f} {self_ms:12.2f} {total / count:10.2f}")
+        for child in sorted(children[stack], key=lambda s: summary[s][1], reverse=True):
+            show(child, depth + 1)
+
+    for root in sorted(children[()], key=lambda s: summary[s][1], reverse=True):
+        show(root, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a traces.jsonl file")
+    parser.add_argument("path", nargs="?", default=TRACE_EXPORT)
+    parser.add_argument("--top", type=int, default=10, help="slowest traces to list")
+    parser.add_argument("--folded", action="store_true", help="print collapsed stacks for flame graph tools")
+    args = parser.parse_args()
+    report(args.path, args.top, args.folded)
+
+
+if __name__ == "__main__":
+    main()
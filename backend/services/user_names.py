@@ -0,0 +1,137 @@
+import os
+import time
+from collections import OrderedDict
+
+USERNAME_TTL = float(os.getenv("USERNAME_CACHE_TTL", "300"))
+USERNAME_CACHE_SIZE = int(os.getenv("USERNAME_CACHE_SIZE", "10000"))
+# unknown usernames are only remembered briefly, another worker may take them
+USERNAME_NEGATIVE_TTL = float(os.getenv("USERNAME_NEGATIVE_TTL", "5"))
+
+
+class UsernameTaken(Exception):
+    pass
+
+
+class UsernameResolver:
+    # user_id -> username with LRU eviction and a TTL. Unknown users are
+    # cached as None too, so a missing document is not re-read every event.
+
+    def __init__(self, store, ttl=USERNAME_TTL, max_size=USERNAME_CACHE_SIZE):
+        self.store = store
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    def _cached(self, user_id, now):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return False, None
+        username, expires_at = entry
+        if expires_at < now:
+            del self._cache[user_id]
+            return False, None
+        self._cache.move_to_end(user_id)
+        return True, username
+
+    def put(self, user_id, username):
+        self._cache[user_id] = (username, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(user_id, None)
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        now = time.monotonic()
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            found, username = self._cached(user_id, now)
+            if found:
+                names[user_id] = username
+            elif user_id not in missing:
+                missing.append(user_id)
+
+        if missing and self.store is not None:
+            for user_id, username in self.store.usernames(missing).items():
+                names[user_id] = username
+                self.put(user_id, username)
+
+        for user_id in missing:
+            names.setdefault(user_id, None)
+        return names
+
+
+class UsernameIndex:
+    # username -> user_id in front of the user store. The store reserves a
+    # name together with its user (usernames/{key} documents in Firestore, a
+    # unique column in SQLite), so two signups cannot both get it. Lookups
+    # are cached; misses only for a few seconds.
+
+    def __init__(self, store, ttl=USERNAME_TTL, negative_ttl=USERNAME_NEGATIVE_TTL, max_size=USERNAME_CACHE_SIZE):
+        self.store = store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    def _put(self, username, user_id):
+        ttl = self.ttl if user_id is not None else self.negative_ttl
+        self._cache[username] = (user_id, time.monotonic() + ttl)
+        self._cache.move_to_end(username)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def cached(self, username):
+        # (found, user_id) without touching the store
+        entry = self._cache.get(username)
+        if entry is None:
+            return False, None
+        user_id, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._cache[username]
+            return False, None
+        self._cache.move_to_end(username)
+        return True, user_id
+
+    def lookup(self, username):
+        found, user_id = self.cached(username)
+        if found:
+            return user_id
+
+        user_id = self.store.user_id_for_name(username)
+        self._put(username, user_id)
+        return user_id
+
+    def register(self, username, user_id, user_data):
+        # writes the user and reserves the name, or raises UsernameTaken
+        found, owner = self.cached(username)
+        if found and owner is not None:
+            raise UsernameTaken(username)
+
+        if not self.store.create_user(user_id, username, user_data):
+            self._cache.pop(username, None)
+            raise UsernameTaken(username)
+        self._put(username, user_id)
+
+
+if __name__ == "__main__":
+    # python -m services.user_names
+    import json
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    from services.storage import FirestoreUserStore
+
+    creds = os.getenv("FIREBASE_CREDENTIALS")
+    firebase_admin.initialize_app(credentials.Certificate(json.loads(creds) if creds else "firebase-adminsdk.json"))
+    created, taken = FirestoreUserStore(firestore.client()).backfill_usernames()
+    print(f"{created} usernames reserved, {taken} already reserved")
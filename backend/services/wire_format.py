@@ -0,0 +1,91 @@
+import msgpack
+
+from services.scenarios import CARDS, COMPOSITIONS
+
+# Compact encoding of room state events for clients that ask for it on
+# connect. Payloads are MessagePack instead of JSON, with
+#  - known keys replaced by their index in KEYS,
+#  - card, composition, change type and room status strings replaced by
+#    their index in the matching ENUMS table,
+#  - scenario meteors sent as arrays in METEOR_FIELDS order.
+# SCHEMA is sent to the client on connect so it can map the codes back.
+
+KEYS = (
+    "roomId", "code", "version", "status", "creator", "users", "hp", "round",
+    "meteor", "type", "user", "totalUsers", "total_users", "userId",
+    "username", "id", "card", "correct", "message",
+)
+METEOR_FIELDS = ("speed", "composition", "distance", "weight", "angle", "generated_scenario")
+ENUMS = {
+    "card": CARDS,
+    "type": ("USER_ADDED", "USER_REMOVED", "USER_JOINED", "GAME_STARTED", "ROUND_RESOLVED", "GAME_ENDED"),
+    "status": ("waiting", "game_waiting", "playing", "ended"),
+}
+
+KEY_CODES = {key: code for code, key in enumerate(KEYS)}
+ENUM_CODES = {key: {value: code for code, value in enumerate(values)} for key, values in ENUMS.items()}
+COMPOSITION_CODES = {composition: code for code, composition in enumerate(COMPOSITIONS)}
+
+SCHEMA = {
+    "encoding": "msgpack",
+    "keys": list(KEYS),
+    "enums": {key: list(values) for key, values in ENUMS.items()},
+    "compositions": list(COMPOSITIONS),
+    "meteor": list(METEOR_FIELDS),
+}
+
+
+def _meteor(meteor):
+    # AI or legacy meteors with other fields are left as maps
+    if meteor.keys() != set(METEOR_FIELDS) or meteor["composition"] not in COMPOSITION_CODES:
+        return compact(meteor)
+    return [
+        COMPOSITION_CODES[meteor["composition"]] if field == "composition" else meteor[field]
+        for field in METEOR_FIELDS
+    ]
+
+
+def compact(value):
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            codes = ENUM_CODES.get(key)
+            if codes is not None and item in codes:
+                item = codes[item]
+            elif key == "meteor" and isinstance(item, dict):
+                item = _meteor(item)
+            else:
+                item = compact(item)
+            out[KEY_CODES.get(key, key)] = item
+        return out
+    if isinstance(value, (list, tuple)):
+        return [compact(item) for item in value]
+    return value
+
+
+def expand(value):
+    # inverse of compact(), for tests and Python clients
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            key = KEYS[key] if isinstance(key, int) else key
+            if key in ENUMS and isinstance(item, int):
+                item = ENUMS[key][item]
+            elif key == "meteor" and isinstance(item, list):
+                item = dict(zip(METEOR_FIELDS, item))
+                item["composition"] = COMPOSITIONS[item["composition"]]
+            else:
+                item = expand(item)
+            out[key] = item
+        return out
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    return value
+
+
+def pack(payload):
+    return msgpack.packb(compact(payload), use_bin_type=True)
+
+
+def unpack(data):
+    return expand(msgpack.unpackb(data, raw=False, strict_map_key=False))
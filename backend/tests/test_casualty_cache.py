@@ -0,0 +1,13 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.casualty_cache import casualty_key
+
+METEOR = {"latitude": 48.86, "longitude": 2.35, "mass": 1000, "angle": 45, "type": "STONY", "weather": "CLEAR"}
+
+
+def test_speeds_in_km_per_second_get_their_own_buckets():
+    assert casualty_key(dict(METEOR, speed=12)) != casualty_key(dict(METEOR, speed=70))
+    assert casualty_key(dict(METEOR, speed=12)) == casualty_key(dict(METEOR, speed=12000))
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).parent.parent
+
+# app.py monkey-patches the process for gevent when imported, so the route is
+# exercised in a child process
+CLIENT = """
+import json, sys
+import app
+client = app.app.test_client()
+results = {}
+for query in sys.argv[1:]:
+    resp = client.get("/api/generate-meteor?" + query)
+    results[query] = [resp.status_code, resp.get_json()]
+print(json.dumps(results))
+"""
+
+
+def generate_meteor(*queries):
+    env = dict(os.environ, STORAGE_BACKEND="memory", GEMINI_API_KEY="")
+    env.pop("SOCKETIO_MESSAGE_QUEUE", None)
+    out = subprocess.run([sys.executable, "-c", CLIENT, *queries], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_bad_numbers_are_rejected_with_400():
+    max_uint64 = 2**64 - 1
+    results = generate_meteor(
+        "count=²", "count=3&seed=²", "count=1&seed=1&start=²", "count=1001",
+        f"count=1&seed={max_uint64 + 1}", f"count=2&seed=1&start={max_uint64}", "count=1&seed=-1",
+        f"count=2&seed={max_uint64}&start={max_uint64 - 1}", "count=2&seed=7&start=3",
+    )
+    for query, (status, body) in list(results.items())[:7]:
+        assert status == 400, query
+        assert "must be an integer" in body["error"]
+
+    for query in (f"count=2&seed={max_uint64}&start={max_uint64 - 1}", "count=2&seed=7&start=3"):
+        status, body = results[query]
+        assert status == 200 and len(body["generated_scenario"]) == 2
@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent.parent / "data"))
+
+from generate_scenarios import AXES, DEFAULT_GRID, generate, parse_grid
+from services.scenario_dataset import CSV_PATH, ScenarioDataset, read_csv
+from services.scenarios import SCENARIO_COUNT, SCENARIO_TABLE
+
+DEFAULTS = {axis: parse_grid(DEFAULT_GRID[axis]) for axis in AXES}
+
+
+def test_default_grid_reproduces_scenarios_csv(tmp_path):
+    path = tmp_path / "scenarios.csv"
+    # chunks that don't line up with scenarios, on one process and on a pool
+    assert generate(path, DEFAULTS, "csv", chunk_size=1000, workers=1) == 9720
+    assert path.read_bytes() == Path(CSV_PATH).read_bytes()
+
+    assert generate(path, DEFAULTS, "csv", chunk_size=1000, workers=2) == 9720
+    assert path.read_bytes() == Path(CSV_PATH).read_bytes()
+
+
+def test_binary_output_opens_as_scenario_dataset(tmp_path):
+    path = tmp_path / "scenarios.bin"
+    generate(path, DEFAULTS, "bin", chunk_size=1000, workers=1)
+    dataset = ScenarioDataset.open(path)
+    for name, values in read_csv(CSV_PATH).items():
+        assert np.array_equal(dataset.columns[name], values)
+
+    grid = {**DEFAULTS, "speed": parse_grid("2"), "distance": parse_grid("4:log")}
+    assert generate(path, grid, "bin", chunk_size=777, workers=1) == SCENARIO_COUNT * 2 * 4 * 3 * 3
+    dataset = ScenarioDataset.open(path)
+    assert len(dataset.scenario_ids) == SCENARIO_COUNT
+    for scenario_id in (1, 150, SCENARIO_COUNT):
+        block = dataset.block(scenario_id)
+        assert len(block["speed"]) == 72
+        for axis in AXES:
+            low, high = getattr(SCENARIO_TABLE[scenario_id], axis)
+            assert low <= block[axis].min() and block[axis].max() <= high
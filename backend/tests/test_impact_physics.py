@@ -0,0 +1,46 @@
+import math
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.impact_physics import InvalidMeteor, estimate_impact, kinetic_energy
+
+PARIS = {"latitude": 48.86, "longitude": 2.35, "speed": 20, "angle": 45, "type": "Stony", "weather": "Clear"}
+
+
+def test_matches_frontend_math():
+    # same inputs as computeCalculated() in meteorMathService.ts
+    impact = estimate_impact(dict(PARIS, mass=1000))
+
+    energy = 0.5 * 1000 * 20000 ** 2
+    angle_coef = math.sin(math.radians(45))
+    assert impact["kineticEnergy"] == energy
+    assert impact["baseCraterRadius"] == 0.0015874 * energy ** (1 / 3) * angle_coef
+    assert impact["craterDepth"] == 0.2 * impact["baseCraterRadius"]
+    assert [r["time"] for r in impact["radiusOverTime"]] == [1800, 3600, 7200]
+
+
+def test_speed_accepts_km_and_m_per_second():
+    assert kinetic_energy(10, 20) == kinetic_energy(10, 20000)
+
+
+def test_casualties_follow_population_and_energy():
+    ocean = estimate_impact(dict(PARIS, latitude=0, longitude=-150, mass=1e6))
+    small = estimate_impact(dict(PARIS, mass=1e3))
+    large = estimate_impact(dict(PARIS, mass=1e6))
+
+    assert ocean["casualties"] == 0
+    assert 0 < small["casualties"] < large["casualties"]
+    assert estimate_impact(dict(PARIS, mass=1e15))["casualties"] <= 100000000
+
+
+@pytest.mark.parametrize("field, value", [
+    ("mass", 0), ("mass", -5), ("speed", 0), ("speed", -20), ("diameter", 0),
+    ("mass", "heavy"), ("speed", float("nan")), ("angle", 120), ("latitude", 91), ("longitude", float("inf")),
+])
+def test_rejects_values_the_formulas_cannot_take(field, value):
+    with pytest.raises(InvalidMeteor, match=field):
+        estimate_impact({**PARIS, "mass": 1000, field: value})
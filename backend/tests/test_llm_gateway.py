@@ -0,0 +1,35 @@
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import gevent
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.llm_gateway import LLMGateway, LLMTimeout
+
+
+class SlowModel:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def generate_content(self, prompt, request_options=None):
+        self.release.wait(5)
+        return SimpleNamespace(text=prompt.upper())
+
+
+def test_timed_out_call_keeps_its_slot_until_the_thread_is_done():
+    model = SlowModel()
+    gateway = LLMGateway(model, max_concurrency=1, timeout=0.1)
+
+    with pytest.raises(LLMTimeout, match="exceeded"):
+        gateway.generate("first")
+    # the first call is still running in the pool
+    with pytest.raises(LLMTimeout, match="No free Gemini slot"):
+        gateway.generate("second")
+
+    model.release.set()
+    gevent.sleep(0.2)
+    assert gateway.generate("third") == "THIRD"
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import gevent
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.meteor_pool import MeteorPool
+
+
+def test_refill_backs_off_and_pauses_on_bad_output():
+    calls = []
+
+    def produce():
+        calls.append(1)
+        return {"mass": -1}
+
+    pool = MeteorPool(produce, lambda meteor: False, high_water=4, low_water=2,
+                      backoff=0.01, max_failures=3, pause=60)
+    assert pool._refiller is None  # nothing runs before the first pop
+    assert pool.pop() is None
+    gevent.sleep(0.2)
+
+    # 0.01s and 0.02s between the first three calls, then the long pause
+    assert len(calls) == 3
+    assert pool.stats()["pauses"] == 1 and pool.rejected == 3
+    pool._refiller.kill()
+
+
+def test_success_resets_the_failure_count():
+    results = iter([ValueError("not json"), {"ok": True}, {"ok": True}])
+
+    def produce():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    pool = MeteorPool(produce, lambda meteor: True, high_water=2, low_water=1, backoff=0.01)
+    pool.start()
+    gevent.sleep(0.1)
+    assert pool.failures == 0 and pool.accepted == 2
+    assert pool.pop() == {"ok": True}
+    pool._refiller.kill()
@@ -0,0 +1,79 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.metrics import Registry, timed, instrument_firestore, FIRESTORE_DOCUMENTS, HANDLER_ERRORS
+
+
+def test_render_uses_prometheus_text_format():
+    registry = Registry(prefix="test")
+    registry.worker = 7
+    hits = registry.counter("hits_total", "Hits", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.collect_stats("pool", lambda: {"depth": 3, "circuit": "open", "ttls": {"ended": 10}})
+
+    hits.labels("a\"b").inc()
+    latency.labels().observe(0.05)
+    latency.labels().observe(5)
+
+    text = registry.render()
+    assert "# TYPE test_hits_total counter" in text
+    assert 'test_hits_total{route="a\\"b",worker="7"} 1' in text
+    assert 'test_latency_seconds_bucket{le="0.1",worker="7"} 1' in text
+    assert 'test_latency_seconds_bucket{le="+Inf",worker="7"} 2' in text
+    assert 'test_latency_seconds_count{worker="7"} 2' in text
+    assert 'test_pool_depth{worker="7"} 3' in text
+    assert 'test_pool_circuit{circuit="open",worker="7"} 1' in text
+    assert 'test_pool_ttls_ended{worker="7"} 10' in text
+
+
+def test_timed_counts_errors_and_5xx():
+    @timed("http", "test_failing")
+    def failing():
+        raise ValueError("boom")
+
+    @timed("http", "test_unavailable")
+    def unavailable():
+        return {"error": "busy"}, 503
+
+    with pytest.raises(ValueError):
+        failing()
+    unavailable()
+    assert HANDLER_ERRORS.labels("http", "test_failing").value == 1
+    assert HANDLER_ERRORS.labels("http", "test_unavailable").value == 1
+
+
+class FakeDoc:
+    exists = True
+
+    def get(self):
+        return self
+
+
+class FakeDB:
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return FakeDoc()
+
+    def where(self, *args):
+        return self
+
+    def stream(self):
+        return iter([FakeDoc(), FakeDoc()])
+
+
+def test_firestore_reads_are_counted_per_handler():
+    db = instrument_firestore(FakeDB())
+
+    @timed("socket", "test_join")
+    def join():
+        db.collection("rooms").document("r1").get()
+        list(db.collection("rooms").where("status", "==", "waiting").stream())
+
+    join()
+    assert FIRESTORE_DOCUMENTS.labels("test_join", "read").value == 3
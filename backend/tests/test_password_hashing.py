@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.password_hashing import PasswordHasher, HasherBusy
+
+
+def test_hash_and_check():
+    hasher = PasswordHasher(workers=1)
+    hashed = hasher.hash("correct horse")
+    assert hasher.check("correct horse", hashed)
+    assert not hasher.check("wrong horse", hashed)
+
+
+def test_rejects_when_full():
+    hasher = PasswordHasher(workers=1, max_pending=0)
+    with pytest.raises(HasherBusy):
+        hasher.hash("correct horse")
+    assert hasher.stats()["rejected"] == 1
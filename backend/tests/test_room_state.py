@@ -0,0 +1,143 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.room_state import RoomRegistry, RoomReaper
+from services.storage import MemoryRoomStore
+
+
+def new_room(registry):
+    return registry.create("room-1", {
+        "status": "playing",
+        "game_state": {"hp": 3, "round": 0},
+    }, new_code=lambda: "ABCD")
+
+
+def test_compare_and_set_applies_updates_once():
+    rooms = RoomRegistry(None)
+    room = new_room(rooms)
+
+    updates = {"game_state.hp": 2, "game_state.round": 1}
+    assert rooms.compare_and_set(room, "game_state.round", 0, updates)
+    assert room.data["game_state"] == {"hp": 2, "round": 1}
+
+    # a second answer for round 0 is stale
+    assert not rooms.compare_and_set(room, "game_state.round", 0, {"game_state.hp": 1, "game_state.round": 1})
+    assert room.data["game_state"] == {"hp": 2, "round": 1}
+
+
+def test_compare_and_set_ignores_deleted_rooms():
+    rooms = RoomRegistry(None)
+    room = new_room(rooms)
+    rooms.delete(room.id)
+
+    assert not rooms.compare_and_set(room, "game_state.round", 0, {"game_state.round": 1})
+
+
+def test_mutate_keeps_joins_from_two_workers():
+    store = MemoryRoomStore()
+    store.create("room-1", {"users": ["u1"], "status": "waiting", "version": 1}, "ABCD")
+    first = RoomRegistry(store, publish=lambda room_id: None)
+    second = RoomRegistry(store, publish=lambda room_id: None)
+    room_a, room_b = first.get("room-1"), second.get("room-1")
+
+    def add(user_id):
+        return lambda room: {"users": room.get("users", []) + [user_id]}
+
+    assert first.mutate(room_a, add("u2")) == {"users": ["u1", "u2"], "version": 2}
+    # the second worker still has version 1, so it reloads and adds to u2
+    assert second.mutate(room_b, add("u3")) == {"users": ["u1", "u2", "u3"], "version": 3}
+    assert store.load("room-1")["users"] == ["u1", "u2", "u3"]
+    assert room_b.get("version") == 3
+
+
+def test_shared_compare_and_set_asks_the_store_when_our_copy_is_behind():
+    store = MemoryRoomStore()
+    rooms = RoomRegistry(store, publish=lambda room_id: None)
+    room = new_room(rooms)
+    # another worker resolved round 0, its notice has not arrived yet
+    store.update("room-1", {"game_state.round": 1, "game_state.hp": 2})
+
+    assert rooms.compare_and_set(room, "game_state.round", 1, {"game_state.round": 2})
+    assert store.load("room-1")["game_state"] == {"hp": 2, "round": 2}
+
+    store.update("room-1", {"game_state.round": 3})
+    assert rooms.refresh(room) and room.field("game_state.round") == 3
+
+
+def test_mutate_on_rooms_without_a_version():
+    store = MemoryRoomStore()
+    store.create("room-1", {"users": ["u1"], "status": "waiting"}, "ABCD")
+    rooms = RoomRegistry(store, publish=lambda room_id: None)
+    room = rooms.get("room-1")
+
+    assert rooms.mutate(room, lambda current: {"users": ["u1", "u2"]}) == {"users": ["u1", "u2"], "version": 1}
+    assert store.load("room-1")["version"] == 1
+
+
+class FailingStore(MemoryRoomStore):
+    def __init__(self):
+        super().__init__()
+        self.failing = True
+
+    def update(self, room_id, fields):
+        if self.failing:
+            raise ConnectionError("store unavailable")
+        super().update(room_id, fields)
+
+
+def test_flush_backs_off_while_the_store_fails(monkeypatch):
+    delays = []
+    store = FailingStore()
+    rooms = RoomRegistry(store, publish=lambda room_id: None)
+    monkeypatch.setattr(rooms, "_schedule_flush", lambda delay=None: delays.append(delay))
+    room = new_room(rooms)
+    room.set("game_state.hp", 2)
+    rooms.save(room, "game_state.hp")
+
+    for _ in range(3):
+        rooms.flush()
+    assert delays[1:] == [0.5, 1.0, 2.0]
+    assert rooms.stats()["dirty"] == 1
+
+    store.failing = False
+    rooms.flush()
+    assert store.load("room-1")["game_state"]["hp"] == 2
+    assert rooms.stats()["dirty"] == 0 and rooms._failures == 0
+
+
+def test_flush_drops_changes_of_deleted_rooms():
+    store = MemoryRoomStore()
+    rooms = RoomRegistry(store, flush_delay=0)
+    room = new_room(rooms)
+    store.delete("room-1", "ABCD")
+    rooms.save(room, "status")
+
+    rooms.flush()
+    assert rooms.stats()["dirty"] == 0
+    assert "room-1" not in rooms.rooms
+
+
+def test_close_writes_pending_changes():
+    store = MemoryRoomStore()
+    rooms = RoomRegistry(store, flush_delay=60)
+    room = new_room(rooms)
+    room.set("status", "ended")
+    rooms.save(room, "status")
+
+    rooms.close()
+    assert store.load("room-1")["status"] == "ended"
+
+
+def test_reaper_uses_the_ttl_of_the_room_status():
+    reaper = RoomReaper(RoomRegistry(None), ttls={"waiting": 60, "ended": 10})
+    now = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+    created_at = now - timedelta(seconds=30)
+
+    assert reaper._expired("ended", created_at, now)
+    assert not reaper._expired("waiting", created_at, now)
+    # unknown statuses get the longest ttl, rooms without createdAt are kept
+    assert not reaper._expired("archived", created_at, now)
+    assert not reaper._expired("ended", None, now)
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.scenario_dataset import CSV_PATH, ScenarioDataset, convert, read_csv
+from services.scenarios import SCENARIO_COUNT, SCENARIO_TABLE, scenario_rows
+
+
+def test_converted_file_maps_the_csv_columns(tmp_path):
+    path = tmp_path / "scenarios.bin"
+    assert convert(CSV_PATH, path) == 9720
+
+    dataset = ScenarioDataset.open(path)
+    expected = read_csv(CSV_PATH)
+    assert isinstance(dataset.columns["distance"], np.memmap)
+    for name, values in expected.items():
+        assert np.array_equal(dataset.columns[name], values)
+
+
+def test_block_index_groups_rows_by_scenario():
+    dataset = ScenarioDataset(read_csv(CSV_PATH))
+    assert len(dataset.scenario_ids) == SCENARIO_COUNT
+
+    for scenario_id in (1, 28, 200, SCENARIO_COUNT):
+        bands = SCENARIO_TABLE[scenario_id]
+        rows = scenario_rows(dataset.scenario(scenario_id))
+        assert len(rows) == 27
+        for row in rows:
+            assert row["generated_scenario"] == scenario_id
+            assert row["composition"] == bands.composition
+            for axis in ("speed", "distance", "weight", "angle"):
+                low, high = getattr(bands, axis)
+                assert low <= row[axis] <= high
+
+
+def test_sample_returns_canonical_rows():
+    dataset = ScenarioDataset(read_csv(CSV_PATH))
+    columns = dataset.sample(500, np.random.default_rng(3))
+    for row in scenario_rows(columns):
+        block = dataset.block(row["generated_scenario"])
+        assert row["distance"] in block["distance"] and row["angle"] in block["angle"]
@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.session_tokens import SessionTokens
+
+
+def test_issue_and_verify():
+    sessions = SessionTokens("secret")
+    claims = sessions.verify(sessions.issue("user-1", "alice"))
+    assert claims["uid"] == "user-1"
+    assert claims["name"] == "alice"
+
+
+def test_rejects_tampered_foreign_and_expired_tokens():
+    sessions = SessionTokens("secret")
+    token = sessions.issue("user-1", "alice")
+    payload, signature = token.split(".")
+
+    assert sessions.verify(payload + "x." + signature) is None
+    assert sessions.verify("user-1") is None
+    assert sessions.verify(payload + "." + "é" + signature[1:]) is None
+    assert sessions.verify("ünïcode." + signature) is None
+    assert SessionTokens("other secret").verify(token) is None
+    assert SessionTokens("secret", ttl=-1).verify(SessionTokens("secret", ttl=-1).issue("user-1", "alice")) is None
+
+
+def test_revoke():
+    sessions = SessionTokens("secret")
+    token = sessions.issue("user-1", "alice")
+    other = sessions.issue("user-1", "alice")
+
+    assert sessions.revoke(token)
+    assert sessions.verify(token) is None
+    assert sessions.verify(other) is not None
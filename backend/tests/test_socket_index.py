@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.socket_index import SocketIndex
+
+
+def test_disconnect_returns_joined_rooms():
+    sockets = SocketIndex()
+    sockets.join("sid-1", "u1", "room-a")
+    sockets.join("sid-1", "u1", "room-b")
+    sockets.leave("sid-1", "room-b")
+
+    assert sockets.disconnect("sid-1") == ("u1", {"room-a"})
+    assert sockets.disconnect("sid-1") == (None, set())
+    assert sockets.stats() == {"sockets": 0, "users": 0, "memberships": 0}
+
+
+def test_other_tabs_keep_the_user_in_the_room():
+    sockets = SocketIndex()
+    sockets.join("tab-1", "u1", "room-a")
+    sockets.join("tab-2", "u1", "room-a")
+
+    sockets.disconnect("tab-1")
+    assert sockets.user_in_room("u1", "room-a")
+    sockets.disconnect("tab-2")
+    assert not sockets.user_in_room("u1", "room-a")
@@ -0,0 +1,68 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.room_state import RoomRegistry, RoomReaper
+from services.storage import create_stores
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def stores(request, tmp_path):
+    return create_stores(request.param, path=str(tmp_path / "meteorx.sqlite3"))
+
+
+def test_rooms_round_trip(stores):
+    room_store, _ = stores
+    data = {"users": ["u1"], "status": "waiting", "game_state": {"hp": 3, "user_cards": {}}}
+    assert room_store.create("r1", data, "ABC123")
+    assert not room_store.create("r2", data, "ABC123")
+    assert room_store.room_for_code("ABC123") == "r1"
+
+    room_store.update("r1", {"game_state.hp": 2, "game_state.user_cards.u1": [4], "users": []})
+    room = room_store.load("r1")
+    assert room["game_state"] == {"hp": 2, "user_cards": {"u1": [4]}}
+    assert room["users"] == []
+    assert isinstance(room["createdAt"], datetime)
+
+    assert room_store.compare_and_set("r1", "status", "waiting", {"status": "playing"}) == (True, None)
+    applied, current = room_store.compare_and_set("r1", "status", "waiting", {"status": "ended"})
+    assert not applied and current["status"] == "playing"
+
+    room_store.delete("r1", "ABC123")
+    assert room_store.load("r1") is None
+    assert room_store.room_for_code("ABC123") is None
+    assert room_store.compare_and_set("r1", "status", "playing", {}) == (False, None)
+
+
+def test_users_round_trip(stores):
+    _, user_store = stores
+    assert user_store.create_user("u1", "neo", {"password": "hash"})
+    assert not user_store.create_user("u2", "neo", {"password": "hash"})
+    assert user_store.user_id_for_name("neo") == "u1"
+    assert user_store.get_user("u1")["password"] == "hash"
+    assert user_store.get_user("u2") is None
+    assert user_store.usernames(["u1", "u2"]) == {"u1": "neo", "u2": None}
+
+
+def test_registry_and_reaper_on_store(stores):
+    room_store, _ = stores
+    rooms = RoomRegistry(room_store, flush_delay=0)
+    codes = iter(["AAA111", "AAA111", "BBB222"])
+    first = rooms.create("r1", {"status": "ended"}, lambda: next(codes))
+    second = rooms.create("r2", {"status": "waiting"}, lambda: next(codes))
+    assert (first.get("code"), second.get("code")) == ("AAA111", "BBB222")
+
+    first.set("status", "playing")
+    rooms.save(first, "status")
+    rooms.flush()
+    assert RoomRegistry(room_store).find_by_code("AAA111").get("status") == "playing"
+
+    # pages of one room, only the playing room is past its ttl
+    reaper = RoomReaper(rooms, ttls={"waiting": 7200, "playing": 60}, batch_size=1)
+    assert reaper.reap(datetime.now(timezone.utc) + timedelta(seconds=120)) == 1
+    assert room_store.load("r1") is None and "r1" not in rooms.rooms
+    assert room_store.load("r2") is not None
@@ -0,0 +1,42 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.tracing import JsonLinesExporter, Tracer, flame_summary, load_traces
+
+
+def test_nested_spans_share_a_trace(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(sample_rate=1, exporter=JsonLinesExporter(path))
+
+    with tracer.span("socket card_chosen", room_id="r1"):
+        with tracer.span("firestore.get"):
+            pass
+        with pytest.raises(ValueError):
+            with tracer.span("gemini.generate"):
+                raise ValueError("quota")
+    tracer.flush()
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    root = next(span for span in spans if span["parent"] is None)
+    assert len(spans) == 3 and {span["trace"] for span in spans} == {root["trace"]}
+    assert root["attrs"] == {"room_id": "r1"}
+    assert next(span for span in spans if span["name"] == "gemini.generate")["error"] == "ValueError: quota"
+
+    summary = flame_summary(load_traces(path))
+    assert summary[("socket card_chosen", "firestore.get")][0] == 1
+
+
+def test_unsampled_traces_record_nothing(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(sample_rate=0.0000001, exporter=JsonLinesExporter(path))
+    for _ in range(100):
+        with tracer.span("http login_user"):
+            with tracer.span("firestore.get"):
+                pass
+    tracer.flush()
+    assert not path.exists()
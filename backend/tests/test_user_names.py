@@ -0,0 +1,122 @@
+import sys
+from pathlib import Path
+
+import pytest
+from google.api_core.exceptions import AlreadyExists
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.storage import FirestoreUserStore, username_key
+from services.user_names import UsernameIndex, UsernameTaken
+
+
+class FakeDoc:
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def get(self):
+        data = self.store.get(self.path)
+        snapshot = type("Snapshot", (), {})()
+        snapshot.exists = data is not None
+        snapshot.to_dict = lambda: dict(data)
+        return snapshot
+
+    def create(self, data):
+        if self.path in self.store:
+            raise AlreadyExists("exists")
+        self.store[self.path] = data
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+
+    def create(self, doc, data):
+        self.writes.append((doc.path, data, True))
+
+    def set(self, doc, data):
+        self.writes.append((doc.path, data, False))
+
+    def commit(self):
+        if any(must_create and path in self.store for path, _, must_create in self.writes):
+            raise AlreadyExists("exists")
+        for path, data, _ in self.writes:
+            self.store[path] = data
+
+
+class FakeQuery:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def limit(self, count):
+        return FakeQuery(self.docs[:count])
+
+    def stream(self):
+        return iter(self.docs)
+
+
+class FakeDB:
+    def __init__(self):
+        self.store = {}
+        self.reads = 0
+
+    def collection(self, name):
+        db = self
+
+        class Collection:
+            def document(self, doc_id):
+                db.reads += 1
+                return FakeDoc(db.store, f"{name}/{doc_id}")
+
+            def where(self, field, op, value):
+                docs = [
+                    FakeDoc(db.store, path) for path, data in db.store.items()
+                    if path.startswith(f"{name}/") and data.get(field) == value
+                ]
+                return FakeQuery(docs)
+
+        return Collection()
+
+    def batch(self):
+        return FakeBatch(self.store)
+
+
+def test_second_signup_for_a_name_is_rejected():
+    db = FakeDB()
+    first, second = UsernameIndex(FirestoreUserStore(db)), UsernameIndex(FirestoreUserStore(db))  # two workers
+    assert second.lookup("neo") is None
+
+    first.register("neo", "u1", {"username": "neo"})
+    with pytest.raises(UsernameTaken):
+        second.register("neo", "u2", {"username": "neo"})
+
+    assert second.lookup("neo") == "u1"
+    assert "users/u2" not in db.store
+
+
+def test_lookups_are_cached_and_keys_are_safe():
+    db = FakeDB()
+    index = UsernameIndex(FirestoreUserStore(db))
+    index.register("a/b", "u1", {"username": "a/b"})
+    reads = db.reads
+    assert index.lookup("a/b") == "u1"
+    assert db.reads == reads
+    assert "/" not in username_key("a/b")
+    assert username_key("..") not in (".", "..")
+    assert not username_key("__x__").startswith("__")
+
+
+def test_users_without_a_reservation_are_found_and_reserved():
+    db = FakeDB()
+    # signed up before the usernames index existed
+    db.store["users/u1"] = {"username": "trinity", "password": "hash"}
+    index = UsernameIndex(FirestoreUserStore(db))
+
+    assert index.lookup("trinity") == "u1"
+    assert db.store[f"usernames/{username_key('trinity')}"] == {"userId": "u1"}
+    with pytest.raises(UsernameTaken):
+        UsernameIndex(FirestoreUserStore(db)).register("trinity", "u2", {"username": "trinity"})
+    assert UsernameIndex(FirestoreUserStore(db)).lookup("morpheus") is None
@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.scenarios import meteor_for_round
+from services.wire_format import compact, pack, unpack
+
+
+def test_round_trip():
+    payload = {
+        "version": 12, "type": "ROUND_RESOLVED", "card": "EVACUATION", "correct": False,
+        "hp": 2, "round": 3, "meteor": meteor_for_round(7, 3),
+        "users": [{"id": "u1", "username": "player1", "card": "ROCKET"}],
+    }
+    assert unpack(pack(payload)) == payload
+
+
+def test_codes_scenario_meteors_and_leaves_others():
+    scenario = compact({"meteor": meteor_for_round(7, 0)})
+    assert isinstance(next(iter(scenario.values())), list)
+
+    ai_meteor = {"name": "Apophis", "mass": 6.1e10, "type": "STONY"}
+    assert unpack(pack({"meteor": ai_meteor})) == {"meteor": ai_meteor}
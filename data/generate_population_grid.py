@@ -0,0 +1,142 @@
+from pathlib import Path
+
+import numpy as np
+
+# Coarse world population density grid for the local casualty estimator.
+# Built from approximate populations of the largest urban areas plus broad
+# regional kernels for densely settled countryside. Oceans and remote land
+# stay at zero. Output: population_grid.npz with a uint16 people/km^2 grid.
+
+RESOLUTION = 0.25  # degrees per cell
+KM_PER_DEGREE = 111.32
+# next to this script, where services/impact_physics.py loads it from
+OUTPUT = Path(__file__).parent / "population_grid.npz"
+
+# name, latitude, longitude, population (millions)
+URBAN_AREAS = [
+    ("Tokyo", 35.68, 139.69, 37.1), ("Delhi", 28.61, 77.21, 33.8),
+    ("Shanghai", 31.23, 121.47, 29.9), ("Dhaka", 23.81, 90.41, 23.9),
+    ("Sao Paulo", -23.55, -46.63, 22.8), ("Cairo", 30.04, 31.24, 22.6),
+    ("Mexico City", 19.43, -99.13, 22.5), ("Beijing", 39.90, 116.40, 21.8),
+    ("Mumbai", 19.08, 72.88, 21.7), ("Osaka", 34.69, 135.50, 19.0),
+    ("Chongqing", 29.56, 106.55, 17.3), ("Karachi", 24.86, 67.01, 17.2),
+    ("Kinshasa", -4.44, 15.27, 17.0), ("Lagos", 6.52, 3.38, 16.0),
+    ("Istanbul", 41.01, 28.98, 15.8), ("Buenos Aires", -34.60, -58.38, 15.5),
+    ("Kolkata", 22.57, 88.36, 15.3), ("Manila", 14.60, 120.98, 14.7),
+    ("Guangzhou", 23.13, 113.26, 14.3), ("Tianjin", 39.34, 117.36, 14.0),
+    ("Lahore", 31.55, 74.34, 13.9), ("Bangalore", 12.97, 77.59, 13.6),
+    ("Rio de Janeiro", -22.91, -43.17, 13.7), ("Shenzhen", 22.54, 114.06, 13.1),
+    ("Moscow", 55.76, 37.62, 12.7), ("Chennai", 13.08, 80.27, 11.8),
+    ("Bogota", 4.71, -74.07, 11.5), ("Jakarta", -6.21, 106.85, 11.2),
+    ("Lima", -12.05, -77.04, 11.2), ("Paris", 48.86, 2.35, 11.2),
+    ("Bangkok", 13.76, 100.50, 11.1), ("Hyderabad", 17.39, 78.49, 10.8),
+    ("Seoul", 37.57, 126.98, 10.0), ("Nagoya", 35.18, 136.91, 9.5),
+    ("London", 51.51, -0.13, 9.6), ("Chengdu", 30.57, 104.07, 9.5),
+    ("Tehran", 35.69, 51.39, 9.5), ("Ho Chi Minh City", 10.82, 106.63, 9.3),
+    ("Luanda", -8.84, 13.23, 9.3), ("Nanjing", 32.06, 118.80, 9.4),
+    ("Wuhan", 30.59, 114.31, 8.9), ("New York", 40.71, -74.01, 8.9),
+    ("Xi'an", 34.34, 108.94, 8.6), ("Ahmedabad", 23.02, 72.57, 8.6),
+    ("Kuala Lumpur", 3.14, 101.69, 8.6), ("Hangzhou", 30.27, 120.16, 8.2),
+    ("Hong Kong", 22.32, 114.17, 7.6), ("Dongguan", 23.02, 113.75, 7.5),
+    ("Foshan", 23.02, 113.12, 7.5), ("Riyadh", 24.71, 46.68, 7.7),
+    ("Baghdad", 33.31, 44.37, 7.5), ("Santiago", -33.45, -70.67, 6.9),
+    ("Surat", 21.17, 72.83, 7.8), ("Madrid", 40.42, -3.70, 6.8),
+    ("Pune", 18.52, 73.86, 7.2), ("Toronto", 43.65, -79.38, 6.4),
+    ("Los Angeles", 34.05, -118.24, 12.5), ("Chicago", 41.88, -87.63, 8.9),
+    ("Houston", 29.76, -95.37, 7.1), ("Dallas", 32.78, -96.80, 7.6),
+    ("Miami", 25.76, -80.19, 6.1), ("Philadelphia", 39.95, -75.17, 6.2),
+    ("Atlanta", 33.75, -84.39, 6.1), ("Washington", 38.91, -77.04, 6.3),
+    ("Boston", 42.36, -71.06, 4.9), ("San Francisco", 37.77, -122.42, 4.7),
+    ("Khartoum", 15.50, 32.56, 6.2), ("Dar es Salaam", -6.79, 39.21, 7.4),
+    ("Johannesburg", -26.20, 28.05, 6.2), ("Nairobi", -1.29, 36.82, 5.3),
+    ("Addis Ababa", 9.03, 38.74, 5.5), ("Abidjan", 5.36, -4.01, 5.6),
+    ("Alexandria", 31.20, 29.92, 5.6), ("Singapore", 1.35, 103.82, 6.0),
+    ("Yangon", 16.87, 96.20, 5.6), ("Sydney", -33.87, 151.21, 5.3),
+    ("Melbourne", -37.81, 144.96, 5.1), ("Berlin", 52.52, 13.40, 4.6),
+    ("Rome", 41.90, 12.50, 4.3), ("Milan", 45.46, 9.19, 4.3),
+    ("Barcelona", 41.39, 2.17, 5.6), ("Saint Petersburg", 59.93, 30.34, 5.5),
+    ("Ruhr", 51.46, 7.01, 5.1), ("Kyiv", 50.45, 30.52, 3.0),
+    ("Ankara", 39.93, 32.86, 5.3), ("Casablanca", 33.57, -7.59, 4.0),
+    ("Accra", 5.60, -0.19, 2.6), ("Kano", 12.00, 8.52, 4.1),
+    ("Taipei", 25.03, 121.57, 7.0), ("Busan", 35.18, 129.08, 3.4),
+    ("Kabul", 34.56, 69.21, 4.6), ("Jeddah", 21.49, 39.19, 4.7),
+    ("Belo Horizonte", -19.92, -43.94, 6.1), ("Brasilia", -15.79, -47.88, 4.8),
+    ("Guadalajara", 20.66, -103.35, 5.3), ("Monterrey", 25.69, -100.32, 5.1),
+    ("Caracas", 10.48, -66.90, 3.0), ("Havana", 23.11, -82.37, 2.1),
+]
+
+# broad rural populations: latitude, longitude, people/km^2 at the centre, sigma in km
+REGIONS = [
+    (26.0, 83.0, 900, 450),    # Ganges plain
+    (23.5, 90.0, 1000, 200),   # Bengal delta
+    (33.0, 116.0, 650, 450),   # North China plain
+    (30.0, 113.0, 450, 400),   # Yangtze basin
+    (23.5, 113.0, 550, 250),   # Pearl river delta
+    (30.5, 104.0, 500, 200),   # Sichuan basin
+    (-7.3, 110.0, 900, 250),   # Java
+    (36.0, 138.0, 350, 300),   # Honshu
+    (36.5, 127.8, 450, 150),   # Korea
+    (15.0, 77.0, 350, 550),    # Deccan
+    (30.0, 73.0, 400, 300),    # Punjab
+    (50.5, 8.0, 230, 550),     # Central Europe
+    (45.5, 10.5, 200, 250),    # Po valley
+    (52.5, 20.0, 120, 400),    # Poland
+    (52.5, -1.5, 270, 220),    # England
+    (28.5, 31.0, 1200, 120),   # Nile valley
+    (8.0, 5.5, 250, 450),      # Southern Nigeria
+    (0.5, 32.0, 200, 300),     # Lake Victoria
+    (9.0, 39.0, 120, 400),     # Ethiopian highlands
+    (40.0, -77.0, 120, 450),   # US Northeast
+    (36.0, -88.0, 50, 800),    # US East
+    (19.5, -99.0, 180, 250),   # Central Mexico
+    (-22.5, -45.5, 100, 400),  # Southeast Brazil
+    (13.0, 122.0, 300, 400),   # Philippines
+    (16.0, 106.0, 250, 450),   # Vietnam, Thailand
+    (15.0, 44.0, 50, 400),     # Yemen
+    (54.0, 40.0, 40, 700),     # European Russia
+]
+
+
+def gaussian_into(grid, lats, lons, lat, lon, peak, sigma_km):
+    # add peak * exp(-d^2 / 2 sigma^2) around (lat, lon), cut off at 3 sigma
+    reach = 3 * sigma_km / KM_PER_DEGREE
+    lat_mask = np.abs(lats - lat) <= reach
+    lon_reach = reach / max(np.cos(np.radians(lat)), 0.05)
+    lon_delta = (lons - lon + 180) % 360 - 180
+    lon_mask = np.abs(lon_delta) <= lon_reach
+    if not lat_mask.any() or not lon_mask.any():
+        return
+
+    dy = (lats[lat_mask] - lat)[:, None] * KM_PER_DEGREE
+    dx = lon_delta[lon_mask][None, :] * KM_PER_DEGREE * np.cos(np.radians(lat))
+    window = peak * np.exp(-(dx ** 2 + dy ** 2) / (2 * sigma_km ** 2))
+    grid[np.ix_(lat_mask, lon_mask)] += window
+
+
+def build_grid():
+    lats = np.arange(-90 + RESOLUTION / 2, 90, RESOLUTION)
+    lons = np.arange(-180 + RESOLUTION / 2, 180, RESOLUTION)
+    grid = np.zeros((lats.size, lons.size), dtype=np.float64)
+
+    for lat, lon, peak, sigma_km in REGIONS:
+        gaussian_into(grid, lats, lons, lat, lon, peak, sigma_km)
+
+    for _, lat, lon, millions in URBAN_AREAS:
+        # a metro area of P people spread as a gaussian: P = peak * 2 pi sigma^2
+        sigma_km = 4 + 3.5 * np.sqrt(millions)
+        peak = millions * 1e6 / (2 * np.pi * sigma_km ** 2)
+        gaussian_into(grid, lats, lons, lat, lon, peak, sigma_km)
+
+    grid[grid < 1] = 0
+    return np.clip(np.rint(grid), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+
+
+if __name__ == "__main__":
+    grid = build_grid()
+    np.savez_compressed(OUTPUT, density=grid, resolution=RESOLUTION)
+
+    cell_km2 = (RESOLUTION * KM_PER_DEGREE) ** 2 * np.cos(
+        np.radians(np.arange(-90 + RESOLUTION / 2, 90, RESOLUTION))
+    )[:, None]
+    total = (grid * cell_km2).sum()
+    print(f"{OUTPUT}: {grid.shape[0]}x{grid.shape[1]} cells, ~{total / 1e9:.2f} billion people")
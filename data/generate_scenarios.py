@@ -1,111 +1,197 @@
-def in_ranges(val, ranges_list):
-    for start, end in ranges_list:
-        if start <= val <= end:
-            return True
-    return False
-
-group1_ranges = [
-    (1,3), (10,12), (25,27), (34,36), (49,51), (58,60),
-    (73,75), (82,84), (97,99), (106,108), (121,123), (130,132),
-    (145,147), (154,156), (169,171), (178,180), (193,195), (202,204),
-    (217,219), (226,228), (241,243), (250,252), (265,267), (274,276),
-    (289,291), (298,300), (313,315), (322,324), (337,339), (346,348)
-]
-group2_ranges = [
-    (4,6), (13,15), (19,21), (28,30), (37,39), (43,45),
-    (52,54), (61,63), (67,69), (76,78), (85,87), (91,93),
-    (100,102), (109,111), (115,117), (124,126), (133,135), (139,141),
-    (148,150), (157,159), (163,165), (172,174), (181,183), (187,189),
-    (196,198), (205,207), (211,213), (220,222), (229,231), (235,237),
-    (244,246), (253,255), (259,261), (268,270), (277,279), (283,285),
-    (292,294), (301,303), (307,309), (316,318), (325,327), (331,333),
-    (340,342), (349,351), (355,357)
-]
-group3_ranges = [
-    (7,9), (16,18), (22,24), (31,33), (40,42), (46,48),
-    (55,57), (64,66), (70,72), (79,81), (88,90), (94,96),
-    (103,105), (112,114), (118,120), (127,129), (136,138), (142,144),
-    (151,153), (160,162), (166,168), (175,177), (184,186), (190,192),
-    (199,201), (208,210), (214,216), (223,225), (232,234), (238,240),
-    (247,249), (256,258), (262,264), (271,273), (280,282), (286,288),
-    (295,297), (304,306), (310,312), (319,321), (328,330), (334,336),
-    (343,345), (352,354), (358,360)
-]
-
-with open('def_4_scenarios.csv', 'w') as f:
-    f.write("generated_scenario;speed (km/s);composition;distance (km);weight (g);angle (degrees)\n")
-    
-    counter = 1
-    for generated_scenario in range(1, 361):
-        block = ((generated_scenario - 1) // 120) + 1
-        if block == 1:
-            lower_speed = 10
-            upper_speed = 30
-        elif block == 2:
-            lower_speed = 31
-            upper_speed = 50
-        else:
-            lower_speed = 51
-            upper_speed = 70
-        speeds = [lower_speed]
-
-        local120 = ((generated_scenario - 1) % 120) + 1
-        if 1 <= local120 <= 24:
-            composition = "ICE"
-        elif 25 <= local120 <= 48:
-            composition = "ICE_STONE"
-        elif 49 <= local120 <= 72:
-            composition = "STONE"
-        elif 73 <= local120 <= 96:
-            composition = "STONE_IRON"
-        else:
-            composition = "IRON"
-
-        local24 = ((generated_scenario - 1) % 24) + 1
-        if 1 <= local24 <= 9:
-            lower_dist = 20
-            upper_dist = 1000
-        elif 10 <= local24 <= 18:
-            lower_dist = 1001
-            upper_dist = 4000
-        else:
-            lower_dist = 100000000
-            upper_dist = 300000000
-        mid_dist = (lower_dist + upper_dist) // 2
-        dists = [lower_dist, mid_dist, upper_dist]
-
-        if in_ranges(generated_scenario, group1_ranges):
-            lower_weight = 1
-            upper_weight = 20000
-        elif in_ranges(generated_scenario, group2_ranges):
-            lower_weight = 20001
-            upper_weight = 40000
-        else:
-            lower_weight = 40001
-            upper_weight = 60000
-        mid_weight = (lower_weight + upper_weight) // 2
-        weights = [lower_weight, mid_weight, upper_weight]
-
-        local3 = generated_scenario % 3
-        if local3 == 0:  
-            local3 = 3
-        if local3 == 1:
-            lower_angle = 1
-            upper_angle = 30
-        elif local3 == 2:
-            lower_angle = 31
-            upper_angle = 60
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from services.scenarios import SCENARIO_COUNT, SCENARIO_TABLE, COMPOSITIONS
+from services.scenario_dataset import COLUMNS, layout
+
+# Canonical scenario grid: for each of the 360 scenarios, every combination
+# of `resolution` values per axis inside the scenario's bands. The default
+# resolutions reproduce scenarios.csv. Rows are built a chunk at a time
+# with NumPy, optionally on a process pool, and streamed to a CSV or to the
+# columnar .bin file backend/services/scenario_dataset.py memory-maps.
+#
+#   python generate_scenarios.py                         # scenarios.csv
+#   python generate_scenarios.py -o grid.bin --speed 20 --distance 40:log --weight 20 --angle 30
+
+AXES = ("speed", "distance", "weight", "angle")
+DEFAULT_GRID = {"speed": "1", "distance": "3", "weight": "3", "angle": "3"}
+CSV_HEADER = "generated_scenario;speed (km/s);composition;distance (km);weight (g);angle (degrees)\n"
+
+
+def linear_grid(low, high, count):
+    # low, evenly spaced integers, high; only low for a single value
+    if count == 1:
+        return low[:, None]
+    steps = np.arange(count)
+    return low[:, None] + (high - low)[:, None] * steps // (count - 1)
+
+
+def log_grid(low, high, count):
+    if count == 1:
+        return low[:, None]
+    exponents = np.linspace(0, 1, count)
+    values = np.rint(low[:, None] * (high / low)[:, None] ** exponents).astype(np.int64)
+    return np.clip(values, low[:, None], high[:, None])
+
+
+GRIDS = {"linear": linear_grid, "log": log_grid}
+
+
+def parse_grid(spec):
+    # "5" or "5:log"
+    count, _, kind = spec.partition(":")
+    kind = kind or "linear"
+    if not count.isdigit() or int(count) < 1:
+        raise argparse.ArgumentTypeError(f"resolution must be a positive integer: {spec}")
+    if kind not in GRIDS:
+        raise argparse.ArgumentTypeError(f"unknown grid {kind}, expected one of {', '.join(GRIDS)}")
+    return int(count), kind
+
+
+def axis_values(grid):
+    # {axis: (SCENARIO_COUNT + 1, resolution) array of values}, row 0 unused
+    values = {}
+    for axis in AXES:
+        count, kind = grid[axis]
+        bands = np.array([(1, 1)] + [getattr(row, axis) for row in SCENARIO_TABLE[1:]], dtype=np.int64)
+        values[axis] = GRIDS[kind](bands[:, 0], bands[:, 1], count)
+    return values
+
+
+COMPOSITION_CODES = np.array(
+    [0] + [COMPOSITIONS.index(row.composition) for row in SCENARIO_TABLE[1:]], dtype=np.uint8
+)
+
+
+def build_chunk(values, start, stop):
+    # columns of rows start..stop-1; rows go scenario, speed, distance, weight, angle
+    shape = tuple(values[axis].shape[1] for axis in AXES)
+    rows = np.arange(start, stop, dtype=np.int64)
+    scenario_ids, within = np.divmod(rows, int(np.prod(shape)))
+    scenario_ids += 1
+
+    columns = {"composition": COMPOSITION_CODES[scenario_ids]}
+    for axis, index in zip(AXES, np.unravel_index(within, shape)):
+        columns[axis] = values[axis][scenario_ids, index]
+    return columns
+
+
+def format_csv(columns, start):
+    names = np.array(COMPOSITIONS)[columns["composition"]].tolist()
+    lines = zip(
+        range(start + 1, start + 1 + len(names)), columns["speed"].tolist(), names,
+        columns["distance"].tolist(), columns["weight"].tolist(), columns["angle"].tolist(),
+    )
+    return "".join(f"{n};{s};{c};{d};{w};{a}\n" for n, s, c, d, w, a in lines).encode()
+
+
+def render_chunk(values, start, stop, fmt):
+    columns = build_chunk(values, start, stop)
+    if fmt == "csv":
+        return format_csv(columns, start)
+    return {name: columns[name].astype(dtype) for name, dtype in COLUMNS}
+
+
+class CsvWriter:
+    def __init__(self, f, rows):
+        self.f = f
+        f.write(CSV_HEADER.encode())
+
+    def write(self, start, chunk):
+        self.f.write(chunk)
+
+    def close(self):
+        pass
+
+
+class BinaryWriter:
+    # columns are preallocated, each chunk is written into place
+    def __init__(self, f, rows):
+        self.f = f
+        self.rows = rows
+        header, self.placement = layout(rows)
+        f.write(header)
+        dtype, offset, length = self.placement["offsets"]
+        f.truncate(offset + length * np.dtype(dtype).itemsize)
+
+    def write(self, start, chunk):
+        for name, values in chunk.items():
+            self.f.seek(self.placement[name][1] + start * values.itemsize)
+            self.f.write(values.tobytes())
+
+    def close(self):
+        per_scenario = self.rows // SCENARIO_COUNT
+        offsets = np.concatenate(([0], np.arange(SCENARIO_COUNT + 1) * per_scenario)).astype(np.uint32)
+        self.f.seek(self.placement["offsets"][1])
+        self.f.write(offsets.tobytes())
+
+
+WRITERS = {"csv": CsvWriter, "bin": BinaryWriter}
+
+
+def chunks(rows, chunk_size):
+    for start in range(0, rows, chunk_size):
+        yield start, min(start + chunk_size, rows)
+
+
+def generate(out_path, grid, fmt, chunk_size, workers):
+    values = axis_values(grid)
+    rows = SCENARIO_COUNT * int(np.prod([values[axis].shape[1] for axis in AXES]))
+    if fmt == "bin" and rows >= 2**32:
+        raise ValueError(f"{rows} rows do not fit the uint32 block index")
+
+    # written next to the target and renamed, so a failed run leaves no half file
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        writer = WRITERS[fmt](f, rows)
+        if workers <= 1:
+            for start, stop in chunks(rows, chunk_size):
+                writer.write(start, render_chunk(values, start, stop, fmt))
         else:
-            lower_angle = 61
-            upper_angle = 90
-        mid_angle = (lower_angle + upper_angle) // 2
-        angles = [lower_angle, mid_angle, upper_angle]
-
-        for s_val in speeds:
-            for d_val in dists:
-                for w_val in weights:
-                    for a_val in angles:
-                        f.write(f"{counter};{s_val};{composition};{d_val};{w_val};{a_val}\n")
-                        counter += 1
-
-print("CSV файл 'def_4_scenarios.csv' згенеровано! Всього записів:", counter - 1)
\ No newline at end of file
+            # at most 2 chunks per worker in flight, so memory stays bounded
+            with ProcessPoolExecutor(workers) as pool:
+                pending = deque()
+                for start, stop in chunks(rows, chunk_size):
+                    pending.append((start, pool.submit(render_chunk, values, start, stop, fmt)))
+                    if len(pending) >= 2 * workers:
+                        start, future = pending.popleft()
+                        writer.write(start, future.result())
+                while pending:
+                    start, future = pending.popleft()
+                    writer.write(start, future.result())
+        writer.close()
+    os.replace(tmp_path, out_path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the canonical scenario grid")
+    parser.add_argument("-o", "--output", default=str(Path(__file__).parent / "scenarios.csv"))
+    parser.add_argument("--format", choices=sorted(WRITERS), help="default: from the output extension")
+    for axis in AXES:
+        parser.add_argument(f"--{axis}", type=parse_grid, default=parse_grid(DEFAULT_GRID[axis]),
+                            help=f"values per scenario, optionally :log (default {DEFAULT_GRID[axis]})")
+    parser.add_argument("--chunk-size", type=int, default=500000, help="rows per chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    fmt = args.format or ("bin" if args.output.endswith(".bin") else "csv")
+    grid = {axis: getattr(args, axis) for axis in AXES}
+
+    began = time.monotonic()
+    rows = generate(args.output, grid, fmt, args.chunk_size, args.workers)
+    elapsed = time.monotonic() - began
+    print(f"{args.output}: {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,8 @@ export enum eSocketEvent {
     ROOM_CLOSED = "room_closed",
     ROOM_CREATED = "room_created",
     CLOSE_ROOM = "close_room",
+    ROOM_SNAPSHOT = "room_snapshot",
+    ROOM_RESYNC = "room_resync",
 
     //GAME
     START_GAME = "start_game",
@@ -36,15 +38,14 @@ export enum eSocketEvent {
 
 export const eGameSocketEvent = {
     ON: {
-        GAME_READY: "game_ready",
-        GAME_WAIT_ROOM: "game_wait_room",
-        GAME_JOINED_WAITING: "game_joined_waiting",
-        ROUND_RESULT: "round_result",
-        GAME_ENDED: "game_ended",
+        ROOM_SNAPSHOT: "room_snapshot",
+        ROOM_DELTA: "room_delta",
+        ROUND_REJECTED: "round_rejected",
     },
     EMIT: {
         JOIN_GAME: "join_game",
         CARD_CHOSEN: "card_chosen",
+        ROOM_RESYNC: "room_resync",
     }
 }
 
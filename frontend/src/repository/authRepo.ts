@@ -60,6 +60,20 @@ const authRepo = {
             console.error(error);
             return null;
         }
+    },
+
+    async logout(): Promise<boolean> {
+        try {
+            const res = await fetch(`${BACK_PATH_API}/logout`, {
+                method: "POST",
+                credentials: "include",
+            })
+
+            return res.ok;
+        } catch (error) {
+            console.error(error);
+            return false;
+        }
     }
 };
 
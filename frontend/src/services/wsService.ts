@@ -13,6 +13,9 @@ export const useSocketStore = defineStore("socket", {
             if (!this.socket) {
                 this.socket = io(BACK_PATH_WS, {
                     withCredentials: true,
+                    // websocket first: a single connection needs no sticky
+                    // sessions when the backend runs several workers
+                    transports: ["websocket", "polling"],
                     reconnection: true,
                     reconnectionAttempts: 5,
                     reconnectionDelay: 1000,